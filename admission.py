@@ -0,0 +1,205 @@
+"""Admission control for the expensive endpoints.
+
+Each process lets at most max_in_flight guarded requests run at once (0 for
+no per-process cap); up to max_waiting more wait, for at most max_wait
+seconds, for one of them to finish, and anything beyond that is shed straight
+away with 503 and Retry-After. Keeping max_in_flight below the number of threads a worker
+serves (gunicorn --threads) leaves threads free for the cheap pages, so they
+stay responsive while uploads queue.
+
+A RedisAdmission additionally caps guarded requests across every process and
+container. Each admitted request holds a lease in a sorted set, scored by its
+expiry so leases left behind by a killed worker lapse on their own. Leases
+are short and renewed by a background thread while their request runs, as
+single_flight.py does, so a slow upload keeps its slot and a dead worker's
+slot frees within one lease period. A request that finds the cluster full
+waits in the same bounded queue, polling for a free slot, before it is shed.
+Redis being unavailable admits rather than failing the request, as the
+upstream budget does.
+"""
+import functools
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import redis
+from flask import request
+
+import telemetry
+
+
+class Overloaded(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Server busy ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RedisAdmission:
+    def __init__(self, redis_client, limit, lease=30, key="digiform:admission", poll_interval=0.25):
+        self.redis = redis_client
+        self.limit = limit
+        self.lease = lease
+        self.key = key
+        self.poll_interval = poll_interval
+        # Leases held by this process' requests, renewed until released
+        self.held = set()
+        self.renewer_pid = None
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        # Returns a lease token, None when the cluster is full, or "" when Redis
+        # could not be asked
+        token = uuid.uuid4().hex
+        now = time.time()
+        try:
+            pipe = self.redis.pipeline()
+            pipe.zremrangebyscore(self.key, "-inf", now)
+            pipe.zadd(self.key, {token: now + self.lease})
+            pipe.zcard(self.key)
+            pipe.pexpire(self.key, int(self.lease * 1000))
+            _, _, held, _ = pipe.execute()
+            # Renewals reorder the set, so count rather than rank: two requests
+            # racing for the last slot may both back off, never both get in
+            if held > self.limit:
+                self.redis.zrem(self.key, token)
+                return None
+        except redis.RedisError:
+            return ""
+        with self.lock:
+            if self.renewer_pid != os.getpid():
+                # First lease in this process, or in a forked child, whose
+                # copy of held belongs to the parent
+                self.held = set()
+                self.renewer_pid = os.getpid()
+                threading.Thread(target=self._renew_forever, name="admission-renewer", daemon=True).start()
+            self.held.add(token)
+        return token
+
+    def release(self, token):
+        if not token:
+            return
+        with self.lock:
+            self.held.discard(token)
+        try:
+            self.redis.zrem(self.key, token)
+        except redis.RedisError:
+            pass
+
+    def _renew_forever(self):
+        while True:
+            time.sleep(self.lease / 3)
+            with self.lock:
+                held = list(self.held)
+            if not held:
+                continue
+            try:
+                # XX: a lease that already lapsed is not brought back over the cap
+                pipe = self.redis.pipeline()
+                pipe.zadd(self.key, dict.fromkeys(held, time.time() + self.lease), xx=True)
+                pipe.pexpire(self.key, int(self.lease * 1000))
+                pipe.execute()
+            except redis.RedisError:
+                pass
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight, max_waiting=0, max_wait=5.0, cluster=None, retry_after=10):
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.max_wait = max_wait
+        self.cluster = cluster
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.waiting = 0
+        self.condition = threading.Condition()
+
+    def _shed(self, reason):
+        telemetry.record_shed(reason)
+        return Overloaded(reason, self.retry_after)
+
+    def _enter(self):
+        with self.condition:
+            if self.in_flight >= self.max_in_flight:
+                if self.waiting >= self.max_waiting:
+                    raise self._shed("queue_full")
+                self.waiting += 1
+                telemetry.ADMISSION_WAITING.inc()
+                deadline = time.monotonic() + self.max_wait
+                try:
+                    while self.in_flight >= self.max_in_flight:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise self._shed("queue_timeout")
+                        self.condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+                    telemetry.ADMISSION_WAITING.dec()
+            self.in_flight += 1
+            telemetry.ADMISSION_IN_FLIGHT.inc()
+
+    def _leave(self):
+        with self.condition:
+            self.in_flight -= 1
+            telemetry.ADMISSION_IN_FLIGHT.dec()
+            self.condition.notify()
+
+    def _enter_cluster(self, deadline):
+        # Lease from the cluster, waiting as one of max_waiting while it is full
+        token = self.cluster.acquire()
+        if token is not None:
+            return token
+        with self.condition:
+            if self.waiting >= self.max_waiting:
+                raise self._shed("cluster_limit")
+            self.waiting += 1
+            telemetry.ADMISSION_WAITING.inc()
+        try:
+            while token is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise self._shed("cluster_limit")
+                # Other processes' releases are not signalled, so poll with jitter
+                time.sleep(min(remaining, random.uniform(0.5, 1.5) * self.cluster.poll_interval))
+                token = self.cluster.acquire()
+            return token
+        finally:
+            with self.condition:
+                self.waiting -= 1
+                telemetry.ADMISSION_WAITING.dec()
+
+    @contextmanager
+    def admit(self):
+        # Raises Overloaded when the request has to be shed. The process and
+        # cluster waits share one max_wait; a request keeps its process slot
+        # while it waits for the cluster.
+        deadline = time.monotonic() + self.max_wait
+        if self.max_in_flight:
+            with telemetry.stage("admission_wait"):
+                self._enter()
+        token = None
+        try:
+            if self.cluster is not None:
+                with telemetry.stage("admission_wait"):
+                    token = self._enter_cluster(deadline)
+            yield
+        finally:
+            if self.cluster is not None:
+                self.cluster.release(token)
+            if self.max_in_flight:
+                self._leave()
+
+    def guard(self, methods=("POST",)):
+        # Decorator admitting requests to a view; other methods pass straight through
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method not in methods:
+                    return view(*args, **kwargs)
+                with self.admit():
+                    return view(*args, **kwargs)
+            return wrapper
+        return decorator
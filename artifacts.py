@@ -0,0 +1,94 @@
+"""Content-addressed storage for generated PDFs.
+
+A PDF is stored once under the SHA-256 of its bytes, which doubles as the
+opaque id handed to the browser and as the ETag of the GET endpoint serving
+it. Entries expire after a TTL; storing the same PDF again refreshes it.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import time
+from io import BytesIO
+
+ARTIFACT_ID = re.compile(r"^[0-9a-f]{64}$")
+
+
+def artifact_id_for(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class RedisArtifactStore:
+    def __init__(self, redis_client, ttl, prefix="digiform:artifact"):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def put(self, data):
+        artifact_id = artifact_id_for(data)
+        self.redis.set(f"{self.prefix}:{artifact_id}", data, ex=self.ttl)
+        return artifact_id
+
+    def get(self, artifact_id):
+        # Returns something send_file can serve (here an in-memory file), or
+        # None if the artifact does not exist or has expired
+        if not ARTIFACT_ID.match(artifact_id):
+            return None
+        data = self.redis.get(f"{self.prefix}:{artifact_id}")
+        return BytesIO(data) if data is not None else None
+
+
+class DiskArtifactStore:
+    """Artifacts as files in a directory shared by the web and worker processes.
+
+    Expiry is by file age; expired files are removed lazily, at most once a
+    minute, when new artifacts are written.
+    """
+
+    def __init__(self, directory, ttl, sweep_interval=60):
+        self.directory = directory
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.last_sweep = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, artifact_id):
+        return os.path.join(self.directory, f"{artifact_id}.pdf")
+
+    def put(self, data):
+        artifact_id = artifact_id_for(data)
+        path = self._path(artifact_id)
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            # Write to a temporary name first so readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, path)
+        self._sweep()
+        return artifact_id
+
+    def get(self, artifact_id):
+        # Returns the file path, so send_file knows the size for Range requests
+        if not ARTIFACT_ID.match(artifact_id):
+            return None
+        path = self._path(artifact_id)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+        except FileNotFoundError:
+            return None
+        return path
+
+    def _sweep(self):
+        now = time.time()
+        if now - self.last_sweep < self.sweep_interval:
+            return
+        self.last_sweep = now
+        for entry in os.scandir(self.directory):
+            try:
+                if now - entry.stat().st_mtime > self.ttl:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,63 @@
+"""A per-process asyncio event loop on a background thread.
+
+Synchronous Flask views and job handlers hand coroutines to the loop with
+run() and block only their own thread while the loop multiplexes every
+pending model call in the process. The loop is started on first use, and
+started afresh in a forked child (a gunicorn worker), where the parent's
+thread does not exist.
+
+Coroutines run in a copy of the caller's context, so request traces and
+other context variables carry over as they do for extraction threads.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class BackgroundLoop:
+    def __init__(self, name="event-loop", threads=32):
+        self.name = name
+        # Size of the loop's default executor, used by asyncio.to_thread for blocking calls
+        self.threads = threads
+        self.loop = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def _running_loop(self):
+        with self.lock:
+            if self.loop is None or self.pid != os.getpid():
+                self.loop = asyncio.new_event_loop()
+                self.loop.set_default_executor(
+                    ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix=f"{self.name}-blocking")
+                )
+                self.pid = os.getpid()
+                threading.Thread(target=self.loop.run_forever, name=self.name, daemon=True).start()
+            return self.loop
+
+    def submit(self, coroutine):
+        # Schedules the coroutine and returns a concurrent.futures.Future for its result
+        loop = self._running_loop()
+        context = contextvars.copy_context()
+        future = Future()
+
+        def copy_result(task):
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+
+        def start():
+            if future.set_running_or_notify_cancel():
+                loop.create_task(coroutine, context=context).add_done_callback(copy_result)
+            else:
+                coroutine.close()
+
+        loop.call_soon_threadsafe(start)
+        return future
+
+    def run(self, coroutine, timeout=None):
+        return self.submit(coroutine).result(timeout)
@@ -0,0 +1,145 @@
+"""Batch API backend for non-interactive extraction.
+
+Instead of one synchronous chat completion per document, requests are written
+to JSONL files, uploaded, and submitted as batches against
+/v1/chat/completions. Every request carries a custom_id (the extraction cache
+key), which is how results are matched back to documents. Submitted batch ids
+are recorded in a state file so an interrupted run resumes polling the
+batches it already paid for instead of submitting them again.
+"""
+import json
+import os
+import tempfile
+import time
+
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+# Limits of a single batch input file
+MAX_BATCH_REQUESTS = 50000
+MAX_BATCH_BYTES = 190 * 1024 * 1024
+
+
+class BatchRequestError(Exception):
+    pass
+
+
+class BatchExtractionBackend:
+    def __init__(self, client, state_path=None, poll_interval=30, completion_window="24h"):
+        self.client = client
+        self.state_path = state_path
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self.state = self._load_state()
+
+    def _load_state(self):
+        if self.state_path and os.path.exists(self.state_path):
+            with open(self.state_path) as state_file:
+                return json.load(state_file)
+        return {"batches": {}}
+
+    def _save_state(self):
+        if not self.state_path:
+            return
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as state_file:
+            json.dump(self.state, state_file)
+        os.replace(tmp_path, self.state_path)
+
+    def _submit_file(self, path, custom_ids):
+        with open(path, "rb") as batch_file:
+            input_file = self.client.files.create(file=batch_file, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=self.completion_window,
+        )
+        self.state["batches"][batch.id] = {"custom_ids": custom_ids, "collected": False}
+        self._save_state()
+        return batch.id
+
+    def submit(self, requests):
+        # requests: iterable of (custom_id, chat-completions body). Bodies are
+        # streamed to disk so image payloads are not all held in memory.
+        batch_ids = []
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path, batch_file, custom_ids, size = None, None, [], 0
+            for custom_id, body in requests:
+                line = json.dumps(
+                    {"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body},
+                    separators=(",", ":"),
+                ).encode() + b"\n"
+                if batch_file and (len(custom_ids) >= MAX_BATCH_REQUESTS or size + len(line) > MAX_BATCH_BYTES):
+                    batch_file.close()
+                    batch_ids.append(self._submit_file(path, custom_ids))
+                    batch_file = None
+                if batch_file is None:
+                    path = os.path.join(tmp_dir, f"batch-{len(batch_ids)}.jsonl")
+                    batch_file, custom_ids, size = open(path, "wb"), [], 0
+                batch_file.write(line)
+                custom_ids.append(custom_id)
+                size += len(line)
+            if batch_file:
+                batch_file.close()
+                batch_ids.append(self._submit_file(path, custom_ids))
+        return batch_ids
+
+    def wait(self, batch_ids):
+        batches = {}
+        pending = list(batch_ids)
+        while pending:
+            for batch_id in list(pending):
+                batch = self.client.batches.retrieve(batch_id)
+                if batch.status in TERMINAL_STATUSES:
+                    batches[batch_id] = batch
+                    pending.remove(batch_id)
+            if pending:
+                time.sleep(self.poll_interval)
+        return batches
+
+    def _read_file(self, file_id):
+        if not file_id:
+            return []
+        content = self.client.files.content(file_id).content
+        return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+    def collect(self, batch):
+        # {custom_id: extracted JSON, or a BatchRequestError} for every request in the batch
+        results = {}
+        for record in self._read_file(batch.output_file_id) + self._read_file(batch.error_file_id):
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                error = record.get("error") or response.get("body", {}).get("error") or {}
+                results[record["custom_id"]] = BatchRequestError(error.get("message", "Batch request failed"))
+                continue
+            try:
+                content = response["body"]["choices"][0]["message"]["content"]
+                results[record["custom_id"]] = json.loads(content)
+            except (KeyError, IndexError, json.JSONDecodeError) as e:
+                results[record["custom_id"]] = BatchRequestError(f"Malformed batch response: {e}")
+        for custom_id in self.state["batches"][batch.id]["custom_ids"]:
+            results.setdefault(
+                custom_id, BatchRequestError(f"Batch {batch.status} before this document was processed")
+            )
+        self.state["batches"][batch.id]["collected"] = True
+        self._save_state()
+        return results
+
+    def extract_many(self, requests):
+        # requests: {custom_id: body, or a callable returning the body}. Ids
+        # already in an uncollected batch from an earlier run are not resubmitted.
+        tracked = {
+            batch_id: batch
+            for batch_id, batch in self.state["batches"].items()
+            if not batch["collected"] and set(batch["custom_ids"]) & requests.keys()
+        }
+        in_flight = {custom_id for batch in tracked.values() for custom_id in batch["custom_ids"]}
+        new_requests = (
+            (custom_id, body() if callable(body) else body)
+            for custom_id, body in requests.items()
+            if custom_id not in in_flight
+        )
+        batch_ids = list(tracked) + self.submit(new_requests)
+
+        results = {}
+        for batch in self.wait(batch_ids).values():
+            results.update(self.collect(batch))
+        return results
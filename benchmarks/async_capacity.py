@@ -0,0 +1,226 @@
+"""Concurrent applicants served per GB of RAM: sync workers vs. ASYNC_EXTRACTION.
+
+    python benchmarks/async_capacity.py --fake-redis
+    python benchmarks/async_capacity.py --fake-redis --concurrency 96 --latency 3
+
+Serves the app with gunicorn twice against benchmarks/fake_openai.py, which
+answers after --latency seconds like a slow vision model:
+
+    sync   gunicorn -w 4 --threads 8, extraction on EXTRACTION_WORKERS threads
+           per worker (the docker-compose deployment)
+    async  gunicorn -w 1 --threads 64 with ASYNC_EXTRACTION=1, every worker's
+           model calls multiplexed on one event loop
+
+--concurrency clients then upload --applicants applicants with three unique
+documents each. Admission control is off so the deployments' own limits show.
+The resident memory of the gunicorn master and workers is sampled throughout;
+applicants in flight (throughput x mean latency) and throughput are reported
+per GB of the peak. Results are saved under
+benchmarks/results/<commit>/async_capacity.json.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, BENCHMARKS)
+
+import bench_results  # noqa: E402
+import fake_openai  # noqa: E402
+from load_test import document_variants, free_port, wait_for  # noqa: E402
+
+
+def serve_app():
+    # Imported by each gunicorn worker through the application attribute below
+    sys.path.insert(0, ROOT)
+    if os.getenv("BENCH_FAKE_REDIS"):
+        import bench_redis
+
+        bench_redis.use_fakeredis()
+    import app as app_module
+
+    app_module.limiter.enabled = False
+    return app_module.app
+
+
+if os.getenv("BENCH_SERVE_APP"):
+    application = serve_app()
+
+
+def descendants(pid):
+    # pid and every process below it, from /proc
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat:
+                parent = int(stat.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+    found, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        found.append(current)
+        pending.extend(children.get(current, []))
+    return found
+
+
+def tree_rss(pid):
+    # Resident set size in bytes of pid and all of its descendants
+    total = 0
+    page = os.sysconf("SC_PAGE_SIZE")
+    for current in descendants(pid):
+        try:
+            with open(f"/proc/{current}/statm") as statm:
+                total += int(statm.read().split()[1]) * page
+        except OSError:
+            pass
+    return total
+
+
+def run_deployment(name, gunicorn_args, extra_env, args, fake_port, variants):
+    port = free_port()
+    workdir = tempfile.mkdtemp(prefix=f"digiform-{name}-")
+    env = dict(os.environ)
+    env.update(
+        BENCH_SERVE_APP="1",
+        BENCH_FAKE_REDIS="1" if args.fake_redis else "",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{fake_port}/v1",
+        OPENAI_API_KEY=env.get("OPENAI_API_KEY", "benchmark"),
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'capacity.db')}",
+        ARTIFACT_DIR=os.path.join(workdir, "artifacts"),
+        JOB_BACKEND="",
+        UPSTREAM_RPM="0",
+        UPSTREAM_TPM="0",
+        ADMISSION_WORKER_LIMIT="0",
+        UPSTREAM_MAX_CONNECTIONS=str(args.concurrency * 3),
+        LOG_LEVEL="WARNING",
+        **extra_env,
+    )
+    command = [
+        sys.executable, "-m", "gunicorn", *gunicorn_args, "--timeout", "300",
+        "-b", f"127.0.0.1:{port}", "--chdir", BENCHMARKS, "async_capacity:application",
+    ]
+    subprocess.run([sys.executable, "-m", "flask", "--app", "app", "init-db"], cwd=ROOT, env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+    server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    peak_rss, stop = [0], threading.Event()
+
+    def sample():
+        while not stop.is_set():
+            peak_rss[0] = max(peak_rss[0], tree_rss(server.pid))
+            time.sleep(0.2)
+
+    try:
+        wait_for(base_url + "/", server)
+        # Every worker answers a page first, so imports are done before measuring
+        with httpx.Client(base_url=base_url) as warmup:
+            for _ in range(16):
+                warmup.get("/register")
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        latencies, errors = [], 0
+        with httpx.Client(base_url=base_url, timeout=300, limits=limits) as client:
+            def upload(n):
+                start = time.perf_counter()
+                try:
+                    response = client.post("/upload", files=variants[n])
+                    ok = response.status_code == 200 and b"/pdf/" in response.content
+                except httpx.HTTPError:
+                    ok = False
+                return ok, time.perf_counter() - start
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                for ok, latency in pool.map(upload, range(len(variants))):
+                    if ok:
+                        latencies.append(latency)
+                    else:
+                        errors += 1
+            elapsed = time.perf_counter() - start
+        stop.set()
+        sampler.join()
+    finally:
+        stop.set()
+        server.terminate()
+        server.wait()
+
+    summary = bench_results.summarize(latencies, elapsed, errors)
+    gigabytes = peak_rss[0] / 1024 ** 3
+    in_flight = summary["throughput"] * (sum(latencies) / len(latencies)) if latencies else 0.0
+    summary["peak_rss_mb"] = round(peak_rss[0] / 1024 ** 2, 1)
+    summary["in_flight"] = round(in_flight, 1)
+    summary["in_flight_per_gb"] = round(in_flight / gigabytes, 1) if gigabytes else 0.0
+    summary["applicants_per_minute_per_gb"] = round(summary["throughput"] * 60 / gigabytes, 1) if gigabytes else 0.0
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--applicants", type=int, default=192)
+    parser.add_argument("--concurrency", type=int, default=64, help="applicants uploading at once")
+    parser.add_argument("--latency", type=float, default=2.0, help="fake model latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--sync-workers", type=int, default=4)
+    parser.add_argument("--sync-threads", type=int, default=8)
+    parser.add_argument("--async-workers", type=int, default=1)
+    parser.add_argument("--async-threads", type=int, default=64)
+    parser.add_argument("--fake-redis", action="store_true", help="run the app against fakeredis")
+    parser.add_argument("--compare", metavar="REF", help="compare with results recorded for this commit")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    fake = fake_openai.serve(0, latency=args.latency, jitter=args.jitter)
+    deployments = {
+        f"sync -w {args.sync_workers} --threads {args.sync_threads}": (
+            ["-w", str(args.sync_workers), "--threads", str(args.sync_threads)],
+            {"ASYNC_EXTRACTION": "0"},
+        ),
+        f"async -w {args.async_workers} --threads {args.async_threads}": (
+            ["-w", str(args.async_workers), "--threads", str(args.async_threads)],
+            {"ASYNC_EXTRACTION": "1"},
+        ),
+    }
+    variants = document_variants(args.applicants * len(deployments))
+    results = {}
+    try:
+        for n, (name, (gunicorn_args, extra_env)) in enumerate(deployments.items()):
+            batch = variants[n * args.applicants:(n + 1) * args.applicants]
+            results[name] = run_deployment(name.split()[0], gunicorn_args, extra_env, args, fake.server_port, batch)
+    finally:
+        fake.shutdown()
+
+    print(
+        f"{args.applicants} applicants, {args.concurrency} uploading at once, "
+        f"fake model {args.latency}s±{args.jitter}s\n"
+    )
+    bench_results.print_table(results, unit="applicants/s")
+    print(f"\n{'deployment':<36}{'peak RSS MB':>12}{'in flight':>11}{'per GB':>9}{'per min/GB':>12}")
+    for name, summary in results.items():
+        print(
+            f"{name:<36}{summary['peak_rss_mb']:>12.0f}{summary['in_flight']:>11.1f}"
+            f"{summary['in_flight_per_gb']:>9.0f}{summary['applicants_per_minute_per_gb']:>12.0f}"
+        )
+
+    config = {key: value for key, value in vars(args).items() if key not in ("compare", "threshold")}
+    baseline = bench_results.load("async_capacity", args.compare) if args.compare else None
+    print(f"\nsaved {bench_results.save('async_capacity', config, results)}")
+    if baseline:
+        return 1 if bench_results.compare(results, baseline, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,20 @@
+"""Runs the app against an in-process fakeredis, for the --fake-redis option.
+
+Call use_fakeredis() before the app is imported: every client the process then
+builds with redis.Redis.from_url or redis.asyncio.Redis.from_url talks to one
+shared fakeredis server, so the caches, queues and budgets see each other as
+they would on a real Redis. Processes do not share it; benchmarks that run
+several servers against one Redis use fakeredis.TcpFakeServer instead.
+"""
+import fakeredis
+import redis
+import redis.asyncio
+
+
+def use_fakeredis():
+    server = fakeredis.FakeServer()
+    redis.Redis.from_url = staticmethod(lambda *args, **kwargs: fakeredis.FakeRedis(server=server))
+    redis.asyncio.Redis.from_url = staticmethod(
+        lambda *args, **kwargs: fakeredis.FakeAsyncRedis(server=server)
+    )
+    return server
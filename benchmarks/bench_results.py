@@ -0,0 +1,91 @@
+"""Latency summaries and per-commit result files shared by the benchmarks.
+
+Results are written to benchmarks/results/<commit>/<suite>.json (with a
+"-dirty" suffix for uncommitted trees) so a later run can be compared with
+any earlier commit:
+
+    python benchmarks/load_test.py --compare HEAD~3
+"""
+import json
+import os
+import subprocess
+import time
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+def summarize(latencies, elapsed, errors=0):
+    # Latencies in seconds in, milliseconds out
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 4),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 4),
+        "throughput": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+def print_table(results, unit="req/s"):
+    print(f"{'benchmark':<36}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{unit:>12}{'errors':>8}")
+    for name, summary in results.items():
+        print(
+            f"{name:<36}{summary['p50_ms']:>10.3f}{summary['p95_ms']:>10.3f}{summary['p99_ms']:>10.3f}"
+            f"{summary['throughput']:>12.1f}{summary['errors']:>8}"
+        )
+
+
+def git(*args):
+    return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+
+
+def current_commit():
+    commit = git("rev-parse", "--short", "HEAD") or "unknown"
+    return f"{commit}-dirty" if git("status", "--porcelain", "--untracked-files=no") else commit
+
+
+def save(suite, config, results):
+    commit = current_commit()
+    path = os.path.join(RESULTS_DIR, commit, f"{suite}.json")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as result_file:
+        json.dump(
+            {"commit": commit, "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "config": config,
+             "results": results},
+            result_file, indent=2,
+        )
+    return path
+
+
+def load(suite, ref):
+    # ref is a git revision or a result directory name such as "abc1234-dirty"
+    for name in (ref, git("rev-parse", "--short", ref)):
+        path = os.path.join(RESULTS_DIR, name, f"{suite}.json") if name else ""
+        if os.path.exists(path):
+            with open(path) as result_file:
+                return json.load(result_file)
+    raise SystemExit(f"No {suite} results recorded for {ref} in {RESULTS_DIR}")
+
+
+def compare(results, baseline, threshold=0.10):
+    # Prints p95 and throughput against the baseline; returns the benchmarks
+    # that got worse by more than threshold
+    regressions = []
+    print(f"\ncompared with {baseline['commit']} ({baseline['recorded_at']}):")
+    for name, summary in results.items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        p95 = summary["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+        rate = summary["throughput"] / before["throughput"] - 1 if before["throughput"] else 0.0
+        regressed = p95 > threshold or rate < -threshold
+        if regressed:
+            regressions.append(name)
+        print(f"  {name:<34} p95 {p95:>+7.1%}  throughput {rate:>+7.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
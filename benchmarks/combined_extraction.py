@@ -0,0 +1,137 @@
+"""Latency and token usage of combined vs. per-document extraction.
+
+    python benchmarks/combined_extraction.py                  # Redis at REDIS_URL
+    python benchmarks/combined_extraction.py --fake-redis --applicants 60 --concurrency 6
+
+Runs extract_documents from app.py in-process for --applicants applicants with
+all three documents each, once with EXTRACTION_MODE=per_document and once
+with EXTRACTION_MODE=combined, against benchmarks/fake_openai.py. The fake
+charges a fixed latency per call plus --image-latency per input image and
+--token-latency per output token, and reports usage estimated from each
+request, so the fixed cost saved by one call and the repeated instructions
+saved per applicant both show up. Every applicant gets pixel-altered sample
+images so nothing is served from the extraction cache.
+
+Per-applicant p50/p95/p99 latency, upstream calls and prompt/completion
+tokens per applicant are printed and saved under
+benchmarks/results/<commit>/combined.json.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCHMARKS)
+
+import bench_results  # noqa: E402
+import fake_openai  # noqa: E402
+from load_test import document_variants  # noqa: E402
+
+MODES = ["per_document", "combined"]
+
+
+def load_app(base_url, fake_redis):
+    workdir = tempfile.mkdtemp(prefix="digiform-combined-")
+    os.environ.update(
+        OPENAI_BASE_URL=base_url,
+        OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "benchmark"),
+        DATABASE_URL=os.getenv("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'combined.db')}"),
+        ARTIFACT_DIR=os.path.join(workdir, "artifacts"),
+        JOB_BACKEND="",
+        UPSTREAM_RPM="0",
+        UPSTREAM_TPM="0",
+        PREFILTER_ENABLED=os.getenv("PREFILTER_ENABLED", "0"),
+    )
+    if fake_redis:
+        import bench_redis
+
+        bench_redis.use_fakeredis()
+    import app as app_module
+
+    app_module.init_db()
+    return app_module
+
+
+def applicant_slots(app_module, variants):
+    slots = []
+    for files in variants:
+        by_field = {field: data for field, (_, data, _) in files.items()}
+        slots.append([app_module.document_image(by_field[field]) for field, _ in app_module.DOCUMENTS])
+    return slots
+
+
+def run_mode(app_module, fake, mode, slots, concurrency):
+    app_module.app.config["EXTRACTION_MODE"] = mode
+    before = dict(fake.stats)
+    latencies, errors = [], 0
+
+    def applicant(n):
+        start = time.perf_counter()
+        results = app_module.extract_documents(slots[n])
+        return all("error" not in result for result in results), time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for ok, latency in pool.map(applicant, range(len(slots))):
+            if ok:
+                latencies.append(latency)
+            else:
+                errors += 1
+    summary = bench_results.summarize(latencies, time.perf_counter() - start, errors)
+    for key in ("requests", "prompt_tokens", "completion_tokens"):
+        summary[f"{key}_per_applicant"] = round((fake.stats[key] - before.get(key, 0)) / len(slots), 2)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--applicants", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=4, help="applicants extracted at once")
+    parser.add_argument("--latency", type=float, default=0.4, help="fixed seconds per model call")
+    parser.add_argument("--image-latency", type=float, default=0.15, help="extra seconds per input image")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="extra seconds per output token")
+    parser.add_argument("--fake-redis", action="store_true", help="use fakeredis instead of REDIS_URL")
+    parser.add_argument("--compare", metavar="REF", help="compare with results recorded for this commit")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    server = fake_openai.serve(
+        0, latency=args.latency, image_latency=args.image_latency, token_latency=args.token_latency
+    )
+    app_module = load_app(f"http://127.0.0.1:{server.server_port}/v1", args.fake_redis)
+    variants = document_variants(args.applicants * len(MODES))
+
+    results = {}
+    for n, mode in enumerate(MODES):
+        slots = applicant_slots(app_module, variants[n * args.applicants:(n + 1) * args.applicants])
+        results[mode] = run_mode(app_module, server.fake, mode, slots, args.concurrency)
+    server.shutdown()
+
+    print(
+        f"{args.applicants} applicants x 3 documents, concurrency {args.concurrency}, fake model "
+        f"{args.latency}s + {args.image_latency}s/image + {args.token_latency}s/output token\n"
+    )
+    bench_results.print_table(results, unit="applicants/s")
+    print()
+    for mode, summary in results.items():
+        print(
+            f"{mode:<13} {summary['requests_per_applicant']:.1f} calls, "
+            f"{summary['prompt_tokens_per_applicant']:.0f} prompt + "
+            f"{summary['completion_tokens_per_applicant']:.0f} completion tokens per applicant"
+        )
+
+    config = {key: value for key, value in vars(args).items() if key not in ("compare", "threshold")}
+    baseline = bench_results.load("combined", args.compare) if args.compare else None
+    print(f"\nsaved {bench_results.save('combined', config, results)}")
+    if baseline:
+        return 1 if bench_results.compare(results, baseline, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""Registration export speed and peak memory per format on a large table.
+
+    python benchmarks/export_throughput.py                         # 1M rows in SQLite
+    python benchmarks/export_throughput.py --rows 100000 --formats csv parquet
+    DATABASE_URL=postgresql://... python benchmarks/export_throughput.py
+
+Fills the database with --rows synthetic registrations, each linked to the
+three documents of one of --results extraction results, unless it already
+holds that many. The SQLite file is kept under the temp directory, so later
+runs skip this step. Then each format is exported with
+`flask --app app export-registrations` in a fresh interpreter, and timed
+together with that process's peak resident memory. "naive csv" is the same
+CSV written after loading every registration and result with
+Registration.query.all(), for comparison. Results are saved under
+benchmarks/results/<commit>/export_throughput.json.
+"""
+import argparse
+import csv
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, BENCHMARKS)
+
+import bench_results  # noqa: E402
+import fake_openai  # noqa: E402
+
+# Upload field and canned answer of each linked document
+DOCUMENT_ANSWERS = [
+    ("identityDocument", "Aadhar"),
+    ("tenthMarksheet", "10th"),
+    ("twelfthMarksheet", "12th"),
+]
+
+
+def load_app():
+    sys.path.insert(0, ROOT)
+    import app as app_module
+
+    app_module.init_db()
+    return app_module
+
+
+def populate(rows, results, batch_size=20000):
+    # Synthetic registrations created 30 seconds apart from the start of 2026
+    app_module = load_app()
+    db = app_module.db
+    with app_module.app.app_context():
+        existing = app_module.Registration.query.count()
+        if existing >= rows:
+            return existing
+        print(f"adding {rows - existing} registrations ...", flush=True)
+        result_ids = db.session.scalars(select_result_ids(app_module, results)).all()
+        for n in range(len(result_ids), results * len(DOCUMENT_ANSWERS)):
+            document_type, canned = DOCUMENT_ANSWERS[n % len(DOCUMENT_ANSWERS)]
+            db.session.add(app_module.ExtractionResult.from_cache_key(
+                f"extract:v3:benchmark:{n:016x}:{n:064x}", fake_openai.CANNED[canned]
+            ))
+        db.session.commit()
+        result_ids = db.session.scalars(select_result_ids(app_module, results)).all()
+
+        registrations = app_module.Registration.__table__
+        documents = app_module.RegistrationDocument.__table__
+        epoch = datetime(2026, 1, 1)
+        for first in range(existing, rows, batch_size):
+            batch = range(first, min(first + batch_size, rows))
+            ids = db.session.scalars(registrations.insert().returning(
+                registrations.c.id, sort_by_parameter_order=True
+            ), [
+                {
+                    "fullName": f"Applicant {n}",
+                    "phoneNumber": f"{9000000000 + n}",
+                    "emailId": f"applicant{n}@example.com",
+                    "createdAt": epoch + timedelta(seconds=30 * n),
+                }
+                for n in batch
+            ]).all()
+            db.session.execute(documents.insert(), [
+                {
+                    "registration_id": registration_id,
+                    "document_type": document_type,
+                    "extraction_result_id": result_ids[(n % results) * len(DOCUMENT_ANSWERS) + d],
+                }
+                for n, registration_id in zip(batch, ids)
+                for d, (document_type, _) in enumerate(DOCUMENT_ANSWERS)
+            ])
+            db.session.commit()
+        return rows
+
+
+def select_result_ids(app_module, results):
+    from sqlalchemy import select
+
+    result = app_module.ExtractionResult
+    return (
+        select(result.id).where(result.model == "benchmark").order_by(result.id)
+        .limit(results * len(DOCUMENT_ANSWERS))
+    )
+
+
+def naive_export(path):
+    # Everything in memory first, the way an ad hoc script would do it
+    app_module = load_app()
+    import registration_export
+
+    with app_module.app.app_context():
+        registrations = app_module.Registration.query.all()
+        documents = app_module.RegistrationDocument.query.all()
+        results = {result.id: result.result for result in app_module.ExtractionResult.query.all()}
+        answers = {}
+        for document in documents:
+            answers.setdefault(document.registration_id, {})[document.document_type] = (
+                results[document.extraction_result_id]
+            )
+        with open(path, "w", newline="") as output:
+            writer = csv.writer(output)
+            writer.writerow(registration_export.COLUMNS)
+            for registration in registrations:
+                extracted = answers.get(registration.id, {})
+                row = [getattr(registration, column) for column in registration_export.REGISTRATION_COLUMNS]
+                row += [
+                    (extracted.get(document_type) or {}).get(field)
+                    for _, document_type, field in registration_export.EXTRACTED_COLUMNS
+                ]
+                writer.writerow([registration_export.csv_value(value) for value in row])
+
+
+def timed_run(command, env):
+    # Wall-clock seconds and peak RSS in bytes of one child process
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode:
+        raise SystemExit(f"{' '.join(command)} exited with {process.returncode}")
+    return elapsed, usage.ru_maxrss * 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--results", type=int, default=1000, help="distinct extraction results linked")
+    parser.add_argument("--formats", nargs="+", default=["csv", "jsonl", "arrow", "parquet", "naive csv"])
+    parser.add_argument("--chunk-size", type=int, default=2000, help="EXPORT_CHUNK_SIZE")
+    parser.add_argument("--naive", metavar="PATH", help=argparse.SUPPRESS)
+    parser.add_argument("--compare", metavar="REF", help="compare with results recorded for this commit")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault(
+        "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), f'digiform-export-{args.rows}.db')}"
+    )
+    if args.naive:
+        naive_export(args.naive)
+        return 0
+
+    start = time.perf_counter()
+    rows = populate(args.rows, args.results)
+    print(f"{rows} registrations ready in {time.perf_counter() - start:.1f}s\n")
+
+    env = dict(os.environ, EXPORT_CHUNK_SIZE=str(args.chunk_size), LOG_LEVEL="WARNING")
+    outdir = tempfile.mkdtemp(prefix="digiform-export-")
+    results = {}
+    for export_format in args.formats:
+        path = os.path.join(outdir, f"registrations.{export_format.replace(' ', '_')}")
+        if export_format == "naive csv":
+            command = [sys.executable, __file__, "--naive", path]
+        else:
+            command = [
+                sys.executable, "-m", "flask", "--app", "app", "export-registrations",
+                "--format", export_format, "--output", path,
+            ]
+        elapsed, peak = timed_run(command, env)
+        summary = bench_results.summarize([elapsed], elapsed)
+        summary.update(
+            count=rows,
+            throughput=round(rows / elapsed, 1),
+            peak_rss_mb=round(peak / 1024 ** 2, 1),
+            output_mb=round(os.path.getsize(path) / 1024 ** 2, 1),
+        )
+        results[export_format] = summary
+        os.remove(path)
+
+    print(f"{'format':<14}{'seconds':>10}{'rows/s':>12}{'peak RSS MB':>13}{'output MB':>11}")
+    for name, summary in results.items():
+        print(
+            f"{name:<14}{summary['p50_ms'] / 1000:>10.1f}{summary['throughput']:>12.0f}"
+            f"{summary['peak_rss_mb']:>13.0f}{summary['output_mb']:>11.1f}"
+        )
+
+    config = {key: value for key, value in vars(args).items() if key not in ("compare", "threshold", "naive")}
+    baseline = bench_results.load("export_throughput", args.compare) if args.compare else None
+    print(f"\nsaved {bench_results.save('export_throughput', config, results)}")
+    if baseline:
+        return 1 if bench_results.compare(results, baseline, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,412 @@
+"""A stand-in for the OpenAI API, for exercising extraction without a key.
+
+    python benchmarks/fake_openai.py --port 8089 --latency 0.5
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 python bulk_process.py in/ out/
+
+Serves POST /v1/chat/completions with canned JSON chosen from the prompt text,
+and enough of the Files and Batches endpoints for the Batch API backend:
+uploaded batch files are answered line by line with the same canned JSON once
+--batch-delay seconds have passed.
+
+Chat completions can be made unreliable: --rpm enforces a per-minute limit with
+429s and Retry-After like the real API, --rate-limit-rate and
+--server-error-rate inject 429s and 500s at random, --stall-rate makes calls
+hang for --stall seconds, and --jitter spreads --latency. --image-latency and
+--token-latency add time per input image and output token, and usage is
+estimated from the request. --model-latency overrides --latency for named
+models, and --weak-models answer a --degraded-rate share of images with one to
+three fields "Not Available", the same images on every call, as a cheap model
+might on hard scans. GET /stats returns what was served, with calls per model.
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED = {
+    "Aadhar": {
+        "full_name": "Asha Verma",
+        "fathers_name": "Rakesh Verma",
+        "date_of_birth": "12/04/2006",
+        "address": "12 MG Road, Pune, Maharashtra 411001",
+        "aadhar_number": "1234 5678 9012",
+        "gender": "Female",
+        "invalid": None,
+    },
+    "10th": {
+        "seat_number": "B123456",
+        "year_of_passing": "2022",
+        "subjects": [
+            {"name": name, "score": score}
+            for name, score in [("English", "88"), ("Hindi", "81"), ("Mathematics", "95"),
+                                ("Science", "91"), ("Social Science", "86")]
+        ],
+        "total_marks": "441",
+        "percentage": "88.20%",
+        "invalid": None,
+    },
+    "12th": {
+        "stream": "Science",
+        "seat_number": "H654321",
+        "year_of_passing": "2024",
+        "subjects": [
+            {"name": name, "score": score}
+            for name, score in [("English", "85"), ("Physics", "90"), ("Chemistry", "87"),
+                                ("Mathematics", "97"), ("Computer Science", "94")]
+        ],
+        "total_marks": "453",
+        "percentage": "90.60%",
+        "invalid": None,
+    },
+}
+
+
+# Prompt tokens the real API charges for a 1600px high-detail image; gpt-4o-mini
+# bills images at about 33 times gpt-4o's rate
+IMAGE_TOKENS = {"gpt-4o-mini": 2833 + 5667 * 4}
+DEFAULT_IMAGE_TOKENS = 765
+
+
+def content_parts(body):
+    for message in body.get("messages", []):
+        content = message["content"]
+        yield from content if isinstance(content, list) else [{"type": "text", "text": content}]
+
+
+def canned_for(text):
+    for marker, value in CANNED.items():
+        if marker in text:
+            return value
+    return {}
+
+
+def canned_response(body):
+    texts = [part["text"] for part in content_parts(body) if part["type"] == "text"]
+    # Several documents in one request are introduced as: Image 2 is "tenthMarksheet". ...
+    keyed = [re.match(r'Image \d+ is "(\w+)"', text) for text in texts]
+    if any(keyed):
+        return {match.group(1): canned_for(text) for match, text in zip(keyed, texts) if match}
+    return canned_for(" ".join(texts))
+
+
+def degrade(answer, body, rate):
+    # Blanks 1 to 3 fields of the answer for images whose hash falls under rate
+    images = [part["image_url"]["url"] for part in content_parts(body) if part["type"] == "image_url"]
+    if not rate or len(images) != 1 or not answer:
+        return answer
+    roll = int(hashlib.sha256(images[0].encode()).hexdigest()[:8], 16) / 16 ** 8
+    if roll >= rate:
+        return answer
+    fields = [field for field, value in answer.items() if isinstance(value, str)]
+    return dict(answer, **dict.fromkeys(fields[:1 + int(roll / rate * 3)], "Not Available"))
+
+
+def chat_completion(body, degraded_rate=0.0):
+    content = json.dumps(degrade(canned_response(body), body, degraded_rate))
+    parts = list(content_parts(body))
+    image_tokens = IMAGE_TOKENS.get(body.get("model", "gpt-4o-mini"), DEFAULT_IMAGE_TOKENS)
+    prompt_tokens = sum(
+        len(part["text"]) // 4 if part["type"] == "text" else image_tokens for part in parts
+    ) + 7
+    completion_tokens = len(content) // 4
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o-mini"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+class FakeOpenAI:
+    def __init__(self, latency=0.0, batch_delay=2.0, jitter=0.0, rpm=0, rate_limit_rate=0.0,
+                 server_error_rate=0.0, stall_rate=0.0, stall=30.0, image_latency=0.0, token_latency=0.0,
+                 model_latency=None, weak_models=(), degraded_rate=0.0):
+        self.latency = latency
+        self.model_latency = model_latency or {}
+        self.weak_models = set(weak_models)
+        self.degraded_rate = degraded_rate
+        self.image_latency = image_latency
+        self.token_latency = token_latency
+        self.batch_delay = batch_delay
+        self.jitter = jitter
+        self.rpm = rpm
+        self.rate_limit_rate = rate_limit_rate
+        self.server_error_rate = server_error_rate
+        self.stall_rate = stall_rate
+        self.stall = stall
+        self.files = {}
+        self.batches = {}
+        self.recent = deque()
+        self.stats = Counter()
+        self.lock = threading.Lock()
+
+    def chat_outcome(self):
+        # Returns (status, retry_after) for the next chat completion
+        with self.lock:
+            self.stats["requests"] += 1
+            now = time.monotonic()
+            while self.recent and now - self.recent[0] > 60:
+                self.recent.popleft()
+            if self.rpm and len(self.recent) >= self.rpm:
+                self.stats["429"] += 1
+                return 429, max(1, int(60 - (now - self.recent[0])))
+            self.recent.append(now)
+            roll = random.random()
+            if roll < self.rate_limit_rate:
+                self.stats["429"] += 1
+                return 429, 1
+            if roll < self.rate_limit_rate + self.server_error_rate:
+                self.stats["500"] += 1
+                return 500, None
+            if roll < self.rate_limit_rate + self.server_error_rate + self.stall_rate:
+                self.stats["stalled"] += 1
+                return None, None
+            self.stats["200"] += 1
+            return 200, None
+
+    def record_usage(self, usage):
+        with self.lock:
+            self.stats["prompt_tokens"] += usage["prompt_tokens"]
+            self.stats["completion_tokens"] += usage["completion_tokens"]
+
+    def add_file(self, content, filename, purpose):
+        file_id = f"file-{uuid.uuid4().hex}"
+        with self.lock:
+            self.files[file_id] = {
+                "id": file_id,
+                "object": "file",
+                "bytes": len(content),
+                "created_at": int(time.time()),
+                "filename": filename,
+                "purpose": purpose,
+                "status": "processed",
+                "content": content,
+            }
+        return {key: value for key, value in self.files[file_id].items() if key != "content"}
+
+    def create_batch(self, body):
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        batch = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"],
+            "completion_window": body["completion_window"],
+            "status": "in_progress",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        with self.lock:
+            self.batches[batch_id] = batch
+        return batch
+
+    def retrieve_batch(self, batch_id):
+        with self.lock:
+            batch = self.batches[batch_id]
+            if batch["status"] == "in_progress" and time.time() - batch["created_at"] >= self.batch_delay:
+                self._complete(batch)
+            return dict(batch)
+
+    def _complete(self, batch):
+        lines = []
+        for line in self.files[batch["input_file_id"]]["content"].splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            lines.append(json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": chat_completion(request["body"])},
+                "error": None,
+            }))
+        content = ("\n".join(lines) + "\n").encode()
+        file_id = f"file-{uuid.uuid4().hex}"
+        self.files[file_id] = {"id": file_id, "object": "file", "content": content}
+        batch.update(
+            status="completed",
+            output_file_id=file_id,
+            completed_at=int(time.time()),
+            request_counts={"total": len(lines), "completed": len(lines), "failed": 0},
+        )
+
+
+def parse_multipart(handler, body):
+    # Returns {name: (filename, bytes)} for a multipart/form-data body
+    boundary = re.search(r"boundary=\"?([^\";]+)", handler.headers["Content-Type"]).group(1).encode()
+    fields = {}
+    for part in body.split(b"--" + boundary):
+        if b"\r\n\r\n" not in part:
+            continue
+        headers, value = part.split(b"\r\n\r\n", 1)
+        disposition = headers.decode(errors="replace")
+        name = re.search(r'name="([^"]*)"', disposition)
+        filename = re.search(r'filename="([^"]*)"', disposition)
+        if name:
+            fields[name.group(1)] = (filename.group(1) if filename else None, value[:-2] if value.endswith(b"\r\n") else value)
+    return fields
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, payload, status=200, headers=None):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def read_body(self):
+            return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        def do_POST(self):
+            body = self.read_body()
+            if self.path == "/v1/chat/completions":
+                request = json.loads(body)
+                model = request.get("model", "gpt-4o-mini")
+                with fake.lock:
+                    fake.stats[f"requests:{model}"] += 1
+                status, retry_after = fake.chat_outcome()
+                latency = fake.model_latency.get(model, fake.latency)
+                if status is None:
+                    time.sleep(fake.stall)
+                    status = 200
+                elif latency or fake.jitter:
+                    time.sleep(max(0.0, random.uniform(latency - fake.jitter, latency + fake.jitter)))
+                if status == 200:
+                    completion = chat_completion(
+                        request, fake.degraded_rate if model in fake.weak_models else 0.0
+                    )
+                    fake.record_usage(completion["usage"])
+                    # Prefill per image and generation per output token, as a real model call
+                    images = sum(part["type"] == "image_url" for part in content_parts(request))
+                    time.sleep(images * fake.image_latency + completion["usage"]["completion_tokens"] * fake.token_latency)
+                    self.send_json(completion)
+                elif status == 429:
+                    self.send_json(
+                        {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                        429, {"Retry-After": str(retry_after)},
+                    )
+                else:
+                    self.send_json({"error": {"message": "The server had an error", "type": "server_error"}}, 500)
+            elif self.path == "/v1/files":
+                fields = parse_multipart(self, body)
+                filename, content = fields["file"]
+                self.send_json(fake.add_file(content, filename, fields["purpose"][1].decode()))
+            elif self.path == "/v1/batches":
+                self.send_json(fake.create_batch(json.loads(body)))
+            else:
+                self.send_json({"error": {"message": f"Unknown path {self.path}"}}, 404)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                with fake.lock:
+                    return self.send_json(dict(fake.stats))
+            match = re.fullmatch(r"/v1/batches/([\w-]+)", self.path)
+            if match and match.group(1) in fake.batches:
+                return self.send_json(fake.retrieve_batch(match.group(1)))
+            match = re.fullmatch(r"/v1/files/([\w-]+)/content", self.path)
+            if match and match.group(1) in fake.files:
+                content = fake.files[match.group(1)]["content"]
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+                return
+            self.send_json({"error": {"message": f"Unknown path {self.path}"}}, 404)
+
+    return Handler
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # Clients that time out on a stalled call hang up before the reply
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def serve(port=0, **options):
+    # Starts the server on a daemon thread and returns it; port 0 picks a free port
+    fake = FakeOpenAI(**options)
+    server = FakeServer(("127.0.0.1", port), make_handler(fake))
+    server.fake = fake
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per chat completion")
+    parser.add_argument("--jitter", type=float, default=0.0, help="latency varies by up to this many seconds")
+    parser.add_argument("--image-latency", type=float, default=0.0, help="extra seconds per input image")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="extra seconds per output token")
+    parser.add_argument("--batch-delay", type=float, default=2.0, help="seconds before a batch completes")
+    parser.add_argument("--rpm", type=int, default=0, help="requests per minute before 429s, 0 for no limit")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of calls answered with 429")
+    parser.add_argument("--server-error-rate", type=float, default=0.0, help="fraction of calls answered with 500")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="fraction of calls that hang")
+    parser.add_argument("--stall", type=float, default=30.0, help="seconds a hanging call takes")
+    parser.add_argument("--model-latency", nargs="*", default=[], metavar="MODEL=SECONDS",
+                        help="latency of particular models instead of --latency")
+    parser.add_argument("--weak-models", nargs="*", default=[], help="models that miss fields on some images")
+    parser.add_argument("--degraded-rate", type=float, default=0.0,
+                        help="fraction of images the --weak-models answer with missing fields")
+    args = parser.parse_args()
+    server = serve(
+        args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        image_latency=args.image_latency,
+        token_latency=args.token_latency,
+        batch_delay=args.batch_delay,
+        rpm=args.rpm,
+        rate_limit_rate=args.rate_limit_rate,
+        server_error_rate=args.server_error_rate,
+        stall_rate=args.stall_rate,
+        stall=args.stall,
+        model_latency={model: float(seconds) for model, seconds in (item.split("=") for item in args.model_latency)},
+        weak_models=args.weak_models,
+        degraded_rate=args.degraded_rate,
+    )
+    print(f"Fake OpenAI API on http://127.0.0.1:{server.server_port}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Payload size and extraction latency at different IMAGE_MAX_EDGE settings.
+
+    python benchmarks/image_normalization.py --upscale 4000
+    python benchmarks/image_normalization.py --upscale 4000 --live   # also calls the model
+
+Sample images are upscaled (and saved at high quality) to mimic the 4000px
+phone photos applicants actually upload. With --live every setting is sent to
+the model once per image, bypassing the cache, and the wall-clock latency of
+normalization plus the model call is reported; OPENAI_API_KEY and optionally
+OPENAI_BASE_URL must point at a chat-completions endpoint.
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLES = os.path.join(ROOT, "experiments", "gradio_app", "sample_images")
+PROMPTS = {
+    "aadhar-card": 0,
+    "10marksheet": 1,
+    "12marksheet": 2,
+}
+
+
+def load_samples(upscale):
+    from PIL import Image
+
+    samples = []
+    for path in sorted(glob.glob(os.path.join(SAMPLES, "*"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        with open(path, "rb") as image_file:
+            data = image_file.read()
+        if upscale:
+            with Image.open(BytesIO(data)) as img:
+                scale = upscale / max(img.size)
+                big = img.convert("RGB").resize(
+                    (round(img.width * scale), round(img.height * scale)), Image.BICUBIC
+                )
+                output = BytesIO()
+                big.save(output, format="JPEG", quality=95)
+                data = output.getvalue()
+        samples.append((name, data))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="0,2048,1600,1280,1024,768",
+                        help="comma separated IMAGE_MAX_EDGE values (0 = no normalization)")
+    parser.add_argument("--quality", type=int, default=85, help="IMAGE_JPEG_QUALITY")
+    parser.add_argument("--upscale", type=int, default=0,
+                        help="upscale samples to this longest edge first")
+    parser.add_argument("--repeat", type=int, default=5, help="normalization timing repeats")
+    parser.add_argument("--live", action="store_true", help="also time the model call")
+    args = parser.parse_args()
+
+    os.environ.setdefault("DATABASE_URL", "sqlite://")
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    sys.path.insert(0, ROOT)
+    import app as app_module
+
+    app_module.app.config["IMAGE_JPEG_QUALITY"] = args.quality
+    samples = load_samples(args.upscale)
+    header = f"{'image':<14} {'max edge':>8} {'upload':>10} {'payload':>10} {'normalize':>10}"
+    if args.live:
+        header += f" {'end-to-end':>11}"
+    print(header)
+
+    for name, data in samples:
+        upload = app_module.DocumentImage(data, None, None)
+        for max_edge in (int(size) for size in args.sizes.split(",")):
+            app_module.app.config["IMAGE_MAX_EDGE"] = max_edge
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                image = app_module.normalize_image(upload)
+                timings.append(time.perf_counter() - start)
+            payload = len(app_module.encode_image(image.data, image.mime_type))
+            row = (
+                f"{name:<14} {max_edge or 'off':>8} {len(data) / 1024:>7.0f} KB"
+                f" {payload / 1024:>7.0f} KB {statistics.median(timings) * 1000:>7.1f} ms"
+            )
+            if args.live:
+                field, prompt = app_module.DOCUMENTS[PROMPTS.get(name, 0)]
+                start = time.perf_counter()
+                image = app_module.normalize_image(upload)
+                app_module.request_extraction(image, prompt, field)
+                row += f" {(time.perf_counter() - start) * 1000:>8.0f} ms"
+            print(row)
+
+
+if __name__ == "__main__":
+    main()
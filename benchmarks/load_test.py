@@ -0,0 +1,208 @@
+"""Concurrent load on /digiform, /upload and /download_pdf against a fake model API.
+
+    python benchmarks/load_test.py                          # Redis at REDIS_URL
+    python benchmarks/load_test.py --fake-redis --concurrency 8 --uploads 40
+    python benchmarks/load_test.py --compare HEAD~1         # flag regressions
+
+The app runs in a subprocess on werkzeug's threaded server with rate limiting
+off and OPENAI_BASE_URL pointed at benchmarks/fake_openai.py, which answers
+with canned JSON per document type after --latency seconds and fails
+--error-rate of calls with a 500. Every upload uses slightly altered sample
+images so none of them is served from the extraction cache; downloads fetch
+the PDFs those uploads produced. The shared upstream budget is off unless
+UPSTREAM_RPM/UPSTREAM_TPM are set, so the numbers are the app's own.
+
+p50/p95/p99 latency and throughput per endpoint are printed and saved under
+benchmarks/results/<commit>/load_test.json.
+"""
+import argparse
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import httpx
+from PIL import Image
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+SAMPLES = os.path.join(ROOT, "experiments", "gradio_app", "sample_images")
+sys.path.insert(0, BENCHMARKS)
+
+import bench_results  # noqa: E402
+import fake_openai  # noqa: E402
+
+DOCUMENT_FILES = {
+    "identityDocument": "aadhar-card.jpg",
+    "tenthMarksheet": "10marksheet.jpeg",
+    "twelfthMarksheet": "12marksheet.jpeg",
+}
+
+
+def serve(port, fake_redis):
+    sys.path.insert(0, ROOT)
+    if fake_redis:
+        import bench_redis
+
+        bench_redis.use_fakeredis()
+    from werkzeug.serving import make_server
+
+    import app as app_module
+
+    app_module.init_db()
+    app_module.limiter.enabled = False
+    make_server("127.0.0.1", port, app_module.app, threaded=True).serve_forever()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("App server exited during startup")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise SystemExit("App server did not start")
+
+
+def document_variants(count):
+    # Each upload gets its own pixel-altered copy of the samples so it misses the cache
+    originals = {field: Image.open(os.path.join(SAMPLES, name)).convert("RGB") for field, name in DOCUMENT_FILES.items()}
+    variants = []
+    for n in range(count):
+        files = {}
+        for field, image in originals.items():
+            image = image.copy()
+            # n in black and white blocks rather than one pixel, so it survives normalize_image
+            for bit in range(16):
+                image.paste((255, 255, 255) if n >> bit & 1 else (0, 0, 0), (bit * 16, 0, bit * 16 + 16, 16))
+            buffer = BytesIO()
+            image.save(buffer, "JPEG", quality=90)
+            files[field] = (f"{field}.jpg", buffer.getvalue(), "image/jpeg")
+        variants.append(files)
+    return variants
+
+
+def run_load(name, call, count, concurrency):
+    # call(n) returns True for an expected response
+    latencies, errors = [], 0
+
+    def timed(n):
+        start = time.perf_counter()
+        try:
+            ok = call(n)
+        except httpx.HTTPError:
+            ok = False
+        return ok, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for ok, latency in pool.map(timed, range(count)):
+            if ok:
+                latencies.append(latency)
+            else:
+                errors += 1
+    return name, bench_results.summarize(latencies, time.perf_counter() - start, errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--registrations", type=int, default=500)
+    parser.add_argument("--uploads", type=int, default=40)
+    parser.add_argument("--downloads", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.5, help="fake model latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of model calls failing with 500")
+    parser.add_argument("--fake-redis", action="store_true", help="run the app against fakeredis")
+    parser.add_argument("--compare", metavar="REF", help="compare with results recorded for this commit")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.fake_redis)
+        return 0
+
+    fake = fake_openai.serve(0, latency=args.latency, jitter=args.jitter, server_error_rate=args.error_rate)
+    port = free_port()
+    workdir = tempfile.mkdtemp(prefix="digiform-load-")
+    env = dict(os.environ)
+    env.update(
+        OPENAI_BASE_URL=f"http://127.0.0.1:{fake.server_port}/v1",
+        OPENAI_API_KEY=env.get("OPENAI_API_KEY", "benchmark"),
+        DATABASE_URL=env.get("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'load.db')}"),
+        ARTIFACT_DIR=os.path.join(workdir, "artifacts"),
+        JOB_BACKEND="",
+        UPSTREAM_RPM=env.get("UPSTREAM_RPM", "0"),
+        UPSTREAM_TPM=env.get("UPSTREAM_TPM", "0"),
+    )
+    command = [sys.executable, __file__, "--serve", str(port)] + (["--fake-redis"] if args.fake_redis else [])
+    server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_for(base_url + "/", server)
+        variants = document_variants(args.uploads)
+        artifact_ids = []
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        with httpx.Client(base_url=base_url, timeout=120, limits=limits) as client:
+            def register(n):
+                response = client.post("/digiform", data={
+                    "fullName": f"Applicant {n}",
+                    "phoneNumber": str(9000000000 + n),
+                    "emailId": f"load{n}@example.com",
+                })
+                return response.status_code == 302
+
+            def upload(n):
+                response = client.post("/upload", files=variants[n])
+                match = re.search(r"/pdf/([0-9a-f]{64})", response.text)
+                if response.status_code != 200 or not match:
+                    return False
+                artifact_ids.append(match.group(1))
+                return True
+
+            def download(n):
+                response = client.get(f"/download_pdf/{artifact_ids[n % len(artifact_ids)]}")
+                return response.status_code == 200 and response.content.startswith(b"%PDF")
+
+            print(
+                f"concurrency {args.concurrency}, fake model {args.latency}s±{args.jitter}s, "
+                f"{args.error_rate:.0%} upstream errors"
+            )
+            results = dict([
+                run_load("POST /digiform", register, args.registrations, args.concurrency),
+                run_load("POST /upload", upload, args.uploads, args.concurrency),
+            ])
+            if artifact_ids:
+                results.update([run_load("GET /download_pdf/<id>", download, args.downloads, args.concurrency)])
+    finally:
+        server.terminate()
+        server.wait()
+        fake.shutdown()
+
+    bench_results.print_table(results)
+    config = {key: value for key, value in vars(args).items() if key not in ("compare", "serve", "threshold")}
+    # Loaded before saving, so comparing with the current commit uses the previous run
+    baseline = bench_results.load("load_test", args.compare) if args.compare else None
+    print(f"\nsaved {bench_results.save('load_test', config, results)}")
+    if baseline:
+        return 1 if bench_results.compare(results, baseline, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
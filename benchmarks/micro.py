@@ -0,0 +1,118 @@
+"""Micro-benchmarks of the per-document helpers in app.py.
+
+    python benchmarks/micro.py
+    python benchmarks/micro.py --sizes 800,1600,4000 --compare HEAD~1
+
+Times process_output on the canned model answers for each document type,
+generate_pdf on unique inputs (memoization off), generate_cache_key, and
+encode_image and document_image on JPEGs resized from the sample marksheet to
+each --sizes longest edge. Each benchmark runs for at least --min-time seconds.
+Results are printed as p50/p95/p99 and calls per second and saved under
+benchmarks/results/<commit>/micro.json.
+"""
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+from PIL import Image
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCHMARKS)
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'digiform-micro.db')}")
+os.environ["PDF_CACHE_SIZE"] = "0"
+
+import bench_results  # noqa: E402
+import fake_openai  # noqa: E402
+from app import (  # noqa: E402
+    DOCUMENTS,
+    document_image,
+    encode_image,
+    generate_cache_key,
+    generate_pdf,
+    process_output,
+)
+
+SAMPLE = os.path.join(ROOT, "experiments", "gradio_app", "sample_images", "12marksheet.jpeg")
+CANNED = dict(zip([field for field, _ in DOCUMENTS], fake_openai.CANNED.values()))
+
+
+def measure(function, inputs, min_time):
+    # Calls function over inputs round-robin; returns (latencies, elapsed)
+    latencies = []
+    start = time.perf_counter()
+    n = 0
+    while time.perf_counter() - start < min_time or n < 20:
+        argument = inputs[n % len(inputs)]
+        call_start = time.perf_counter()
+        function(argument)
+        latencies.append(time.perf_counter() - call_start)
+        n += 1
+    return latencies, time.perf_counter() - start
+
+
+def resized_jpeg(edge):
+    image = Image.open(SAMPLE).convert("RGB")
+    scale = edge / max(image.size)
+    image = image.resize((round(image.width * scale), round(image.height * scale)), Image.LANCZOS)
+    buffer = BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def pdf_inputs(count):
+    inputs = []
+    for n in range(count):
+        output_data = []
+        for field, answer in CANNED.items():
+            main_data, subject_data = process_output(dict(answer, seat_number=f"S{n:06d}"), field)
+            output_data.append({"main": main_data, "subjects": subject_data})
+        inputs.append(output_data)
+    return inputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="640,1600,3000,4000", help="longest image edges in pixels")
+    parser.add_argument("--min-time", type=float, default=1.0, help="seconds per benchmark")
+    parser.add_argument("--compare", metavar="REF", help="compare with results recorded for this commit")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    results = {}
+
+    def run(name, function, inputs):
+        latencies, elapsed = measure(function, inputs, args.min_time)
+        results[name] = bench_results.summarize(latencies, elapsed)
+
+    for field, answer in CANNED.items():
+        run(f"process_output {field}", lambda answer, field=field: process_output(answer, field), [answer])
+    run("generate_pdf (unique)", generate_pdf, pdf_inputs(500))
+    digests = [hashlib.sha256(str(n).encode()).hexdigest() for n in range(1000)]
+    prompt = DOCUMENTS[1][1]
+    run("generate_cache_key", lambda digest: generate_cache_key(digest, prompt), digests)
+    for edge in sizes:
+        data = resized_jpeg(edge)
+        label = f"{edge}px, {len(data) // 1024} KB"
+        run(f"encode_image {label}", encode_image, [data])
+        run(f"document_image {label}", document_image, [data])
+
+    bench_results.print_table(results, unit="calls/s")
+    # Loaded before saving, so comparing with the current commit uses the previous run
+    baseline = bench_results.load("micro", args.compare) if args.compare else None
+    print(f"\nsaved {bench_results.save('micro', vars(args), results)}")
+    if baseline:
+        return 1 if bench_results.compare(results, baseline, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
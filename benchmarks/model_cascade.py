@@ -0,0 +1,188 @@
+"""Latency, cost and answer quality of the model cascade against single models.
+
+    python benchmarks/model_cascade.py --fake-redis
+    python benchmarks/model_cascade.py --fake-redis --degraded-rate 0.3 --min-issues 1 2 3
+
+Runs extract_documents from app.py in-process for --applicants applicants
+with all three documents each, against benchmarks/fake_openai.py. The fake
+answers as --cheap would on hard scans: for --degraded-rate of the images it
+leaves one to three fields "Not Available". --strong always answers in full
+but takes longer (--cheap-latency, --strong-latency). Configurations:
+
+    <cheap> only                 the default single model
+    <strong> only                every document on the stronger model
+    cascade, min issues N        --cheap first, --strong for answers with at
+                                 least N quality issues, for each --min-issues
+
+Every configuration uses the same images under its own cache key version,
+so none of them starts with a warm cache. A --resubmit share of the
+applicants then submits again, which shows the cache hit rate per model.
+Cost uses cascade.PRICES and the usage the fake estimates from each
+request. "N/A fields" counts fields still "Not Available" in the final
+answers. Results are saved under benchmarks/results/<commit>/cascade.json.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCHMARKS)
+
+import bench_results  # noqa: E402
+import fake_openai  # noqa: E402
+from combined_extraction import applicant_slots  # noqa: E402
+from load_test import document_variants  # noqa: E402
+
+
+def load_app(base_url, fake_redis):
+    workdir = tempfile.mkdtemp(prefix="digiform-cascade-")
+    os.environ.update(
+        OPENAI_BASE_URL=base_url,
+        OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "benchmark"),
+        DATABASE_URL=os.getenv("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'cascade.db')}"),
+        ARTIFACT_DIR=os.path.join(workdir, "artifacts"),
+        JOB_BACKEND="",
+        UPSTREAM_RPM="0",
+        UPSTREAM_TPM="0",
+        PREFILTER_ENABLED="0",
+        LOG_LEVEL="WARNING",
+    )
+    if fake_redis:
+        import bench_redis
+
+        bench_redis.use_fakeredis()
+    import app as app_module
+
+    app_module.init_db()
+    return app_module
+
+
+def not_available(results):
+    return sum(
+        row["Value"] == "Not Available"
+        for result in results if "main" in result
+        for row in result["main"]
+    )
+
+
+def run_config(app_module, fake, models, min_issues, slots, args, version):
+    from cascade import Cascade
+
+    app_module.cascade = Cascade(models, min_issues=min_issues)
+    # A cache key version of its own, so earlier configurations' answers are not reused
+    app_module.CACHE_KEY_VERSION = version
+    before = fake.stats["requests"]
+    latencies, missing, errors = [], 0, 0
+
+    def applicant(n):
+        start = time.perf_counter()
+        results = app_module.extract_documents(slots[n])
+        return results, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for results, latency in pool.map(applicant, range(len(slots))):
+            if any("error" in result for result in results):
+                errors += 1
+            else:
+                latencies.append(latency)
+            missing += not_available(results)
+    elapsed = time.perf_counter() - start
+    calls = fake.stats["requests"] - before
+    first = app_module.cascade.stats()
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(applicant, range(int(len(slots) * args.resubmit))))
+    tiers = app_module.cascade.stats()
+
+    summary = bench_results.summarize(latencies, elapsed, errors)
+    summary.update(
+        calls_per_applicant=round(calls / len(slots), 2),
+        cost_per_applicant_usd=round(sum(tier["cost_usd"] for tier in first.values()) / len(slots), 6),
+        # Time spent on the stronger models, on top of the first model's answer
+        added_ms_per_applicant=round(
+            sum(tier["seconds"] for tier in first.values() if tier["tier"]) / len(slots) * 1000, 1
+        ),
+        escalation_rate=first[models[0]]["escalation_rate"],
+        not_available_per_applicant=round(missing / len(slots), 2),
+        tiers=tiers,
+    )
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--applicants", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=4, help="applicants extracted at once")
+    parser.add_argument("--cheap", default="gpt-4o-mini", help="first model of the cascade")
+    parser.add_argument("--strong", default="gpt-4o", help="model answers are escalated to")
+    parser.add_argument("--cheap-latency", type=float, default=0.5, help="fake seconds per --cheap call")
+    parser.add_argument("--strong-latency", type=float, default=1.5, help="fake seconds per --strong call")
+    parser.add_argument("--degraded-rate", type=float, default=0.2,
+                        help="share of images --cheap answers with missing fields")
+    parser.add_argument("--min-issues", type=int, nargs="+", default=[1, 2, 3], help="CASCADE_MIN_ISSUES to try")
+    parser.add_argument("--resubmit", type=float, default=0.5, help="share of applicants that submit again")
+    parser.add_argument("--fake-redis", action="store_true", help="use fakeredis instead of REDIS_URL")
+    parser.add_argument("--compare", metavar="REF", help="compare with results recorded for this commit")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    server = fake_openai.serve(
+        0,
+        model_latency={args.cheap: args.cheap_latency, args.strong: args.strong_latency},
+        weak_models=[args.cheap],
+        degraded_rate=args.degraded_rate,
+    )
+    app_module = load_app(f"http://127.0.0.1:{server.server_port}/v1", args.fake_redis)
+    slots = applicant_slots(app_module, document_variants(args.applicants))
+
+    configs = [(f"{args.cheap} only", [args.cheap], 1), (f"{args.strong} only", [args.strong], 1)]
+    configs += [(f"cascade, min issues {n}", [args.cheap, args.strong], n) for n in args.min_issues]
+    results = {}
+    try:
+        for n, (name, models, min_issues) in enumerate(configs):
+            results[name] = run_config(app_module, server.fake, models, min_issues, slots, args, 1000 + n)
+    finally:
+        server.shutdown()
+
+    print(
+        f"{args.applicants} applicants x 3 documents, concurrency {args.concurrency}; {args.cheap} "
+        f"{args.cheap_latency}s and misses fields on {args.degraded_rate:.0%} of images, "
+        f"{args.strong} {args.strong_latency}s\n"
+    )
+    bench_results.print_table(results, unit="applicants/s")
+    print(f"\n{'':<36}{'calls':>8}{'$/1000':>10}{'added ms':>10}{'escalated':>11}{'N/A fields':>12}")
+    for name, summary in results.items():
+        print(
+            f"{name:<36}{summary['calls_per_applicant']:>8.2f}{summary['cost_per_applicant_usd'] * 1000:>10.3f}"
+            f"{summary['added_ms_per_applicant']:>10.0f}{summary['escalation_rate']:>11.1%}"
+            f"{summary['not_available_per_applicant']:>12.2f}"
+        )
+    print("\nper applicant; escalated is the share of documents the first model passed on")
+    print(f"\n{'model, after re-submissions':<36}{'documents':>10}{'cache hits':>12}{'escalated':>11}  issues")
+    for name, summary in results.items():
+        if len(summary["tiers"]) < 2:
+            continue
+        print(name)
+        for model, tier in summary["tiers"].items():
+            issues = ", ".join(f"{issue} {count}" for issue, count in sorted(tier["issues"].items()))
+            print(
+                f"  {model:<34}{tier['documents']:>10}{tier['cache_hit_rate']:>12.1%}"
+                f"{tier['escalation_rate']:>11.1%}  {issues}"
+            )
+
+    config = {key: value for key, value in vars(args).items() if key not in ("compare", "threshold")}
+    baseline = bench_results.load("cascade", args.compare) if args.compare else None
+    print(f"\nsaved {bench_results.save('cascade', config, results)}")
+    if baseline:
+        return 1 if bench_results.compare(results, baseline, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
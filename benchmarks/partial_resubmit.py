@@ -0,0 +1,154 @@
+"""Latency and upstream calls of fixing one document after a full upload.
+
+    python benchmarks/partial_resubmit.py                     # Redis at REDIS_URL
+    python benchmarks/partial_resubmit.py --fake-redis --applicants 20 --latency 2
+
+Each of --applicants applicants registers through /digiform and uploads all
+three documents, the way the form is first filled in. Then they replace a
+blurry 12th marksheet, and only this second POST /upload is measured, in one
+of three ways:
+
+    full re-submit            all three files again, the identity document
+                              and 10th marksheet unchanged, so they are
+                              served from the extraction cache
+    full re-submit, expired   the same after the cached extractions expired,
+                              so all three go to the model again
+    partial re-submit         only the new 12th marksheet; the other sections
+                              come from the registration's stored results
+
+The app runs in-process behind Flask's test client against
+benchmarks/fake_openai.py. Each applicant uses its own pixel-altered sample
+images. Latency percentiles, upstream calls and bytes uploaded per fix are
+printed and saved under benchmarks/results/<commit>/partial_resubmit.json.
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCHMARKS)
+
+import bench_results  # noqa: E402
+import fake_openai  # noqa: E402
+from load_test import document_variants  # noqa: E402
+
+MODES = ["full re-submit", "full re-submit, expired", "partial re-submit"]
+FIXED_FIELD = "twelfthMarksheet"
+
+
+def load_app(base_url, fake_redis):
+    workdir = tempfile.mkdtemp(prefix="digiform-partial-")
+    os.environ.update(
+        OPENAI_BASE_URL=base_url,
+        OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "benchmark"),
+        DATABASE_URL=os.getenv("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'partial.db')}"),
+        ARTIFACT_DIR=os.path.join(workdir, "artifacts"),
+        JOB_BACKEND="",
+        UPSTREAM_RPM="0",
+        UPSTREAM_TPM="0",
+        LOG_LEVEL="WARNING",
+    )
+    if fake_redis:
+        import bench_redis
+
+        bench_redis.use_fakeredis()
+    import app as app_module
+
+    app_module.init_db()
+    app_module.limiter.enabled = False
+    return app_module
+
+
+def upload(client, files):
+    # Posts the form and returns (bytes uploaded, ok)
+    data = {field: (BytesIO(content), name, mime) for field, (name, content, mime) in files.items()}
+    response = client.post("/upload", data=data, content_type="multipart/form-data")
+    ok = response.status_code == 200 and re.search(rb"/pdf/\w+", response.data) is not None
+    return sum(len(content) for _, content, _ in files.values()), ok
+
+
+def run_mode(app_module, fake, mode, first, fixed, applicant_offset):
+    tiers = app_module.cache.tiers
+    latencies, calls, uploaded, errors = [], 0, 0, 0
+    start = time.perf_counter()
+    for n, (files, fix) in enumerate(zip(first, fixed)):
+        client = app_module.app.test_client()
+        client.post("/digiform", data={
+            "fullName": f"Applicant {applicant_offset + n}",
+            "phoneNumber": f"{9000000000 + applicant_offset + n}",
+            "emailId": f"applicant{applicant_offset + n}@example.com",
+        })
+        _, ok = upload(client, files)
+        if not ok:
+            errors += 1
+            continue
+
+        if mode == "partial re-submit":
+            resubmit = {FIXED_FIELD: fix[FIXED_FIELD]}
+        else:
+            resubmit = dict(files, **{FIXED_FIELD: fix[FIXED_FIELD]})
+        if mode == "full re-submit, expired":
+            app_module.cache.tiers = []
+        before = fake.stats["requests"]
+        began = time.perf_counter()
+        try:
+            size, ok = upload(client, resubmit)
+        finally:
+            app_module.cache.tiers = tiers
+        if ok:
+            latencies.append(time.perf_counter() - began)
+        else:
+            errors += 1
+        calls += fake.stats["requests"] - before
+        uploaded += size
+    summary = bench_results.summarize(latencies, time.perf_counter() - start, errors)
+    summary["calls_per_fix"] = round(calls / len(first), 2)
+    summary["kb_uploaded_per_fix"] = round(uploaded / len(first) / 1024, 1)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--applicants", type=int, default=10, help="applicants per mode")
+    parser.add_argument("--latency", type=float, default=1.0, help="fake model latency in seconds")
+    parser.add_argument("--fake-redis", action="store_true", help="use fakeredis instead of REDIS_URL")
+    parser.add_argument("--compare", metavar="REF", help="compare with results recorded for this commit")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    server = fake_openai.serve(0, latency=args.latency)
+    app_module = load_app(f"http://127.0.0.1:{server.server_port}/v1", args.fake_redis)
+    # A first upload and a replacement 12th marksheet per applicant and mode
+    variants = document_variants(args.applicants * len(MODES) * 2)
+
+    results = {}
+    try:
+        for n, mode in enumerate(MODES):
+            first = variants[2 * n * args.applicants:(2 * n + 1) * args.applicants]
+            fixed = variants[(2 * n + 1) * args.applicants:(2 * n + 2) * args.applicants]
+            results[mode] = run_mode(app_module, server.fake, mode, first, fixed, n * args.applicants)
+    finally:
+        server.shutdown()
+
+    print(f"{args.applicants} applicants per mode replace their 12th marksheet, fake model {args.latency}s\n")
+    bench_results.print_table(results, unit="fixes/s")
+    print(f"\n{'':<36}{'calls/fix':>10}{'KB uploaded':>13}")
+    for mode, summary in results.items():
+        print(f"{mode:<36}{summary['calls_per_fix']:>10.1f}{summary['kb_uploaded_per_fix']:>13.0f}")
+
+    config = {key: value for key, value in vars(args).items() if key not in ("compare", "threshold")}
+    baseline = bench_results.load("partial_resubmit", args.compare) if args.compare else None
+    print(f"\nsaved {bench_results.save('partial_resubmit', config, results)}")
+    if baseline:
+        return 1 if bench_results.compare(results, baseline, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""PDF rendering throughput (PDFs per second) at 1, 4 and 16 concurrent renders.
+
+    python benchmarks/pdf_throughput.py
+    python benchmarks/pdf_throughput.py --processes 4
+
+Three configurations are measured: every render unique (the compiled
+template only), every render a repeat (memoized), and unique renders sent to
+a process pool when --processes is given. The legacy row rebuilds the
+stylesheet and table styles on every call, as generate_pdf used to.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_render import ApplicationPdfTemplate, PdfRenderer  # noqa: E402
+
+
+def sample_output(n):
+    personal = [
+        {"Field": "Full Name", "Value": f"Applicant {n}"},
+        {"Field": "Fathers Name", "Value": "Not Available"},
+        {"Field": "Date of Birth", "Value": "01/01/2006"},
+        {"Field": "Address", "Value": "12, MG Road, Pune, Maharashtra 411001"},
+        {"Field": "Aadhar Number", "Value": "1234 5678 9012"},
+        {"Field": "Gender", "Value": "Female"},
+    ]
+    subjects = [
+        {"Subject": subject, "Score": 60 + (n + i) % 40}
+        for i, subject in enumerate(["English", "Hindi", "Mathematics", "Science", "Social Science"])
+    ]
+    marks = [
+        {"Field": "Seat Number", "Value": f"S{n:06d}"},
+        {"Field": "Year of Passing", "Value": "2022"},
+        {"Field": "Total Marks Obtained", "Value": "420"},
+        {"Field": "Percentage", "Value": "84%"},
+    ]
+    return [
+        {"main": personal, "subjects": None},
+        {"main": marks, "subjects": subjects},
+        {"main": marks, "subjects": subjects},
+    ]
+
+
+def throughput(render, concurrency, total, unique):
+    ids = count()
+    inputs = [sample_output(next(ids) if unique else 0) for _ in range(total)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(render, inputs))
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--renders", type=int, default=200, help="PDFs rendered per measurement")
+    parser.add_argument("--processes", type=int, default=0, help="also measure a process pool of this size")
+    args = parser.parse_args()
+
+    configurations = [
+        ("legacy (template per call)", lambda data: ApplicationPdfTemplate().render(data), True),
+        ("compiled template", PdfRenderer(cache_size=0).render, True),
+        ("memoized repeat", PdfRenderer(cache_size=256).render, False),
+    ]
+    if args.processes:
+        pool_renderer = PdfRenderer(cache_size=0, processes=args.processes)
+        pool_renderer.render(sample_output(0))  # start the pool outside the timing
+        configurations.append((f"process pool ({args.processes})", pool_renderer.render, True))
+
+    levels = [1, 4, 16]
+    print(f"{'configuration':<28}" + "".join(f"{f'{n} concurrent':>16}" for n in levels))
+    for name, render, unique in configurations:
+        rates = [throughput(render, n, args.renders, unique) for n in levels]
+        print(f"{name:<28}" + "".join(f"{rate:>11.1f} PDF/s" for rate in rates))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+"""Hit rate, false-match rate and lookup speed of the perceptual cache index.
+
+    python benchmarks/perceptual_cache_eval.py --fake-redis
+    python benchmarks/perceptual_cache_eval.py --fake-redis --max-distance 2 4 8 --max-difference 0.05 0.08 1
+    python benchmarks/perceptual_cache_eval.py --labels pairs/pairs.csv --index-size 1000000
+
+The default set is built from experiments/gradio_app/sample_images. Each
+sample is indexed, then queried with:
+- re-encodings that should hit: JPEG at several qualities, PNG, WebP, a
+  WhatsApp-style 1600 pixel JPEG at quality 70, downscales, a double re-save
+- re-scans that should hit: the sample turned by up to a degree, shifted by
+  a few pixels, a little lighter or darker and softer (--rescans per sample)
+- second photos that should hit: two simulated phone photos of the sample,
+  each at a slight angle with its own framing, lighting falloff and size;
+  the first is indexed, the second queried (--photos per sample)
+- edited copies that must not hit: the same document with one to three
+  fields overwritten with other text, as another applicant's copy of the
+  same form would be
+
+--labels reads a CSV of original,variant,same (yes/no) instead, with paths
+relative to the CSV. Every image is normalized first, as uploads are, to at
+most 1600 pixels and JPEG quality 85. Every pair of --max-distance and
+--max-difference is evaluated; a --max-difference of 1 accepts any dHash
+candidate. The hit rate is also broken down by kind of copy.
+
+The index is then filled with --index-size entries clustered the way real
+uploads are: each is the dHash of an edited copy of a sample (another
+applicant's copy of the same form), with a bit flipped in half of them. The
+time of a lookup and the entries it reads are measured against a linear scan
+of the same hashes in memory, and the same-document pairs are looked up again
+with their original indexed before the fill, i.e. behind --index-size copies
+of its form, and after it. Results are saved under
+benchmarks/results/<commit>/perceptual.json.
+"""
+import argparse
+import csv
+import hashlib
+import os
+import random
+import struct
+import sys
+import time
+from io import BytesIO
+
+from PIL import Image, ImageChops, ImageDraw, ImageEnhance, ImageFilter, ImageFont
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+SAMPLES = os.path.join(ROOT, "experiments", "gradio_app", "sample_images")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCHMARKS)
+
+import bench_results  # noqa: E402
+from perceptual_index import PerceptualIndex, fingerprint  # noqa: E402
+
+SAMPLE_NAMES = ["aadhar-card.jpg", "10marksheet.jpeg", "12marksheet.jpeg"]
+
+
+def encode(image, format="JPEG", **options):
+    buffer = BytesIO()
+    image.convert("RGB").save(buffer, format, **options)
+    return buffer.getvalue()
+
+
+def normalized(data, max_edge=1600, quality=85):
+    # As normalize_image() does with the default IMAGE_MAX_EDGE and IMAGE_JPEG_QUALITY
+    image = Image.open(BytesIO(data)).convert("RGB")
+    image.thumbnail((max_edge, max_edge))
+    return encode(image, quality=quality)
+
+
+def fit(image, edge):
+    image = image.copy()
+    image.thumbnail((edge, edge))
+    return image
+
+
+def text_bands(image):
+    # (top, bottom) of each run of rows with dark pixels, i.e. lines of text
+    gray = image.convert("L")
+    pixels = gray.load()
+    dark = [sum(pixels[x, y] < 110 for x in range(0, gray.width, 2)) > 2 for y in range(gray.height)]
+    bands, top = [], None
+    for y, is_dark in enumerate(dark + [False]):
+        if is_dark and top is None:
+            top = y
+        elif not is_dark and top is not None:
+            if y - top >= 4:
+                bands.append((top, y))
+            top = None
+    return bands
+
+
+def edited(image, fields, seed):
+    # The same form with other text in some fields
+    rng = random.Random(seed)
+    image = image.copy()
+    draw = ImageDraw.Draw(image)
+    bands = text_bands(image)
+    for _ in range(fields):
+        top, bottom = rng.choice(bands)
+        width = max(20, int(image.width * rng.uniform(0.05, 0.15)))
+        left = rng.randint(0, image.width - width)
+        draw.rectangle((left, top, left + width, bottom), fill=(250, 250, 250))
+        text = "".join(rng.choice("0123456789ABCDEFGHKLMNPRSTUVWXYZ") for _ in range(max(2, width // max(6, (bottom - top) // 2))))
+        draw.text((left, top), text, fill=(20, 20, 20), font=ImageFont.load_default(size=max(8, bottom - top)))
+    return image
+
+
+def rescanned(image, seed):
+    # The same page through the scanner again
+    rng = random.Random(seed)
+    image = image.rotate(rng.uniform(-1, 1), Image.BICUBIC, translate=(rng.randint(-4, 4), rng.randint(-4, 4)),
+                         fillcolor=(255, 255, 255))
+    image = ImageEnhance.Brightness(image).enhance(rng.uniform(0.93, 1.07))
+    image = ImageEnhance.Contrast(image).enhance(rng.uniform(0.9, 1.1))
+    return image.filter(ImageFilter.GaussianBlur(rng.uniform(0.3, 0.8)))
+
+
+def photographed(image, seed):
+    # A phone photo of the document: a slight angle (each corner moved by up
+    # to 4% of the page), the table around it showing where the page is
+    # framed loosely, light falling off to one side, and the camera's size
+    rng = random.Random(seed)
+    width, height = image.size
+    corners = []
+    for x, y in ((0, 0), (0, height), (width, height), (width, 0)):
+        corners += [x + rng.uniform(-0.04, 0.04) * width, y + rng.uniform(-0.04, 0.04) * height]
+    photo = image.transform(image.size, Image.QUAD, corners, Image.BICUBIC, fillcolor=(120, 110, 100))
+    falloff = Image.linear_gradient("L").resize(photo.size).rotate(rng.choice([0, 90, 180, 270]))
+    light = falloff.point(lambda value: 255 - int(value * rng.uniform(0.1, 0.25)))
+    photo = ImageChops.multiply(photo, Image.merge("RGB", [light] * 3))
+    scale = rng.uniform(0.8, 1.25)
+    photo = photo.resize((round(width * scale), round(height * scale)), Image.BICUBIC)
+    return photo.filter(ImageFilter.GaussianBlur(rng.uniform(0.4, 1.0)))
+
+
+def builtin_set(edits, rescans, photos):
+    # [(label, kind, original bytes, variant bytes, same document)]
+    pairs = []
+    for name in SAMPLE_NAMES:
+        image = Image.open(os.path.join(SAMPLES, name)).convert("RGB")
+        original = encode(image, quality=92)
+        variants = {
+            "JPEG q90": encode(image, quality=90),
+            "JPEG q70": encode(image, quality=70),
+            "JPEG q50": encode(image, quality=50),
+            "JPEG q35": encode(image, quality=35),
+            "PNG": encode(image, "PNG"),
+            "WebP q80": encode(image, "WEBP", quality=80),
+            "WhatsApp": encode(fit(image, 1600), quality=70, subsampling=2),
+            "downscaled 75%": encode(image.resize((image.width * 3 // 4, image.height * 3 // 4), Image.LANCZOS)),
+            "downscaled 50%": encode(image.resize((image.width // 2, image.height // 2), Image.LANCZOS)),
+            "re-saved twice": encode(Image.open(BytesIO(encode(image, quality=80))), quality=75),
+        }
+        for variant, data in variants.items():
+            kind = "downscaled" if variant.startswith("downscaled") else "re-encoded"
+            pairs.append((f"{name} {variant}", kind, original, data, True))
+        for n in range(rescans):
+            pairs.append((f"{name} re-scanned #{n}", "re-scanned", original, encode(rescanned(image, n)), True))
+        for n in range(photos):
+            first, second = photographed(image, 2 * n), photographed(image, 2 * n + 1)
+            pairs.append((f"{name} photographed twice #{n}", "photographed twice",
+                          encode(first, quality=90), encode(second, quality=90), True))
+        for n in range(edits):
+            fields = 1 + n % 3
+            pairs.append((f"{name} {fields} fields edited #{n}", "edited", original,
+                          encode(edited(image, fields, n)), False))
+    return pairs
+
+
+def labeled_set(path):
+    base = os.path.dirname(os.path.abspath(path))
+
+    def read(relative):
+        with open(os.path.join(base, relative), "rb") as image:
+            return image.read()
+
+    with open(path, newline="") as labels:
+        pairs = []
+        for row in csv.DictReader(labels):
+            same = row["same"].strip().lower() in ("yes", "true", "1")
+            pairs.append((f"{row['original']} / {row['variant']}", "same" if same else "different",
+                          read(row["original"]), read(row["variant"]), same))
+        return pairs
+
+
+def evaluate(redis_client, pairs, max_distance, max_difference, run):
+    # ({kind: hits among its same-document pairs}, false matches among the
+    # others, labels of misses, labels of false matches)
+    index = PerceptualIndex(redis_client, max_distance, max_difference, prefix=f"phash-eval-{run}")
+    indexed = set()
+    for _, _, original, _, _ in pairs:
+        key = hashlib.sha256(original).hexdigest()
+        if key not in indexed:
+            indexed.add(key)
+            index.add("eval", key, fingerprint(normalized(original)))
+    hits, false_matches, misses, wrong = {}, 0, [], []
+    for label, kind, original, variant, same in pairs:
+        match, _ = index.lookup("eval", fingerprint(normalized(variant)))
+        if same:
+            hit = match == hashlib.sha256(original).hexdigest()
+            hits[kind] = hits.get(kind, 0) + hit
+            if not hit:
+                misses.append(label)
+        elif match is not None:
+            false_matches += 1
+            wrong.append(label)
+    return hits, false_matches, misses, wrong
+
+
+def cluster_seeds(pairs):
+    # dHashes of the different-document variants (the edited copies), or of
+    # the originals when there are none, to fill the index around
+    seeds = {fingerprint(normalized(variant)).dhash for _, _, _, variant, same in pairs if not same}
+    return sorted(seeds or {fingerprint(normalized(original)).dhash for _, _, original, _, _ in pairs})
+
+
+def fill(redis_client, index, count, seeds, expires, batch=10000):
+    # Entries in one namespace around the seeds, newer ones scored later; their
+    # signatures are never stored, so they crowd the buckets but never match
+    rng = random.Random(0)
+    hashes = []
+    for first in range(0, count, batch):
+        pipe = redis_client.pipeline(transaction=False)
+        for n in range(first, min(count, first + batch)):
+            dhash = rng.choice(seeds)
+            if rng.random() < 0.5:
+                dhash ^= 1 << rng.randrange(64)
+            hashes.append(dhash)
+            member = struct.pack(">Q", dhash) + rng.randbytes(32)
+            for bucket in index._buckets("scale", dhash):
+                pipe.zadd(bucket, {member: expires + n / 1000})
+        pipe.execute()
+    return hashes
+
+
+def same_document_hits(index, pairs, ttl, suffix):
+    # Share of the same-document pairs found after indexing every original
+    # again under a fresh content hash that expires ttl seconds from now
+    index.ttl = ttl
+    originals = {}
+    for _, _, original, _, _ in pairs:
+        key = hashlib.sha256(original + suffix).hexdigest()
+        if key not in originals:
+            originals[key] = original
+            index.add("scale", key, fingerprint(normalized(original)))
+    hits, same = 0, 0
+    for _, _, original, variant, is_same in pairs:
+        if is_same:
+            same += 1
+            match, _ = index.lookup("scale", fingerprint(normalized(variant)))
+            hits += match == hashlib.sha256(original + suffix).hexdigest()
+    return hits / same if same else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--labels", help="CSV of original,variant,same")
+    parser.add_argument("--edits", type=int, default=12, help="edited copies per sample")
+    parser.add_argument("--rescans", type=int, default=4, help="re-scans per sample")
+    parser.add_argument("--photos", type=int, default=4, help="pairs of photos per sample")
+    parser.add_argument("--max-distance", type=int, nargs="+", default=[2, 4, 6, 8])
+    parser.add_argument("--max-difference", type=float, nargs="+", default=[0.05, 0.08, 0.12, 1.0])
+    parser.add_argument("--index-size", type=int, default=100000, help="clustered entries for the lookup timing")
+    parser.add_argument("--lookups", type=int, default=200, help="timed lookups")
+    parser.add_argument("--fake-redis", action="store_true", help="use fakeredis instead of REDIS_URL")
+    parser.add_argument("--verbose", action="store_true", help="print every miss and false match")
+    parser.add_argument("--compare", metavar="REF", help="compare with results recorded for this commit")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    if args.fake_redis:
+        import fakeredis
+
+        redis_client = fakeredis.FakeRedis()
+    else:
+        import redis
+
+        redis_client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    pairs = labeled_set(args.labels) if args.labels else builtin_set(args.edits, args.rescans, args.photos)
+    kinds = {}
+    for _, kind, _, _, is_same in pairs:
+        if is_same:
+            kinds[kind] = kinds.get(kind, 0) + 1
+    same = sum(kinds.values())
+    different = len(pairs) - same
+    print(f"{len(pairs)} pairs: {same} of the same document, {different} of different ones")
+    print("hit rate by kind: " + ", ".join(f"{kind} ({count})" for kind, count in kinds.items()) + "\n")
+
+    results = {}
+    print(f"{'max distance':>12}{'max difference':>16}{'hit rate':>10}{'false matches':>15}  by kind")
+    run = 0
+    for max_distance in args.max_distance:
+        for max_difference in args.max_difference:
+            run += 1
+            hits, false_matches, misses, wrong = evaluate(redis_client, pairs, max_distance, max_difference, run)
+            hit_rate = sum(hits.values()) / same if same else 0.0
+            false_rate = false_matches / different if different else 0.0
+            by_kind = {kind: round(hits.get(kind, 0) / count, 4) for kind, count in kinds.items()}
+            print(
+                f"{max_distance:>12}{max_difference:>16.2f}{hit_rate:>10.1%}{false_rate:>15.1%}  "
+                + " ".join(f"{rate:>6.0%}" for rate in by_kind.values())
+            )
+            if args.verbose:
+                for label in misses:
+                    print(f"    missed {label}")
+                for label in wrong:
+                    print(f"    FALSE MATCH {label}")
+            results[f"distance {max_distance}, difference {max_difference:g}"] = {
+                "hit_rate": round(hit_rate, 4), "false_match_rate": round(false_rate, 4), "hit_rate_by_kind": by_kind,
+            }
+
+    # Lookup speed and hit rate as copies of the same forms pile up in the
+    # index, at the default settings
+    index = PerceptualIndex(redis_client, prefix="phash-eval-scale")
+    before = same_document_hits(index, pairs, 60, b"before")
+    start = time.perf_counter()
+    hashes = fill(redis_client, index, args.index_size, cluster_seeds(pairs), time.time() + 3600)
+    print(f"\n{args.index_size} entries clustered around {len(set(hashes))} hashes indexed "
+          f"in {time.perf_counter() - start:.1f}s")
+    queries = [fingerprint(normalized(variant)) for _, _, _, variant, _ in pairs]
+    lookups, scans, read, stored = [], [], 0, 0
+    for n in range(args.lookups):
+        query = queries[n % len(queries)]
+        lookup_start = time.perf_counter()
+        index.lookup("scale", query)
+        lookups.append(time.perf_counter() - lookup_start)
+        scan_start = time.perf_counter()
+        [dhash for dhash in hashes if (dhash ^ query.dhash).bit_count() <= index.max_distance]
+        scans.append(time.perf_counter() - scan_start)
+        sizes = [redis_client.zcard(bucket) for bucket in index._buckets("scale", query.dhash)]
+        read += sum(min(size, index.bucket_limit) for size in sizes)
+        stored += sum(sizes)
+    behind = same_document_hits(index, pairs, 60, b"behind")
+    after = same_document_hits(index, pairs, 7200, b"after")
+    results["lookup, multi-index"] = bench_results.summarize(lookups, sum(lookups))
+    results["lookup, multi-index"]["entries_compared"] = round(read / args.lookups, 1)
+    results["lookup, multi-index"]["bucket_entries"] = round(stored / args.lookups, 1)
+    results["linear scan in memory"] = bench_results.summarize(scans, sum(scans))
+    results["linear scan in memory"]["entries_compared"] = len(hashes)
+    results["same-document hit rate"] = {
+        "empty index": round(before, 4),
+        "original behind the fill": round(behind, 4),
+        "original after the fill": round(after, 4),
+    }
+    print(f"{args.lookups} lookups, max distance {index.max_distance}: {read / args.lookups:.0f} entries read "
+          f"of {stored / args.lookups:.0f} in their buckets, {len(hashes)} in the index")
+    print(f"same-document hit rate: {before:.1%} on an empty index, {behind:.1%} with the original "
+          f"behind {args.index_size} copies of its form, {after:.1%} with it indexed after them\n")
+    bench_results.print_table(
+        {name: summary for name, summary in results.items() if "p50_ms" in summary}, unit="lookups/s"
+    )
+
+    if args.fake_redis:
+        redis_client.flushdb()
+    else:
+        for key in redis_client.scan_iter("phash-eval-*"):
+            redis_client.delete(key)
+
+    config = {key: value for key, value in vars(args).items() if key not in ("compare", "threshold", "verbose")}
+    baseline = bench_results.load("perceptual", args.compare) if args.compare else None
+    print(f"\nsaved {bench_results.save('perceptual', config, results)}")
+    if baseline:
+        timed = {name: summary for name, summary in results.items() if "p50_ms" in summary}
+        return 1 if bench_results.compare(timed, baseline, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""False-reject rate, catch rate and latency of the upload pre-filter.
+
+    python benchmarks/prefilter_accuracy.py
+    python benchmarks/prefilter_accuracy.py --labels labeled/labels.csv --min-sharpness 60
+
+The default labeled set is built from experiments/gradio_app/sample_images:
+each sample in its own slot plus variants a phone upload might produce
+(downscaled, slightly rotated, mildly soft, darker) should be accepted; blank,
+washed-out, heavily blurred, tiny, cropped-strip and photo-like images, and
+cards and marksheets in each other's slots, should be rejected. --labels
+reads a CSV of path,document_type,expected (accept/reject) instead, with
+paths relative to the CSV.
+
+Threshold flags mirror the PREFILTER_* settings, so a tuning can be checked
+before it is deployed. Results are saved under
+benchmarks/results/<commit>/prefilter.json.
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from collections import Counter
+from io import BytesIO
+
+from PIL import Image, ImageDraw, ImageEnhance, ImageFilter
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+SAMPLES = os.path.join(ROOT, "experiments", "gradio_app", "sample_images")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCHMARKS)
+
+import bench_results  # noqa: E402
+from prefilter import Prefilter  # noqa: E402
+
+SAMPLE_SLOTS = {
+    "aadhar-card.jpg": "identityDocument",
+    "10marksheet.jpeg": "tenthMarksheet",
+    "12marksheet.jpeg": "twelfthMarksheet",
+}
+
+
+def jpeg(image, quality=85):
+    buffer = BytesIO()
+    image.convert("RGB").save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def fit(image, edge):
+    image = image.copy()
+    image.thumbnail((edge, edge))
+    return image
+
+
+def photo_like(size):
+    # Smooth shapes with no text, standing in for a selfie
+    image = Image.new("RGB", size, (90, 120, 160))
+    draw = ImageDraw.Draw(image)
+    width, height = size
+    draw.ellipse((width * 0.3, height * 0.2, width * 0.7, height * 0.6), fill=(220, 180, 150))
+    draw.rectangle((width * 0.15, height * 0.65, width * 0.85, height), fill=(40, 40, 60))
+    return image.filter(ImageFilter.GaussianBlur(3))
+
+
+def builtin_set():
+    # [(label, document_type, data, expected_reject)]
+    samples = {name: Image.open(os.path.join(SAMPLES, name)).convert("RGB") for name in SAMPLE_SLOTS}
+    cases = []
+    for name, document_type in SAMPLE_SLOTS.items():
+        image = samples[name]
+        variants = {
+            "original": image,
+            "upscaled": image.resize((image.width * 2, image.height * 2), Image.LANCZOS),
+            "downscaled": fit(image, max(image.size) * 3 // 4) if min(image.size) > 300 else image,
+            "rotated 3°": image.rotate(3, expand=True, fillcolor=(255, 255, 255)),
+            "soft": image.filter(ImageFilter.GaussianBlur(0.8)),
+            "dim": ImageEnhance.Brightness(image).enhance(0.7),
+        }
+        for variant, variant_image in variants.items():
+            cases.append((f"{name} {variant}", document_type, jpeg(variant_image), False))
+
+        cases += [
+            (f"{name} heavy blur", document_type, jpeg(image.filter(ImageFilter.GaussianBlur(6))), True),
+            (f"{name} washed out", document_type, jpeg(image.point(lambda v: 200 + v // 20)), True),
+            (f"{name} tiny", document_type, jpeg(fit(image, 100)), True),
+            (f"{name} strip", document_type, jpeg(image.crop((0, 0, image.width, image.height // 5))), True),
+        ]
+        cases += [
+            (f"blank page in {document_type}", document_type, jpeg(Image.new("RGB", (1200, 1600), (246, 246, 240))), True),
+            (f"photo in {document_type}", document_type, jpeg(photo_like((900, 1200))), True),
+        ]
+
+    card = samples["aadhar-card.jpg"]
+    cases += [
+        ("aadhar card in tenthMarksheet", "tenthMarksheet", jpeg(card.resize((card.width * 3, card.height * 3))), True),
+        ("aadhar card in twelfthMarksheet", "twelfthMarksheet", jpeg(card), True),
+        ("10th marksheet in identityDocument", "identityDocument", jpeg(samples["10marksheet.jpeg"]), True),
+        ("12th marksheet in identityDocument", "identityDocument", jpeg(samples["12marksheet.jpeg"]), True),
+    ]
+    return cases
+
+
+def labeled_set(path):
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, newline="") as labels:
+        return [
+            (row["path"], row["document_type"], open(os.path.join(base, row["path"]), "rb").read(),
+             row["expected"].strip().lower() == "reject")
+            for row in csv.DictReader(labels)
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--labels", help="CSV of path,document_type,expected")
+    parser.add_argument("--repeat", type=int, default=20, help="timed checks per image")
+    parser.add_argument("--min-short-edge", type=int, default=150)
+    parser.add_argument("--max-aspect", type=float, default=3.0)
+    parser.add_argument("--min-contrast", type=int, default=30)
+    parser.add_argument("--min-sharpness", type=float, default=100)
+    parser.add_argument("--min-edge-density", type=float, default=0.03)
+    parser.add_argument("--no-layout", action="store_true")
+    parser.add_argument("--verbose", action="store_true", help="print every case")
+    parser.add_argument("--compare", metavar="REF", help="compare with results recorded for this commit")
+    args = parser.parse_args()
+
+    prefilter = Prefilter(
+        min_short_edge=args.min_short_edge,
+        max_aspect=args.max_aspect,
+        min_contrast=args.min_contrast,
+        min_sharpness=args.min_sharpness,
+        min_edge_density=args.min_edge_density,
+        layout=not args.no_layout,
+    )
+    cases = labeled_set(args.labels) if args.labels else builtin_set()
+
+    latencies = []
+    false_rejects, misses, checks = [], [], Counter()
+    positives = sum(1 for *_, expected in cases if not expected)
+    start = time.perf_counter()
+    for label, document_type, data, expected_reject in cases:
+        for _ in range(args.repeat):
+            call_start = time.perf_counter()
+            rejection = prefilter.check(data, document_type)
+            latencies.append(time.perf_counter() - call_start)
+        if rejection:
+            checks[rejection.check] += 1
+        if rejection and not expected_reject:
+            false_rejects.append((label, rejection.message))
+        elif expected_reject and not rejection:
+            misses.append(label)
+        if args.verbose:
+            print(f"  {'reject' if rejection else 'accept':<7} {label:<44} {rejection.check if rejection else ''}")
+    elapsed = time.perf_counter() - start
+
+    negatives = len(cases) - positives
+    summary = bench_results.summarize(latencies, elapsed)
+    summary["false_reject_rate"] = round(len(false_rejects) / positives, 4) if positives else 0.0
+    summary["catch_rate"] = round(1 - len(misses) / negatives, 4) if negatives else 0.0
+    summary["rejections_by_check"] = dict(checks)
+    results = {"prefilter.check": summary}
+
+    print(f"{len(cases)} images: {positives} valid, {negatives} to reject")
+    print(f"false rejects {len(false_rejects)}/{positives} ({summary['false_reject_rate']:.1%})")
+    for label, message in false_rejects:
+        print(f"  {label}: {message}")
+    print(f"caught        {negatives - len(misses)}/{negatives} ({summary['catch_rate']:.1%})")
+    for label in misses:
+        print(f"  missed {label}")
+    print(f"rejections by check: {dict(checks)}\n")
+    bench_results.print_table(results, unit="checks/s")
+
+    config = {key: value for key, value in vars(args).items() if key not in ("compare", "verbose")}
+    baseline = bench_results.load("prefilter", args.compare) if args.compare else None
+    print(f"\nsaved {bench_results.save('prefilter', config, results)}")
+    if baseline:
+        return 1 if bench_results.compare(results, baseline) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""Registration inserts per second: per-request commit vs. write-behind batching.
+
+    python benchmarks/registration_inserts.py                      # SQLite file
+    DATABASE_URL=postgresql://... python benchmarks/registration_inserts.py
+
+POSTs --count registrations to /digiform through the Flask test client from
+--concurrency threads, once per REGISTRATION_WRITE_MODE, each in a fresh
+interpreter. The batched figure includes the final flush, so every row is
+in the database when the clock stops.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_mode(count, concurrency):
+    sys.path.insert(0, ROOT)
+    import app as app_module
+
+    app_module.limiter.enabled = False
+    with app_module.app.app_context():
+        app_module.db.create_all()
+        before = app_module.Registration.query.count()
+
+    def submit(n):
+        client = app_module.app.test_client()
+        response = client.post(
+            "/digiform",
+            data={
+                "fullName": f"Applicant {n}",
+                "phoneNumber": f"{9000000000 + n}",
+                "emailId": f"applicant{n}@example.com",
+            },
+        )
+        assert response.status_code == 302, response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(submit, range(count)))
+    if app_module.registration_buffer is not None:
+        app_module.registration_buffer.flush()
+    elapsed = time.perf_counter() - start
+
+    with app_module.app.app_context():
+        written = app_module.Registration.query.count() - before
+    print(f"{written} {elapsed}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--mode", choices=["sync", "batched"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.count, args.concurrency)
+        return
+
+    env = dict(os.environ)
+    database = None
+    if "DATABASE_URL" not in env:
+        database = tempfile.NamedTemporaryFile(suffix=".db", delete=False).name
+        env["DATABASE_URL"] = f"sqlite:///{database}"
+    env.setdefault("OPENAI_API_KEY", "benchmark")
+    env["REGISTRATION_BATCH_SIZE"] = str(args.batch_size)
+
+    print(f"{args.count} registrations, {args.concurrency} threads, {env['DATABASE_URL'].split(':')[0]}")
+    try:
+        for mode in ["sync", "batched"]:
+            env["REGISTRATION_WRITE_MODE"] = mode
+            out = subprocess.run(
+                [sys.executable, __file__, "--mode", mode, "--count", str(args.count),
+                 "--concurrency", str(args.concurrency)],
+                env=env, check=True, capture_output=True, text=True,
+            ).stdout.split()
+            written, elapsed = int(out[-2]), float(out[-1])
+            print(f"{mode:<8} {written / elapsed:>9.0f} inserts/s  ({written} rows in {elapsed:.2f}s)")
+    finally:
+        if database:
+            os.remove(database)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Identical concurrent uploads across workers make one model call per document.
+
+    python benchmarks/single_flight_check.py --fake-redis
+    python benchmarks/single_flight_check.py --uploads 32 --workers 4 --latency 3
+
+Serves the app with gunicorn -w --workers against benchmarks/fake_openai.py
+and a shared Redis (REDIS_URL, or an in-process fakeredis TCP server with
+--fake-redis). Then --uploads clients post the same three documents at once,
+first with SINGLE_FLIGHT=1 and then with SINGLE_FLIGHT=0 for comparison.
+Each run uses its own Redis database and SQLite file, so every upload starts
+from an empty cache. Exits with 1 unless single flight made exactly one
+upstream call per document and every upload got its PDF.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, BENCHMARKS)
+
+import fake_openai  # noqa: E402
+from load_test import document_variants, free_port, wait_for  # noqa: E402
+
+
+def serve_app():
+    # Imported by each gunicorn worker through the application attribute below
+    sys.path.insert(0, ROOT)
+    import app as app_module
+
+    app_module.limiter.enabled = False
+    return app_module.app
+
+
+if os.getenv("BENCH_SERVE_APP"):
+    application = serve_app()
+
+
+def run(single_flight, database, args, redis_url, fake):
+    # (upstream calls made, uploads answered with a PDF)
+    import redis
+
+    workdir = tempfile.mkdtemp(prefix="digiform-single-flight-")
+    redis_url = f"{redis_url.rsplit('/', 1)[0]}/{database}"
+    redis.Redis.from_url(redis_url).flushdb()
+    port = free_port()
+    env = dict(os.environ)
+    env.update(
+        BENCH_SERVE_APP="1",
+        SINGLE_FLIGHT="1" if single_flight else "0",
+        REDIS_URL=redis_url,
+        OPENAI_BASE_URL=f"http://127.0.0.1:{fake.server_port}/v1",
+        OPENAI_API_KEY=env.get("OPENAI_API_KEY", "benchmark"),
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'single_flight.db')}",
+        ARTIFACT_DIR=os.path.join(workdir, "artifacts"),
+        JOB_BACKEND="",
+        UPSTREAM_RPM="0",
+        UPSTREAM_TPM="0",
+        ADMISSION_WORKER_LIMIT="0",
+        LOG_LEVEL="WARNING",
+    )
+    subprocess.run([sys.executable, "-m", "flask", "--app", "app", "init-db"], cwd=ROOT, env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+    command = [
+        sys.executable, "-m", "gunicorn", "-w", str(args.workers), "--threads", str(args.uploads),
+        "--timeout", "120", "-b", f"127.0.0.1:{port}", "--chdir", BENCHMARKS, "single_flight_check:application",
+    ]
+    server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    files = document_variants(1)[0]
+    try:
+        wait_for(base_url + "/", server)
+        # Every worker answers a page first, so all of them take part
+        with httpx.Client(base_url=base_url) as warmup:
+            for _ in range(args.workers * 4):
+                warmup.get("/register")
+        before = fake.fake.stats["requests"]
+        barrier = threading.Barrier(args.uploads)
+        # One connection per upload, spread over the workers by the kernel
+        def upload(_):
+            with httpx.Client(base_url=base_url, timeout=120) as client:
+                barrier.wait()
+                response = client.post("/upload", files=files)
+                return response.status_code == 200 and b"/pdf/" in response.content
+
+        with ThreadPoolExecutor(max_workers=args.uploads) as pool:
+            answered = sum(pool.map(upload, range(args.uploads)))
+        return fake.fake.stats["requests"] - before, answered
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uploads", type=int, default=16, help="identical uploads sent at once")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn -w")
+    parser.add_argument("--latency", type=float, default=2.0, help="fake model latency in seconds")
+    parser.add_argument("--fake-redis", action="store_true", help="serve Redis from an in-process fakeredis")
+    args = parser.parse_args()
+
+    redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    redis_server = None
+    if args.fake_redis:
+        import fakeredis
+
+        redis_port = free_port()
+        redis_server = fakeredis.TcpFakeServer(("127.0.0.1", redis_port))
+        threading.Thread(target=redis_server.serve_forever, daemon=True).start()
+        redis_url = f"redis://127.0.0.1:{redis_port}/0"
+
+    fake = fake_openai.serve(0, latency=args.latency)
+    documents = len(document_variants(1)[0])
+    try:
+        calls, answered = run(True, 14, args, redis_url, fake)
+        plain_calls, plain_answered = run(False, 15, args, redis_url, fake)
+    finally:
+        fake.shutdown()
+        if redis_server is not None:
+            redis_server.shutdown()
+
+    print(f"{args.uploads} identical uploads of {documents} documents, gunicorn -w {args.workers}\n")
+    print(f"{'':<18}{'upstream calls':>16}{'PDFs':>8}")
+    print(f"{'single flight':<18}{calls:>16}{answered:>8}")
+    print(f"{'without':<18}{plain_calls:>16}{plain_answered:>8}")
+    if calls != documents or answered != args.uploads:
+        print(f"\nFAIL: expected {documents} upstream calls and {args.uploads} PDFs with single flight")
+        return 1
+    print(f"\nOK: one upstream call per document")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""Import time and time to first request, with and without gunicorn --preload.
+
+    python benchmarks/startup.py --fake-redis
+    python benchmarks/startup.py --fake-redis --workers 4 --repeat 10 --compare HEAD~1
+
+Measures, --repeat times each:
+
+    import app     importing the app module in a fresh interpreter; the
+                   slowest top-level imports from python -X importtime are
+                   listed as well
+    first page     launching gunicorn -w --workers until the first answered
+                   GET /register
+    first upload   launching gunicorn until the first extracted /upload, which
+                   also pays for the clients built on first use
+
+for gunicorn with and without --preload, against benchmarks/fake_openai.py.
+The proportional set size (PSS) of the master and workers after --warmup more
+pages shows how much memory --preload lets the workers share. Results are
+saved under benchmarks/results/<commit>/startup.json.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+
+# gunicorn imports this module as the application, so the benchmark's own
+# dependencies are only imported in main() and do not count towards startup
+IMPORT_APP = "import time; start = time.perf_counter(); import app; print(time.perf_counter() - start)"
+
+
+def serve_app():
+    sys.path.insert(0, ROOT)
+    if os.getenv("BENCH_FAKE_REDIS"):
+        import bench_redis
+
+        bench_redis.use_fakeredis()
+    import app as app_module
+
+    app_module.limiter.enabled = False
+    return app_module.app
+
+
+if os.getenv("BENCH_SERVE_APP"):
+    application = serve_app()
+
+
+def import_times(env, repeat):
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_APP], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+        )
+        times.append(float(output.stdout.split()[-1]))
+    return times
+
+
+def slowest_imports(env, top=8):
+    # (module, cumulative seconds) of the top-level imports made by the app module
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT, env=env,
+        capture_output=True, text=True, check=True,
+    )
+    imports = []
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # Nested imports are indented below the module that made them
+        if name.startswith("   ") and not name.startswith("     "):
+            imports.append((name.strip(), int(cumulative) / 1e6))
+    return sorted(imports, key=lambda item: -item[1])[:top]
+
+
+def tree_pss(pid):
+    # Proportional set size in bytes of pid and its descendants; pages shared
+    # between processes are split between them instead of counted in each
+    from async_capacity import descendants
+
+    total = 0
+    for current in descendants(pid):
+        try:
+            with open(f"/proc/{current}/smaps_rollup") as rollup:
+                for line in rollup:
+                    if line.startswith("Pss:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            pass
+    return total
+
+
+def launch(preload, env, args, variant):
+    # Seconds to the first page and the first upload, and the PSS afterwards
+    import httpx
+    from load_test import free_port
+
+    port = free_port()
+    command = [
+        sys.executable, "-m", "gunicorn", "-w", str(args.workers), *(["--preload"] if preload else []),
+        "--timeout", "120", "-b", f"127.0.0.1:{port}", "--chdir", BENCHMARKS, "startup:application",
+    ]
+    start = time.perf_counter()
+    server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=120) as client:
+            while True:
+                if server.poll() is not None or time.perf_counter() - start > 120:
+                    raise SystemExit("App server did not start")
+                try:
+                    if client.get("/register").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    time.sleep(0.01)
+            first_page = time.perf_counter() - start
+            response = client.post("/upload", files=variant)
+            if response.status_code != 200 or b"/pdf/" not in response.content:
+                raise SystemExit(f"First upload failed with {response.status_code}")
+            first_upload = time.perf_counter() - start
+            for _ in range(args.warmup):
+                client.get("/register")
+            pss = tree_pss(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+    return first_page, first_upload, pss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn -w")
+    parser.add_argument("--repeat", type=int, default=5, help="imports and launches per measurement")
+    parser.add_argument("--warmup", type=int, default=32, help="pages requested before sampling PSS")
+    parser.add_argument("--fake-redis", action="store_true", help="run the app against fakeredis")
+    parser.add_argument("--compare", metavar="REF", help="compare with results recorded for this commit")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    sys.path.insert(0, BENCHMARKS)
+    import bench_results
+    import fake_openai
+    from load_test import document_variants
+
+    workdir = tempfile.mkdtemp(prefix="digiform-startup-")
+    fake = fake_openai.serve(0)
+    env = dict(os.environ)
+    env.update(
+        BENCH_SERVE_APP="1",
+        BENCH_FAKE_REDIS="1" if args.fake_redis else "",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{fake.server_port}/v1",
+        OPENAI_API_KEY=env.get("OPENAI_API_KEY", "benchmark"),
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+        ARTIFACT_DIR=os.path.join(workdir, "artifacts"),
+        JOB_BACKEND="",
+        UPSTREAM_RPM="0",
+        UPSTREAM_TPM="0",
+        LOG_LEVEL="WARNING",
+    )
+    import_env = {key: value for key, value in env.items() if key != "BENCH_SERVE_APP"}
+    subprocess.run([sys.executable, "-m", "flask", "--app", "app", "init-db"], cwd=ROOT, env=import_env,
+                   check=True, stdout=subprocess.DEVNULL)
+
+    results, memory = {}, {}
+    variants = iter(document_variants(args.repeat * 2))
+    try:
+        times = import_times(import_env, args.repeat)
+        results["import app"] = bench_results.summarize(times, sum(times))
+        for preload in (False, True):
+            name = f"gunicorn -w {args.workers}{' --preload' if preload else ''}"
+            pages, uploads, pss = [], [], []
+            for _ in range(args.repeat):
+                first_page, first_upload, total = launch(preload, env, args, next(variants))
+                pages.append(first_page)
+                uploads.append(first_upload)
+                pss.append(total)
+            results[f"{name} first page"] = bench_results.summarize(pages, sum(pages))
+            results[f"{name} first upload"] = bench_results.summarize(uploads, sum(uploads))
+            memory[name] = round(sum(pss) / len(pss) / 1024 ** 2, 1)
+            results[f"{name} first page"]["pss_mb"] = memory[name]
+    finally:
+        fake.shutdown()
+
+    print(f"{args.repeat} runs each, gunicorn -w {args.workers}\n")
+    bench_results.print_table(results, unit="starts/s")
+    print(f"\n{'slowest imports of app':<36}{'seconds':>10}")
+    for module, seconds in slowest_imports(import_env):
+        print(f"{module:<36}{seconds:>10.3f}")
+    print(f"\n{'deployment':<36}{'PSS MB':>10}")
+    for name, megabytes in memory.items():
+        print(f"{name:<36}{megabytes:>10.0f}")
+
+    config = {key: value for key, value in vars(args).items() if key not in ("compare", "threshold")}
+    baseline = bench_results.load("startup", args.compare) if args.compare else None
+    print(f"\nsaved {bench_results.save('startup', config, results)}")
+    if baseline:
+        return 1 if bench_results.compare(results, baseline, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""Peak memory per /upload ingestion, legacy disk path vs. in-memory path.
+
+Each mode runs in its own interpreter so ru_maxrss is not shared between them:
+
+    python benchmarks/upload_memory.py --image experiments/gradio_app/sample_images/10marksheet.jpeg
+
+Only ingestion is measured (multipart parsing, hashing, base64 encoding and
+building the data URL); the model call is not made.
+"""
+import argparse
+import base64
+import hashlib
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIELDS = ["identityDocument", "tenthMarksheet", "twelfthMarksheet"]
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def legacy_ingest(file, upload_folder, prompt):
+    # The pre-change pipeline: save, read to hash, read again to encode, delete
+    filepath = os.path.join(upload_folder, file.filename)
+    file.save(filepath)
+    try:
+        with open(filepath, "rb") as image_file:
+            image_hash = hashlib.sha256(image_file.read()).hexdigest()
+        prompt_hash = hashlib.sha256(prompt.encode()).hexdigest()
+        with open(filepath, "rb") as image_file:
+            encoded = base64.b64encode(image_file.read()).decode("utf-8")
+        url = f"data:image/jpeg;base64,{encoded}"
+        return f"{image_hash}_{prompt_hash}", len(url)
+    finally:
+        os.remove(filepath)
+
+
+def current_ingest(app_module, file, prompt):
+    image = app_module.read_upload(file)
+    url = app_module.encode_image(image.data)
+    return app_module.generate_cache_key(image.digest, prompt), len(url)
+
+
+def run_mode(mode, image_path, iterations):
+    os.environ.setdefault("DATABASE_URL", "sqlite://")
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    sys.path.insert(0, ROOT)
+    import flask
+
+    import app as app_module
+
+    with open(image_path, "rb") as image_file:
+        payload = image_file.read()
+    if mode == "legacy":
+        app_module.app.request_class = flask.Request
+    upload_folder = tempfile.mkdtemp()
+
+    rss_before = peak_rss_kb()
+    tracemalloc.start()
+    for _ in range(iterations):
+        data = {field: (BytesIO(payload), "scan.jpg") for field in FIELDS}
+        with app_module.app.test_request_context(
+            "/upload", method="POST", data=data, content_type="multipart/form-data"
+        ):
+            for field, prompt in app_module.DOCUMENTS:
+                file = flask.request.files[field]
+                if mode == "legacy":
+                    legacy_ingest(file, upload_folder, prompt)
+                else:
+                    current_ingest(app_module, file, prompt)
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = peak_rss_kb()
+    os.rmdir(upload_folder)
+    print(f"{rss_before} {rss_after} {traced_peak}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--image", required=True, help="document image used for all three fields")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--mode", choices=["legacy", "current"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.image, args.iterations)
+        return
+
+    size = os.path.getsize(args.image)
+    print(f"image: {args.image} ({size / 1024:.0f} KiB x {len(FIELDS)} fields), {args.iterations} requests")
+    print(f"{'mode':<8} {'peak RSS growth':>16} {'peak traced alloc':>18}")
+    for mode in ["legacy", "current"]:
+        out = subprocess.run(
+            [sys.executable, __file__, "--image", args.image,
+             "--iterations", str(args.iterations), "--mode", mode],
+            check=True, capture_output=True, text=True,
+        ).stdout.split()
+        rss_before, rss_after, traced_peak = (int(value) for value in out[-3:])
+        print(
+            f"{mode:<8} {(rss_after - rss_before) / 1024:>13.1f} MB"
+            f" {traced_peak / (1024 * 1024):>15.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Extraction under upstream 429s, errors and latency: plain client vs. UpstreamClient.
+
+    python benchmarks/upstream_simulation.py                       # Redis at REDIS_URL
+    python benchmarks/upstream_simulation.py --fake-redis --rpm 300 --documents 300
+
+Starts benchmarks/fake_openai.py in-process with a per-minute limit and random
+faults, then has --workers simulated app workers with --threads extraction
+threads each share --documents extractions. Runs twice against a fresh fake:
+the OpenAI client with its default retries, as app.py used it before, and
+UpstreamClient with the shared Redis budget, jittered backoff, per-call
+timeout and circuit breaker, one client and breaker per simulated worker.
+Reports how many documents would have ended up as error rows in the PDF, what
+the fake served, and latency percentiles.
+"""
+import argparse
+import base64
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from openai import DefaultHttpxClient, OpenAI
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_openai  # noqa: E402
+from bench_results import percentile  # noqa: E402
+from upstream import CircuitBreaker, RedisRateBudget, UpstreamClient  # noqa: E402
+
+# A 1x1 JPEG is enough; the fake only looks at the prompt text
+TINY_JPEG = base64.b64encode(bytes.fromhex(
+    "ffd8ffe000104a46494600010100000100010000ffdb004300080606070605080707070909080a0c140d0c0b0b0c1912130f"
+    "141d1a1f1e1d1a1c1c20242e2720222c231c1c2837292c30313434341f27393d38323c2e333432ffc0000b080001000101011100"
+    "ffc4001f0000010501010101010100000000000000000102030405060708090a0bffc400b5100002010303020403050504040000"
+    "017d01020300041105122131410613516107227114328191a1082342b1c11552d1f02433627282090a161718191a25262728292a"
+    "3435363738393a434445464748494a535455565758595a636465666768696a737475767778797a838485868788898a9293949596"
+    "9798999aa2a3a4a5a6a7a8a9aab2b3b4b5b6b7b8b9bac2c3c4c5c6c7c8c9cad2d3d4d5d6d7d8d9dae1e2e3e4e5e6e7e8e9eaf1f2"
+    "f3f4f5f6f7f8f9faffda0008010100003f00fbd3ffd9"
+)).decode()
+PROMPTS = [
+    "Extract the following information from the Aadhar card image.",
+    "Extract the following information from the 10th standard marksheet image.",
+    "Extract the following information from the 12th standard marksheet image.",
+]
+
+
+def extraction_request(n):
+    return {
+        "model": "gpt-4o-mini",
+        "response_format": {"type": "json_object"},
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": f"{PROMPTS[n % 3]} Provide the output in JSON format."},
+                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{TINY_JPEG}"}},
+                ],
+            }
+        ],
+    }
+
+
+def make_redis(use_fake):
+    if use_fake:
+        import fakeredis
+
+        return fakeredis.FakeRedis()
+    import redis
+
+    return redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+
+
+def run_mode(mode, args, redis_client):
+    server = fake_openai.serve(
+        0,
+        latency=args.latency,
+        jitter=args.jitter,
+        rpm=args.rpm,
+        rate_limit_rate=args.rate_limit_rate,
+        server_error_rate=args.server_error_rate,
+        stall_rate=args.stall_rate,
+        stall=args.stall,
+    )
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+
+    if mode == "plain":
+        callers = [OpenAI(api_key="simulation", base_url=base_url).chat.completions for _ in range(args.workers)]
+    else:
+        # Budget a little under the upstream limit, as UPSTREAM_RPM is meant to be set
+        budget = RedisRateBudget(
+            redis_client, int(args.rpm * 0.9), 0, window=args.window,
+            prefix=f"simulation:{uuid.uuid4().hex}",
+        )
+        callers = []
+        for _ in range(args.workers):
+            client = OpenAI(
+                api_key="simulation",
+                base_url=base_url,
+                max_retries=0,
+                timeout=httpx.Timeout(args.timeout, connect=5.0),
+                http_client=DefaultHttpxClient(limits=httpx.Limits(max_connections=args.threads)),
+            )
+            callers.append(UpstreamClient(
+                client, budget=budget, breaker=CircuitBreaker(5, 10), max_attempts=4, budget_wait=120,
+            ))
+
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def extract(n):
+        caller = callers[n % args.workers]
+        start = time.perf_counter()
+        try:
+            caller.create(**extraction_request(n))
+        except Exception as e:
+            with lock:
+                errors.append(type(e).__name__)
+            return
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers * args.threads) as pool:
+        list(pool.map(extract, range(args.documents)))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    stats = server.fake.stats
+    kinds = ", ".join(f"{kind} {errors.count(kind)}" for kind in sorted(set(errors))) or "none"
+    print(
+        f"{mode:<9} ok {len(latencies):>4}/{args.documents}  error rows {len(errors):>4} ({kinds})\n"
+        f"{'':<9} upstream: {stats['requests']} calls, {stats['429']} x 429, {stats['500']} x 500, "
+        f"{stats['stalled']} stalled\n"
+        f"{'':<9} latency p50 {percentile(latencies, 0.5):.2f}s  p95 {percentile(latencies, 0.95):.2f}s  "
+        f"p99 {percentile(latencies, 0.99):.2f}s  wall {elapsed:.1f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=4, help="simulated app workers")
+    parser.add_argument("--threads", type=int, default=6, help="extraction threads per worker")
+    parser.add_argument("--rpm", type=int, default=600, help="upstream requests per minute before 429s")
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.02)
+    parser.add_argument("--server-error-rate", type=float, default=0.02)
+    parser.add_argument("--stall-rate", type=float, default=0.01)
+    parser.add_argument("--stall", type=float, default=10.0)
+    parser.add_argument("--timeout", type=float, default=3.0, help="UpstreamClient per-call timeout")
+    parser.add_argument("--window", type=int, default=10, help="budget window in seconds")
+    parser.add_argument("--mode", choices=["plain", "resilient"], help="run only one side")
+    parser.add_argument("--fake-redis", action="store_true", help="use fakeredis instead of REDIS_URL")
+    args = parser.parse_args()
+
+    print(
+        f"{args.documents} documents, {args.workers} workers x {args.threads} threads, "
+        f"upstream {args.rpm} rpm, {args.latency}s±{args.jitter}s, "
+        f"{args.rate_limit_rate:.0%} 429 / {args.server_error_rate:.0%} 500 / {args.stall_rate:.0%} stalls"
+    )
+    redis_client = make_redis(args.fake_redis)
+    for mode in [args.mode] if args.mode else ["plain", "resilient"]:
+        run_mode(mode, args, redis_client)
+
+
+if __name__ == "__main__":
+    main()
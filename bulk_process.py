@@ -0,0 +1,323 @@
+"""Offline bulk processing of applicant documents.
+
+    python bulk_process.py applicants/ out/ --workers 8
+    python bulk_process.py applicants.zip out/
+
+The input is a directory or a ZIP archive. If it has a manifest.csv at its
+root, each row names an applicant and the paths of their documents:
+
+    applicant_id,identityDocument,tenthMarksheet,twelfthMarksheet
+    A001,A001/aadhar.jpg,A001/ssc.jpg,A001/hsc.jpg
+
+Otherwise every top-level folder is one applicant, and documents are matched
+by file name (aadhar/identity, 10/10th/tenth/ssc, 12/12th/twelfth/hsc).
+
+With --backend batch, documents are sent through the Batch API in chunks of
+--chunk-size applicants instead of one synchronous request each; results go
+into the extraction cache and on to PDF generation once the batch finishes.
+
+For each applicant a PDF is written to OUTPUT/pdfs/<applicant_id>.pdf and a
+line with the extracted fields is appended to OUTPUT/results.jsonl. That file
+is also the checkpoint: applicants already in it are skipped when the run is
+restarted, so a crashed run resumes where it stopped.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from app import (
+    DOCUMENTS,
+    DocumentImage,
+    app,
+    build_extraction_request,
+    cache,
+    cascade,
+    document_image,
+    extract_documents,
+    extract_info,
+    generate_cache_key,
+    generate_pdf,
+    init_db,
+    normalize_image,
+    prefilter_rejection,
+    process_output,
+    upstream_client,
+)
+from batch_api import BatchExtractionBackend
+
+FIELD_PATTERNS = {
+    "identityDocument": re.compile(r"aadh?aa?r|identity", re.IGNORECASE),
+    "tenthMarksheet": re.compile(r"(?<!\d)10(?!\d)|10th|tenth|ssc", re.IGNORECASE),
+    "twelfthMarksheet": re.compile(r"(?<!\d)12(?!\d)|12th|twelfth|hsc", re.IGNORECASE),
+}
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif"}
+
+
+class DirectorySource:
+    def __init__(self, root):
+        self.root = root
+
+    def names(self):
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                yield os.path.relpath(os.path.join(directory, name), self.root).replace(os.sep, "/")
+
+    def read(self, name):
+        with open(os.path.join(self.root, name), "rb") as document:
+            return document.read()
+
+
+class ZipSource:
+    def __init__(self, path):
+        self.archive = zipfile.ZipFile(path)
+        self.lock = threading.Lock()
+
+    def names(self):
+        return (info.filename for info in self.archive.infolist() if not info.is_dir())
+
+    def read(self, name):
+        with self.lock:
+            return self.archive.read(name)
+
+
+def discover_applicants(source):
+    # Returns [(applicant_id, {field: document name})] in a stable order
+    names = list(source.names())
+    if "manifest.csv" in names:
+        manifest = csv.DictReader(io.StringIO(source.read("manifest.csv").decode("utf-8-sig")))
+        return [
+            (row["applicant_id"], {field: row[field] for field, _ in DOCUMENTS if row.get(field)})
+            for row in manifest
+        ]
+
+    applicants = {}
+    for name in sorted(names):
+        parts = name.split("/")
+        if len(parts) < 2 or os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+            continue
+        documents = applicants.setdefault(parts[0], {})
+        stem = os.path.splitext(parts[-1])[0]
+        for field, pattern in FIELD_PATTERNS.items():
+            if field not in documents and pattern.search(stem):
+                documents[field] = name
+                break
+    return sorted(applicants.items())
+
+
+def load_checkpoint(results_path, retry_failed):
+    done = set()
+    if os.path.exists(results_path):
+        with open(results_path) as results:
+            for line in results:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Partial last line from a crash
+                if record["status"] == "ok" or not retry_failed:
+                    done.add(record["applicant_id"])
+                else:
+                    done.discard(record["applicant_id"])
+    return done
+
+
+def read_slots(source, documents):
+    max_bytes = app.config["MAX_UPLOAD_BYTES"]
+    slots = []
+    for field, _ in DOCUMENTS:
+        name = documents.get(field)
+        if name is None:
+            slots.append(None)
+            continue
+        data = source.read(name)
+        if len(data) > max_bytes:
+            slots.append({"error": f"File too large: {len(data)} bytes"})
+        else:
+            slots.append(document_image(data))
+    return slots
+
+
+def write_applicant(output_dir, applicant_id, output_data):
+    safe_id = re.sub(r"[^A-Za-z0-9._-]", "_", applicant_id)
+    pdf_path = os.path.join(output_dir, "pdfs", f"{safe_id}.pdf")
+    with open(pdf_path, "wb") as pdf_file:
+        pdf_file.write(generate_pdf(output_data).getvalue())
+    return {
+        "applicant_id": applicant_id,
+        "status": "ok",
+        "pdf": os.path.relpath(pdf_path, output_dir),
+        "documents": {field: result for (field, _), result in zip(DOCUMENTS, output_data)},
+    }
+
+
+def process_applicant(source, output_dir, applicant_id, documents):
+    return write_applicant(output_dir, applicant_id, extract_documents(read_slots(source, documents)))
+
+
+def lazy_request(source, name, prompt, field):
+    # The request body is built again when the batch file is written, so only
+    # cache keys, not image payloads, are held for a whole chunk
+    def build():
+        return build_extraction_request(normalize_image(document_image(source.read(name))), prompt, field)
+    return build
+
+
+def run_batch_chunk(source, output_dir, chunk, backend):
+    # Yields one result record per applicant in the chunk
+    plans, requests, fields, sources, results = {}, {}, {}, {}, {}
+    for applicant_id, documents in chunk:
+        plan = []
+        for (field, prompt), slot in zip(DOCUMENTS, read_slots(source, documents)):
+            if not isinstance(slot, DocumentImage):
+                plan.append(slot)
+                continue
+            try:
+                image = normalize_image(slot)
+            except ValueError as e:
+                plan.append({"error": str(e)})
+                continue
+            rejection = prefilter_rejection(image, field)
+            if rejection:
+                plan.append({"error": rejection})
+                continue
+            key = generate_cache_key(image.digest, prompt)
+            plan.append(key)
+            fields[key] = field
+            sources[key] = (documents[field], prompt)
+            cached = cache.get(key, field)
+            if cached:
+                results[key] = cached
+            elif key not in requests:
+                requests[key] = lazy_request(source, documents[field], prompt, field)
+        plans[applicant_id] = plan
+
+    for key, result in backend.extract_many(requests).items():
+        results[key] = result
+        if not isinstance(result, Exception):
+            cache.set(key, result, fields[key])
+
+    # The batch only asks the first model; answers the cascade would escalate
+    # go through extract_info, which asks the stronger models synchronously
+    for key, result in list(results.items()):
+        if not isinstance(result, Exception) and cascade.escalation(0, fields[key], result):
+            name, prompt = sources[key]
+            try:
+                image = normalize_image(document_image(source.read(name)))
+                results[key] = extract_info(image, prompt, fields[key])
+            except Exception as e:
+                results[key] = e
+
+    for applicant_id, plan in plans.items():
+        output_data = []
+        for entry in plan:
+            if not isinstance(entry, str):
+                output_data.append(entry)
+                continue
+            try:
+                result = results[entry]
+                if isinstance(result, Exception):
+                    raise result
+                main_data, subject_data = process_output(result, fields[entry])
+                output_data.append({"main": main_data, "subjects": subject_data})
+            except Exception as e:
+                output_data.append({"error": str(e)})
+        try:
+            yield write_applicant(output_dir, applicant_id, output_data)
+        except Exception as e:
+            yield {"applicant_id": applicant_id, "status": "failed", "error": str(e)}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Extract applicant documents in bulk and write per-applicant PDFs."
+    )
+    parser.add_argument("input", help="directory or .zip of applicant documents")
+    parser.add_argument("output", help="directory for PDFs and results.jsonl")
+    parser.add_argument("--workers", type=int, default=4, help="applicants processed concurrently")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="process applicants whose previous attempt failed again")
+    parser.add_argument("--backend", choices=["sync", "batch"], default="sync",
+                        help="one model call per document, or the Batch API")
+    parser.add_argument("--chunk-size", type=int, default=500,
+                        help="applicants per Batch API submission (--backend batch)")
+    parser.add_argument("--poll-interval", type=float, default=30,
+                        help="seconds between batch status checks (--backend batch)")
+    args = parser.parse_args()
+
+    source = ZipSource(args.input) if zipfile.is_zipfile(args.input) else DirectorySource(args.input)
+    os.makedirs(os.path.join(args.output, "pdfs"), exist_ok=True)
+    results_path = os.path.join(args.output, "results.jsonl")
+    # The database cache tier needs its table, which the app no longer creates on import
+    init_db()
+
+    applicants = discover_applicants(source)
+    done = load_checkpoint(results_path, args.retry_failed)
+    todo = [(applicant_id, documents) for applicant_id, documents in applicants if applicant_id not in done]
+    print(f"{len(applicants)} applicants found, {len(applicants) - len(todo)} already processed")
+
+    # Concurrency comes from the applicant pool; each applicant's documents run in turn
+    app.config["EXTRACTION_WORKERS"] = 1
+    counts = {"ok": 0, "failed": 0, "documents": 0, "document_errors": 0}
+    start = time.perf_counter()
+
+    with open(results_path, "a") as results:
+        def record_result(record):
+            results.write(json.dumps(record) + "\n")
+            results.flush()
+            os.fsync(results.fileno())
+            counts[record["status"]] += 1
+            for result in record.get("documents", {}).values():
+                if result is not None:
+                    counts["documents"] += 1
+                    counts["document_errors"] += "error" in result
+            finished = counts["ok"] + counts["failed"]
+            print(f"[{finished}/{len(todo)}] {record['applicant_id']}: {record['status']}", file=sys.stderr)
+
+        if args.backend == "batch":
+            # Submitted batch ids live next to the checkpoint, so a restarted
+            # run collects them instead of paying for the same requests twice
+            backend = BatchExtractionBackend(
+                # The shared client leaves retries to UpstreamClient; these calls bypass it
+                upstream_client.client.with_options(max_retries=3),
+                state_path=os.path.join(args.output, "batches.json"),
+                poll_interval=args.poll_interval,
+            )
+            for offset in range(0, len(todo), args.chunk_size):
+                for record in run_batch_chunk(source, args.output, todo[offset:offset + args.chunk_size], backend):
+                    record_result(record)
+        else:
+            with ThreadPoolExecutor(max_workers=args.workers) as pool:
+                futures = {
+                    pool.submit(process_applicant, source, args.output, applicant_id, documents): applicant_id
+                    for applicant_id, documents in todo
+                }
+                for future in as_completed(futures):
+                    try:
+                        record = future.result()
+                    except Exception as e:
+                        record = {"applicant_id": futures[future], "status": "failed", "error": str(e)}
+                    record_result(record)
+
+    elapsed = time.perf_counter() - start
+    finished = counts["ok"] + counts["failed"]
+    print(
+        f"Processed {finished} applicants in {elapsed:.1f}s "
+        f"({finished / elapsed * 60 if elapsed else 0:.1f} applicants/min, "
+        f"{counts['documents'] / elapsed if elapsed else 0:.2f} documents/s)"
+    )
+    print(
+        f"ok: {counts['ok']}, failed: {counts['failed']}, "
+        f"documents with errors: {counts['document_errors']} of {counts['documents']}"
+    )
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
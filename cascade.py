@@ -0,0 +1,173 @@
+"""Model cascade: a fast model first, stronger ones only for poor answers.
+
+Every document is extracted by the first model. quality_issues() looks for
+the signs of a poor answer on a hard scan:
+- fields that are missing, empty or "Not Available"
+- a marksheet without subjects
+- subject scores that do not add up to the total
+- a percentage that does not follow from the total
+- a document reported as invalid
+
+When an answer has at least min_issues of these, the document goes to the next
+model, and so on. The last model's answer is kept whatever its quality.
+
+Each model's answer is cached under a key that includes the model. A cached
+answer from a cheap model that needs escalating therefore leads straight to
+the stronger model's cached answer, and the cached answers record which model
+produced them.
+
+Cascade keeps per-process counters for every model:
+- documents it answered, from the cache or from a call
+- how many it escalated, and the issues that caused it
+- seconds spent on it
+- tokens and their cost, priced from PRICES in US dollars per million input
+  and output tokens
+stats() reports them; the same figures are exported to Prometheus by
+telemetry.py.
+"""
+import re
+import threading
+from collections import Counter
+
+from schemas import DOCUMENT_SCHEMAS, NOT_AVAILABLE
+
+# US dollars per million (input, output) tokens
+PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+}
+
+NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+
+def parse_prices(text):
+    # "model=input/output,..." as {model: (input, output)}
+    prices = {}
+    for entry in filter(None, (part.strip() for part in text.split(","))):
+        model, _, rates = entry.partition("=")
+        input_price, _, output_price = rates.partition("/")
+        try:
+            prices[model.strip()] = (float(input_price), float(output_price))
+        except ValueError:
+            raise ValueError(f"MODEL_PRICES entry {entry!r} is not model=input/output") from None
+    return prices
+
+
+def numbers(value):
+    return [float(number) for number in NUMBER.findall(value or "")]
+
+
+def total_issues(answer, tolerance):
+    # Inconsistencies between a marksheet's subjects, total and percentage;
+    # scores or totals that are not plain numbers are not checked
+    subjects = answer.get("subjects") or []
+    scores = [numbers(subject.get("score")) for subject in subjects]
+    total = numbers(answer.get("total_marks"))
+    percentage = numbers(answer.get("percentage"))
+    if not total or not subjects or not all(len(score) == 1 for score in scores):
+        return []
+    issues = []
+    obtained = total[0]
+    if abs(sum(score[0] for score in scores) - obtained) > 0.5:
+        issues.append("total_mismatch")
+    if percentage:
+        # "441/500" names the maximum; otherwise every subject is out of 100
+        maximum = total[1] if len(total) > 1 else 100 * len(subjects)
+        if maximum and abs(obtained / maximum * 100 - percentage[0]) > tolerance:
+            issues.append("percentage_mismatch")
+    return issues
+
+
+def quality_issues(document_type, answer, tolerance=1.0):
+    # Issue names found in an answer, one per affected field
+    if not isinstance(answer, dict):
+        return ["malformed"]
+    if answer.get("invalid"):
+        return ["invalid"]
+    _, _, fields = DOCUMENT_SCHEMAS[document_type]
+    issues = []
+    for field in fields:
+        if field not in answer:
+            issues.append("missing")
+        elif field == "subjects":
+            if not answer["subjects"]:
+                issues.append("no_subjects")
+        elif not str(answer[field] or "").strip() or answer[field] == NOT_AVAILABLE:
+            issues.append("not_available")
+    if "subjects" in fields:
+        issues += total_issues(answer, tolerance)
+    return issues
+
+
+class Cascade:
+    def __init__(self, models, min_issues=1, tolerance=1.0, prices=None):
+        self.models = list(models)
+        self.min_issues = min_issues
+        self.tolerance = tolerance
+        self.prices = dict(PRICES, **(prices or {}))
+        self.counters = Counter()
+        self.lock = threading.Lock()
+
+    def escalation(self, tier, document_type, answer):
+        # Issues that send the answer of models[tier] on to the next model;
+        # empty when it is kept
+        if tier + 1 >= len(self.models):
+            return []
+        issues = quality_issues(document_type, answer, self.tolerance)
+        return issues if len(issues) >= max(self.min_issues, 1) else []
+
+    def cost(self, model, usage):
+        # US dollars for one call's usage, None for a model without a price
+        price = self.prices.get(model)
+        if price is None or usage is None:
+            return None
+        return ((usage.prompt_tokens or 0) * price[0] + (usage.completion_tokens or 0) * price[1]) / 1e6
+
+    def record(self, model, source, issues, seconds):
+        # One document answered by model from source ("cache" or "model")
+        with self.lock:
+            self.counters[(model, "documents")] += 1
+            self.counters[(model, "cache_hits" if source == "cache" else "model_calls")] += 1
+            self.counters[(model, "seconds")] += seconds
+            if issues:
+                self.counters[(model, "escalated")] += 1
+                for issue in issues:
+                    self.counters[(model, f"issue:{issue}")] += 1
+
+    def record_usage(self, model, usage, cost):
+        if usage is None:
+            return
+        with self.lock:
+            self.counters[(model, "prompt_tokens")] += usage.prompt_tokens or 0
+            self.counters[(model, "completion_tokens")] += usage.completion_tokens or 0
+            self.counters[(model, "cost_usd")] += cost or 0.0
+
+    def stats(self):
+        # {"gpt-4o-mini": {"documents": 10, "cache_hit_rate": 0.2, "escalation_rate": 0.1, ...}, ...}
+        with self.lock:
+            counters = dict(self.counters)
+        stats = {}
+        for tier, model in enumerate(self.models):
+            values = {
+                event: counters.get((model, event), 0)
+                for event in ("documents", "cache_hits", "model_calls", "escalated",
+                              "prompt_tokens", "completion_tokens")
+            }
+            documents = values["documents"]
+            values.update(
+                tier=tier,
+                cache_hit_rate=round(values["cache_hits"] / documents, 4) if documents else 0.0,
+                escalation_rate=round(values["escalated"] / documents, 4) if documents else 0.0,
+                seconds=round(counters.get((model, "seconds"), 0.0), 3),
+                cost_usd=round(counters.get((model, "cost_usd"), 0.0), 6),
+                issues={
+                    event.split(":", 1)[1]: count
+                    for (counted_model, event), count in counters.items()
+                    if counted_model == model and event.startswith("issue:")
+                },
+            )
+            stats[model] = values
+        return stats
@@ -0,0 +1,223 @@
+"""Layered cache for model extraction results.
+
+Lookups go through an in-process LRU first, Redis second and optionally the
+application database last; a hit in a lower tier is copied into the tiers
+above it. Values are stored in Redis as zlib-compressed
+compact JSON. Hits, misses and evictions are counted per tier and per document
+type so the tiers can be sized from real traffic.
+
+get_async() and set_async() serve the async extraction path: the Redis tier
+uses its redis.asyncio client, the database tier runs on a thread, and the
+in-process tier is fast enough to use from the event loop directly.
+"""
+import asyncio
+import json
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+
+import redis
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from process_local import ProcessLocal
+
+
+class LocalCacheTier:
+    name = "local"
+
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        # Returns (value, evicted) where evicted is True if the entry had expired
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None, False
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None, True
+            self.entries.move_to_end(key)
+            return value, False
+
+    def set(self, key, value):
+        # Returns the number of entries evicted to make room
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            evicted = 0
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    async def get_async(self, key):
+        return self.get(key)
+
+    async def set_async(self, key, value):
+        return self.set(key, value)
+
+
+class RedisCacheTier:
+    name = "redis"
+
+    def __init__(self, redis_client, ttl=3600, async_client=None):
+        self.redis = redis_client
+        # A redis.asyncio client, or a ProcessLocal building one in each process
+        self.async_client = async_client
+        self.ttl = ttl
+
+    @property
+    def async_redis(self):
+        if isinstance(self.async_client, ProcessLocal):
+            return self.async_client.get()
+        return self.async_client
+
+    def get(self, key):
+        # Redis being unavailable degrades to a miss rather than failing the extraction
+        try:
+            data = self.redis.get(key)
+        except redis.RedisError:
+            return None, False
+        if data is None:
+            return None, False
+        return json.loads(zlib.decompress(data)), False
+
+    def set(self, key, value):
+        data = zlib.compress(json.dumps(value, separators=(",", ":")).encode())
+        try:
+            self.redis.set(key, data, ex=self.ttl)
+        except redis.RedisError:
+            pass
+        return 0
+
+    async def get_async(self, key):
+        try:
+            data = await self.async_redis.get(key)
+        except redis.RedisError:
+            return None, False
+        if data is None:
+            return None, False
+        return json.loads(zlib.decompress(data)), False
+
+    async def set_async(self, key, value):
+        data = zlib.compress(json.dumps(value, separators=(",", ":")).encode())
+        try:
+            await self.async_redis.set(key, data, ex=self.ttl)
+        except redis.RedisError:
+            pass
+        return 0
+
+
+class DatabaseCacheTier:
+    """Durable tier: one row per cache key in the application database.
+
+    Entries never expire, so results survive Redis restarts and TTLs. model is
+    the SQLAlchemy model holding them; it needs cache_key and result columns
+    and a from_cache_key(key, value) constructor. Each call runs in its own
+    app context, so it works from extraction threads and keeps its session
+    apart from the request's.
+    """
+
+    name = "database"
+
+    def __init__(self, app, db, model):
+        self.app = app
+        self.db = db
+        self.model = model
+
+    def get(self, key):
+        # The database being unavailable degrades to a miss, as with Redis
+        try:
+            with self.app.app_context():
+                value = self.db.session.scalar(
+                    select(self.model.result).where(self.model.cache_key == key)
+                )
+        except SQLAlchemyError:
+            return None, False
+        return value, False
+
+    def set(self, key, value):
+        try:
+            with self.app.app_context():
+                self.db.session.add(self.model.from_cache_key(key, value))
+                try:
+                    self.db.session.commit()
+                except IntegrityError:
+                    # Stored concurrently by another worker; the first copy wins
+                    self.db.session.rollback()
+        except SQLAlchemyError:
+            pass
+        return 0
+
+    async def get_async(self, key):
+        return await asyncio.to_thread(self.get, key)
+
+    async def set_async(self, key, value):
+        return await asyncio.to_thread(self.set, key, value)
+
+
+class ExtractionCache:
+    def __init__(self, tiers):
+        self.tiers = tiers
+        self.counters = Counter()
+        self.lock = threading.Lock()
+
+    def _count(self, tier, document_type, event, amount=1):
+        if amount:
+            with self.lock:
+                self.counters[(tier.name, document_type, event)] += amount
+
+    def get(self, key, document_type):
+        for depth, tier in enumerate(self.tiers):
+            value, expired = tier.get(key)
+            if expired:
+                self._count(tier, document_type, "evictions")
+            if value is None:
+                self._count(tier, document_type, "misses")
+                continue
+            self._count(tier, document_type, "hits")
+            for upper in self.tiers[:depth]:
+                self._count(upper, document_type, "evictions", upper.set(key, value))
+            return value
+        return None
+
+    def set(self, key, value, document_type):
+        for tier in self.tiers:
+            self._count(tier, document_type, "evictions", tier.set(key, value))
+
+    async def get_async(self, key, document_type):
+        for depth, tier in enumerate(self.tiers):
+            value, expired = await tier.get_async(key)
+            if expired:
+                self._count(tier, document_type, "evictions")
+            if value is None:
+                self._count(tier, document_type, "misses")
+                continue
+            self._count(tier, document_type, "hits")
+            for upper in self.tiers[:depth]:
+                self._count(upper, document_type, "evictions", await upper.set_async(key, value))
+            return value
+        return None
+
+    async def set_async(self, key, value, document_type):
+        for tier in self.tiers:
+            self._count(tier, document_type, "evictions", await tier.set_async(key, value))
+
+    def stats(self):
+        # {"local": {"identityDocument": {"hits": 3, "misses": 1, "evictions": 0}, ...}, ...}
+        with self.lock:
+            counters = dict(self.counters)
+        stats = {tier.name: {} for tier in self.tiers}
+        for (tier, document_type, event), count in counters.items():
+            events = stats[tier].setdefault(
+                document_type, {"hits": 0, "misses": 0, "evictions": 0}
+            )
+            events[event] = count
+        return stats
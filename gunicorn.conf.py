@@ -0,0 +1,16 @@
+"""Gunicorn hooks, loaded from the working directory (see docker-compose.yml).
+
+With PROMETHEUS_MULTIPROC_DIR set, each worker writes its metrics to files
+in that directory and /metrics adds them up. A worker that exits leaves its
+files behind; child_exit removes its live gauges (the admission gauges'
+"livesum"), so they stop counting towards the total. Its counters and
+histograms are kept, so totals do not drop when a worker is replaced.
+"""
+import os
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,331 @@
+"""Queue for /upload jobs that run outside the web request.
+
+The web process enqueues an applicant's documents and returns straight away;
+worker.py (or, with the in-process backend, a few threads in the web process)
+picks the job up, runs the extraction and records the id of the rendered
+PDF in the artifact store. A job's
+slots mirror the upload form: each is the raw document bytes, an
+{"error": ...} dict for an upload that was rejected up front, or None for an
+empty field. A job also keeps the id of the registration the upload belongs
+to, when the session had one, so its extractions can be linked to it.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+
+JOB_TTL = 3600  # Seconds a job record and its documents are kept
+
+logger = logging.getLogger(__name__)
+
+
+def _initial_document_status(slot):
+    if slot is None:
+        return {"status": "empty"}
+    if isinstance(slot, dict):
+        return {"status": "error", "error": slot["error"]}
+    return {"status": "queued"}
+
+
+class RedisJobQueue:
+    """Jobs stored in Redis, shared by every web and worker process.
+
+    Claimed job ids are moved atomically to a processing list; a worker that
+    dies mid-job leaves its id there and requeue_stale hands it to another
+    worker once the visibility timeout has passed. The claim time is written
+    just after the move, so an id found without one may have been claimed a
+    moment ago: it is given the sweep's time and only requeued by a later
+    sweep. While a job runs, work() renews its claim every third of the
+    timeout, so only a dead worker's jobs go stale, however long a job takes.
+
+    A job record that expired while the id waited in a list is never written
+    again: HSET would recreate it without a TTL or documents. Such an id is
+    dropped when claimed, and a running job whose record expires stops
+    updating it and fails when its documents are loaded.
+    """
+
+    def __init__(self, redis_client, prefix="digiform:jobs", visibility_timeout=300):
+        self.redis = redis_client
+        self.prefix = prefix
+        self.visibility_timeout = visibility_timeout
+        self.pending_key = f"{prefix}:pending"
+        self.processing_key = f"{prefix}:processing"
+
+    def _key(self, job_id, *parts):
+        return ":".join([self.prefix, job_id, *parts])
+
+    def enqueue(self, slots, registration_id=None):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        record = {"status": "queued", "created": now, "updated": now, "slots": len(slots)}
+        if registration_id is not None:
+            record["registration_id"] = registration_id
+        pipe = self.redis.pipeline()
+        for index, slot in enumerate(slots):
+            record[f"doc:{index}"] = json.dumps(_initial_document_status(slot))
+            if isinstance(slot, bytes):
+                pipe.set(self._key(job_id, "doc", str(index)), slot, ex=JOB_TTL)
+        pipe.hset(self._key(job_id), mapping=record)
+        pipe.expire(self._key(job_id), JOB_TTL)
+        pipe.lpush(self.pending_key, job_id)
+        pipe.execute()
+        return job_id
+
+    def _update(self, job_id, mapping):
+        # HSET that leaves an expired (missing) record missing; returns whether
+        # the record existed
+        key = self._key(job_id)
+
+        def update(pipe):
+            if not pipe.exists(key):
+                return False
+            pipe.multi()
+            pipe.hset(key, mapping=mapping)
+            return True
+
+        return self.redis.transaction(update, key, value_from_callable=True)
+
+    def claim(self, timeout=5):
+        job_id = self.redis.blmove(
+            self.pending_key, self.processing_key, timeout, src="RIGHT", dest="LEFT"
+        )
+        if job_id is None:
+            return None
+        job_id = job_id.decode()
+        if not self._update(job_id, {"status": "running", "claimed": time.time()}):
+            logger.warning("Dropping job %s: its record has expired", job_id)
+            self.ack(job_id)
+            return None
+        return job_id
+
+    def renew(self, job_id):
+        if not self._update(job_id, {"claimed": time.time()}):
+            raise LookupError(f"Job {job_id} has expired")
+
+    def ack(self, job_id):
+        self.redis.lrem(self.processing_key, 1, job_id)
+
+    def depth(self):
+        # Jobs waiting for a worker
+        return self.redis.llen(self.pending_key)
+
+    def requeue_stale(self):
+        requeued = 0
+        for raw_id in self.redis.lrange(self.processing_key, 0, -1):
+            job_id = raw_id.decode()
+            status, claimed = self.redis.hmget(self._key(job_id), "status", "claimed")
+            if claimed is None and status is not None:
+                # Claimed between the worker's BLMOVE and HSET, or by a worker
+                # that died in between; the next sweep tells which
+                self.redis.hsetnx(self._key(job_id), "claimed", time.time())
+                continue
+            if claimed is not None and time.time() - float(claimed) < self.visibility_timeout:
+                continue
+            # Only the worker whose LREM actually removed the id puts it back
+            if self.redis.lrem(self.processing_key, 1, job_id):
+                if status in (b"running", b"queued") and self._update(job_id, {"status": "queued"}):
+                    self.redis.lpush(self.pending_key, job_id)
+                    requeued += 1
+        return requeued
+
+    def load_documents(self, job_id):
+        slot_count = self.redis.hget(self._key(job_id), "slots")
+        if slot_count is None:
+            raise LookupError(f"Job {job_id} has expired")
+        slots = []
+        for index in range(int(slot_count)):
+            status = json.loads(self.redis.hget(self._key(job_id), f"doc:{index}"))
+            if status["status"] == "empty":
+                slots.append(None)
+            elif status["status"] == "error":
+                slots.append({"error": status["error"]})
+            else:
+                document = self.redis.get(self._key(job_id, "doc", str(index)))
+                if document is None:
+                    raise LookupError(f"Job {job_id} has expired")
+                slots.append(document)
+        return slots
+
+    def registration_id(self, job_id):
+        registration_id = self.redis.hget(self._key(job_id), "registration_id")
+        return int(registration_id) if registration_id is not None else None
+
+    def set_document_status(self, job_id, index, status, error=None):
+        document = {"status": status}
+        if error is not None:
+            document["error"] = error
+        self._update(job_id, {f"doc:{index}": json.dumps(document), "updated": time.time()})
+
+    def complete(self, job_id, artifact_id):
+        slot_count = int(self.redis.hget(self._key(job_id), "slots") or 0)
+        self._update(job_id, {"status": "done", "artifact_id": artifact_id, "updated": time.time()})
+        pipe = self.redis.pipeline()
+        for index in range(slot_count):
+            pipe.delete(self._key(job_id, "doc", str(index)))
+        pipe.execute()
+
+    def fail(self, job_id, error):
+        self._update(job_id, {"status": "failed", "error": error, "updated": time.time()})
+
+    def get(self, job_id):
+        record = self.redis.hgetall(self._key(job_id))
+        if not record:
+            return None
+        record = {key.decode(): value.decode() for key, value in record.items()}
+        return {
+            "id": job_id,
+            "status": record["status"],
+            "error": record.get("error"),
+            "artifact_id": record.get("artifact_id"),
+            "documents": [
+                json.loads(record[f"doc:{index}"]) for index in range(int(record["slots"]))
+            ],
+        }
+
+
+class MemoryJobQueue:
+    """In-process stand-in for RedisJobQueue, for local runs and tests.
+
+    Jobs are only visible to the process that enqueued them, so this backend
+    must not be used behind several gunicorn workers. Worker threads are
+    started on the first enqueue rather than at import time.
+    """
+
+    # Jobs never go stale, so their claims need no renewing
+    visibility_timeout = None
+
+    def __init__(self, handler=None, workers=2):
+        self.handler = handler
+        self.workers = workers
+        self.jobs = {}
+        self.pending = queue.Queue()
+        self.lock = threading.Lock()
+        self.threads = []
+
+    def _start_workers(self):
+        with self.lock:
+            if self.threads or self.handler is None:
+                return
+            stop = threading.Event()
+            for n in range(self.workers):
+                thread = threading.Thread(
+                    target=work, args=(self, self.handler, stop),
+                    name=f"job-worker-{n}", daemon=True,
+                )
+                thread.start()
+                self.threads.append(thread)
+
+    def enqueue(self, slots, registration_id=None):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.lock:
+            for expired in [key for key, job in self.jobs.items() if now - job["created"] > JOB_TTL]:
+                del self.jobs[expired]
+            self.jobs[job_id] = {
+                "created": now,
+                "status": "queued",
+                "error": None,
+                "documents": [_initial_document_status(slot) for slot in slots],
+                "slots": list(slots),
+                "registration_id": registration_id,
+                "artifact_id": None,
+            }
+        self.pending.put(job_id)
+        self._start_workers()
+        return job_id
+
+    def claim(self, timeout=5):
+        try:
+            job_id = self.pending.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        with self.lock:
+            self.jobs[job_id]["status"] = "running"
+        return job_id
+
+    def renew(self, job_id):
+        pass
+
+    def ack(self, job_id):
+        with self.lock:
+            self.jobs[job_id]["slots"] = None
+
+    def depth(self):
+        return self.pending.qsize()
+
+    def requeue_stale(self):
+        return 0
+
+    def load_documents(self, job_id):
+        with self.lock:
+            return list(self.jobs[job_id]["slots"])
+
+    def registration_id(self, job_id):
+        with self.lock:
+            return self.jobs[job_id]["registration_id"]
+
+    def set_document_status(self, job_id, index, status, error=None):
+        document = {"status": status}
+        if error is not None:
+            document["error"] = error
+        with self.lock:
+            self.jobs[job_id]["documents"][index] = document
+
+    def complete(self, job_id, artifact_id):
+        with self.lock:
+            self.jobs[job_id].update(status="done", artifact_id=artifact_id)
+
+    def fail(self, job_id, error):
+        with self.lock:
+            self.jobs[job_id].update(status="failed", error=error)
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            return {
+                "id": job_id,
+                "status": job["status"],
+                "error": job["error"],
+                "artifact_id": job["artifact_id"],
+                "documents": [dict(document) for document in job["documents"]],
+            }
+
+
+def _heartbeat(job_queue, job_id, done):
+    # Renews the claim of a running job until done is set
+    while not done.wait(job_queue.visibility_timeout / 3):
+        try:
+            job_queue.renew(job_id)
+        except LookupError:
+            logger.warning("Job %s expired while running", job_id)
+            return
+        except Exception:
+            logger.warning("Could not renew the claim of job %s", job_id, exc_info=True)
+
+
+def work(job_queue, handler, stop, requeue_interval=60):
+    # Worker loop shared by worker.py and the in-process backend
+    last_requeue = 0.0
+    while not stop.is_set():
+        if time.monotonic() - last_requeue > requeue_interval:
+            job_queue.requeue_stale()
+            last_requeue = time.monotonic()
+        job_id = job_queue.claim(timeout=5)
+        if job_id is None:
+            continue
+        done = threading.Event()
+        if job_queue.visibility_timeout:
+            threading.Thread(
+                target=_heartbeat, args=(job_queue, job_id, done), name=f"heartbeat-{job_id[:8]}", daemon=True
+            ).start()
+        try:
+            handler(job_id)
+        except Exception as e:
+            job_queue.fail(job_id, str(e))
+        finally:
+            done.set()
+            job_queue.ack(job_id)
@@ -0,0 +1,33 @@
+-- Durable extraction results and their link to registrations.
+--
+-- flask --app app init-db applies this script on PostgreSQL, so it is only
+-- needed by hand where the app's database user may not run DDL. Apply it
+-- once with:
+--
+--   psql "$DATABASE_URL" -f migrations/001_extraction_results.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS extraction_result (
+    id SERIAL PRIMARY KEY,
+    cache_key VARCHAR(255) NOT NULL UNIQUE,
+    image_hash VARCHAR(64) NOT NULL,
+    model VARCHAR(100) NOT NULL,
+    prompt_hash VARCHAR(16) NOT NULL,
+    version INTEGER NOT NULL,
+    result JSONB NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS ix_extraction_result_image_hash ON extraction_result (image_hash);
+
+CREATE TABLE IF NOT EXISTS registration_document (
+    id SERIAL PRIMARY KEY,
+    registration_id INTEGER NOT NULL REFERENCES registration (id),
+    document_type VARCHAR(32) NOT NULL,
+    extraction_result_id INTEGER NOT NULL REFERENCES extraction_result (id),
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    UNIQUE (registration_id, document_type, extraction_result_id)
+);
+CREATE INDEX IF NOT EXISTS ix_registration_document_registration_id ON registration_document (registration_id);
+
+COMMIT;
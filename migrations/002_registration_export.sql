@@ -0,0 +1,24 @@
+-- Registration timestamps and export checkpoints for registration exports.
+--
+-- flask --app app init-db applies this script on PostgreSQL, and refuses to
+-- finish while the registration table lacks "createdAt". Where the app's
+-- database user may not run DDL, run it once on any database created before
+-- registrations had a "createdAt" column:
+--
+--   psql "$DATABASE_URL" -f migrations/002_registration_export.sql
+--
+-- Registrations that already exist get the time the script runs as their
+-- "createdAt".
+
+BEGIN;
+
+ALTER TABLE registration ADD COLUMN IF NOT EXISTS "createdAt" TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now();
+CREATE INDEX IF NOT EXISTS "ix_registration_createdAt" ON registration ("createdAt");
+
+CREATE TABLE IF NOT EXISTS export_checkpoint (
+    name VARCHAR(64) PRIMARY KEY,
+    last_registration_id INTEGER NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+);
+
+COMMIT;
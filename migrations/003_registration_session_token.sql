@@ -0,0 +1,17 @@
+-- Session token of each registration, which ties uploads to the registration
+-- made in the same browser session instead of to its email address.
+--
+-- flask --app app init-db applies this script on PostgreSQL. Where the app's
+-- database user may not run DDL, run it once with:
+--
+--   psql "$DATABASE_URL" -f migrations/003_registration_session_token.sql
+--
+-- Registrations that already exist get no token; sessions that registered
+-- before the upgrade register again to link their uploads.
+
+BEGIN;
+
+ALTER TABLE registration ADD COLUMN IF NOT EXISTS "sessionToken" VARCHAR(32);
+CREATE UNIQUE INDEX IF NOT EXISTS "registration_sessionToken_key" ON registration ("sessionToken");
+
+COMMIT;
@@ -0,0 +1,208 @@
+"""Rendering of the application PDF from extracted document data.
+
+Stylesheets and table styles are built once per process in
+ApplicationPdfTemplate. PdfRenderer memoizes rendered PDFs by a digest of
+their input, so identical results are only laid out once, and can hand the
+ReportLab layout to a process pool so it does not hold the GIL of the
+process serving requests.
+
+ReportLab is imported when the first template is built rather than with the
+module, so importing the app does not pay for it.
+"""
+import hashlib
+import json
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+SECTION_TITLES = [
+    "Personal Information",
+    "10th Grade Results",
+    "12th Grade Results",
+]
+
+
+class ApplicationPdfTemplate:
+    def __init__(self):
+        from reportlab.lib import colors
+        from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+        from reportlab.platypus import TableStyle
+
+        styles = getSampleStyleSheet()
+
+        styles["Title"].fontSize = 16
+        styles["Title"].alignment = 1  # Center alignment
+
+        styles.add(
+            ParagraphStyle(
+                name="Subtitle", parent=styles["Heading2"], fontSize=14, alignment=1
+            )
+        )
+        styles.add(
+            ParagraphStyle(
+                name="TableHeader", parent=styles["Normal"], fontSize=10, alignment=1
+            )
+        )
+        self.styles = styles
+
+        self.main_table_style = TableStyle(
+            [
+                ("BACKGROUND", (0, 0), (-1, -1), colors.white),
+                ("TEXTCOLOR", (0, 0), (-1, -1), colors.black),
+                ("ALIGN", (0, 0), (-1, -1), "LEFT"),
+                ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
+                ("FONTSIZE", (0, 0), (-1, -1), 10),
+                ("BOTTOMPADDING", (0, 0), (-1, -1), 6),
+                ("TOPPADDING", (0, 0), (-1, -1), 6),
+                ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+            ]
+        )
+        self.subject_table_style = TableStyle(
+            [
+                ("BACKGROUND", (0, 0), (-1, 0), colors.grey),
+                ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
+                ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+                ("FONTSIZE", (0, 0), (-1, 0), 10),
+                ("BOTTOMPADDING", (0, 0), (-1, 0), 6),
+                ("BACKGROUND", (0, 1), (-1, -1), colors.white),
+                ("TEXTCOLOR", (0, 1), (-1, -1), colors.black),
+                ("ALIGN", (0, 1), (-1, -1), "CENTER"),
+                ("FONTNAME", (0, 1), (-1, -1), "Helvetica"),
+                ("FONTSIZE", (0, 1), (-1, -1), 10),
+                ("TOPPADDING", (0, 1), (-1, -1), 6),
+                ("BOTTOMPADDING", (0, 1), (-1, -1), 6),
+                ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+            ]
+        )
+
+    def render(self, output_data):
+        from reportlab.lib.pagesizes import letter
+        from reportlab.lib.units import inch
+        from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table
+
+        styles = self.styles
+        buffer = BytesIO()
+        doc = SimpleDocTemplate(
+            buffer, pagesize=letter, topMargin=0.5 * inch, bottomMargin=0.5 * inch
+        )
+        elements = [
+            Paragraph("Universal College Application", styles["Title"]),
+            Spacer(1, 0.25 * inch),
+            Paragraph("First-Year Admissions Application", styles["Subtitle"]),
+            Spacer(1, 0.25 * inch),
+        ]
+
+        for i, data in enumerate(output_data):
+            if data:
+                elements.append(Paragraph(SECTION_TITLES[i], styles["Heading2"]))
+                elements.append(Spacer(1, 0.1 * inch))
+
+                if "error" in data:
+                    elements.append(Paragraph(f"Error: {data['error']}", styles["Normal"]))
+                else:
+                    main_data = [
+                        [
+                            Paragraph(str(item["Field"]), styles["TableHeader"]),
+                            Paragraph(str(item["Value"]), styles["Normal"]),
+                        ]
+                        for item in data["main"]
+                    ]
+                    main_table = Table(main_data, colWidths=[2.5 * inch, 4 * inch])
+                    main_table.setStyle(self.main_table_style)
+                    elements.append(main_table)
+                    elements.append(Spacer(1, 0.1 * inch))
+
+                    if data["subjects"]:
+                        elements.append(Paragraph("Subject Scores", styles["Heading3"]))
+                        elements.append(Spacer(1, 0.1 * inch))
+                        subject_data = [
+                            [
+                                Paragraph("Subject", styles["TableHeader"]),
+                                Paragraph("Score", styles["TableHeader"]),
+                            ]
+                        ] + [
+                            [
+                                Paragraph(str(item["Subject"]), styles["Normal"]),
+                                Paragraph(str(item["Score"]), styles["Normal"]),
+                            ]
+                            for item in data["subjects"]
+                        ]
+                        subject_table = Table(subject_data, colWidths=[3 * inch, 3 * inch])
+                        subject_table.setStyle(self.subject_table_style)
+                        elements.append(subject_table)
+
+                elements.append(Spacer(1, 0.25 * inch))
+
+        doc.build(elements)
+        return buffer.getvalue()
+
+
+_template = None
+_template_lock = threading.Lock()
+
+
+def get_template():
+    global _template
+    if _template is None:
+        with _template_lock:
+            if _template is None:
+                _template = ApplicationPdfTemplate()
+    return _template
+
+
+def render_pdf(output_data):
+    # Module-level so it can be submitted to a process pool
+    return get_template().render(output_data)
+
+
+def output_digest(output_data):
+    serialized = json.dumps(output_data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+class PdfRenderer:
+    def __init__(self, cache_size=256, processes=0):
+        self.cache_size = cache_size
+        self.processes = processes
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def _get_executor(self):
+        # Created on first use, i.e. after gunicorn has forked. Children come
+        # from a fork server with this module (and ReportLab) preloaded instead
+        # of being forked from a process that already runs threads.
+        with self.lock:
+            if self.executor is None:
+                if "forkserver" in multiprocessing.get_all_start_methods():
+                    context = multiprocessing.get_context("forkserver")
+                    context.set_forkserver_preload([__name__, "reportlab.platypus"])
+                else:
+                    context = multiprocessing.get_context("spawn")
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.processes, mp_context=context
+                )
+            return self.executor
+
+    def render(self, output_data):
+        key = output_digest(output_data) if self.cache_size else None
+        if key:
+            with self.lock:
+                if key in self.cache:
+                    self.cache.move_to_end(key)
+                    return self.cache[key]
+
+        if self.processes:
+            pdf_data = self._get_executor().submit(render_pdf, output_data).result()
+        else:
+            pdf_data = render_pdf(output_data)
+
+        if key:
+            with self.lock:
+                self.cache[key] = pdf_data
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return pdf_data
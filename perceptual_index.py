@@ -0,0 +1,160 @@
+"""Near-duplicate lookup of document images, for cache hits on re-encoded uploads.
+
+The exact cache key hashes the image bytes. The same scan re-saved by a
+messaging app, converted from PNG to JPEG or downscaled therefore misses it.
+fingerprint() describes an image in two ways that survive re-encoding:
+
+- dhash: a 64-bit difference hash. Each bit says whether a pixel of a 9x8
+  grayscale thumbnail is darker than its right neighbour.
+- signature: the mean brightness of each 4x4 block of a 256 pixel wide,
+  autocontrasted thumbnail, 64 blocks across.
+
+The dHashes of any two documents printed on the same form are close, e.g.
+two applicants' Aadhar cards. So a dHash match only makes an image a
+candidate. The candidate is accepted when no block of its signature differs
+from the query's by more than max_difference, as a share of the brightness
+range. A different name or mark changes the blocks it covers.
+
+Candidates are found with multi-index hashing. The dHash is split into
+max_distance + 1 chunks, and each image is filed in one Redis sorted set per
+chunk value. Two hashes at most max_distance bits apart agree exactly on at
+least one chunk. A lookup therefore reads max_distance + 1 buckets, instead of
+scanning the whole index, and checks the Hamming distance of their entries.
+Entries are scored with their expiry time and leave their buckets once it has
+passed. Signatures are stored under the image's content hash with the same
+expiry.
+
+Copies of one form cluster: their dHashes are often identical, so every
+applicant who uploads that form lands in the same buckets, and no split of the
+hash into chunks spreads them out. Each bucket read is therefore capped at its
+bucket_limit newest entries, and the closest max_candidates of those, newest
+first among equals, have their signatures compared. Once more than
+max_candidates copies of a form have been indexed after an image, a near
+duplicate of that image is missed, which costs a model call, never a wrong
+answer.
+"""
+import struct
+import time
+import zlib
+from collections import namedtuple
+from io import BytesIO
+
+from PIL import Image, ImageChops, ImageOps
+
+HASH_BITS = 64
+THUMBNAIL_WIDTH = 256
+BLOCK = 4
+
+Fingerprint = namedtuple("Fingerprint", ["dhash", "signature"])
+
+
+def dhash(gray):
+    pixels = gray.resize((9, 8), Image.LANCZOS).tobytes()
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            value = value << 1 | (pixels[row * 9 + column] < pixels[row * 9 + column + 1])
+    return value
+
+
+def fingerprint(data):
+    # Raises OSError (PIL's UnidentifiedImageError) for bytes that are not an image
+    with Image.open(BytesIO(data)) as img:
+        # Let the JPEG decoder scale down by a power of two while decoding
+        img.draft("L", (THUMBNAIL_WIDTH, THUMBNAIL_WIDTH))
+        gray = img.convert("L")
+    height = max(BLOCK, round(THUMBNAIL_WIDTH * gray.height / gray.width))
+    thumbnail = ImageOps.autocontrast(gray, cutoff=1).resize((THUMBNAIL_WIDTH, height), Image.BOX)
+    return Fingerprint(dhash(gray), thumbnail.reduce(BLOCK))
+
+
+def encode_signature(signature):
+    return struct.pack(">HH", *signature.size) + zlib.compress(signature.tobytes())
+
+
+def decode_signature(data):
+    size = struct.unpack(">HH", data[:4])
+    return Image.frombytes("L", size, zlib.decompress(data[4:]))
+
+
+def difference(first, second):
+    # Largest block difference between two signatures, 0 to 1; images whose
+    # aspect ratios differ by more than a rounding error do not compare
+    (width, height), (other_width, other_height) = first.size, second.size
+    if width != other_width or abs(height - other_height) > 1:
+        return 1.0
+    box = (0, 0, width, min(height, other_height))
+    return ImageChops.difference(first.crop(box), second.crop(box)).getextrema()[1] / 255
+
+
+class PerceptualIndex:
+    def __init__(self, redis_client, max_distance=4, max_difference=0.08, ttl=7 * 24 * 3600,
+                 prefix="phash", max_candidates=16, bucket_limit=32):
+        if not 0 <= max_distance < HASH_BITS:
+            raise ValueError(f"max_distance must be between 0 and {HASH_BITS - 1}")
+        self.redis = redis_client
+        self.max_distance = max_distance
+        self.max_difference = max_difference
+        self.ttl = ttl
+        self.prefix = prefix
+        # Closest candidates whose signatures are compared per lookup, and
+        # newest entries read from each bucket
+        self.max_candidates = max_candidates
+        self.bucket_limit = bucket_limit
+        # (shift, mask) of each chunk, as even in size as 64 bits allow
+        chunks = max_distance + 1
+        sizes = [HASH_BITS // chunks + (n < HASH_BITS % chunks) for n in range(chunks)]
+        self.chunks, shift = [], HASH_BITS
+        for size in sizes:
+            shift -= size
+            self.chunks.append((shift, (1 << size) - 1))
+
+    def _buckets(self, namespace, dhash):
+        return [
+            f"{self.prefix}:{namespace}:{n}:{dhash >> shift & mask:x}"
+            for n, (shift, mask) in enumerate(self.chunks)
+        ]
+
+    def _signature_key(self, image_hash):
+        return f"{self.prefix}:signature:{image_hash}"
+
+    def add(self, namespace, image_hash, fingerprint):
+        # Files the image whose content hash is image_hash; namespace keeps
+        # answers for different models and prompts apart
+        now = time.time()
+        member = struct.pack(">Q", fingerprint.dhash) + bytes.fromhex(image_hash)
+        pipe = self.redis.pipeline(transaction=False)
+        for bucket in self._buckets(namespace, fingerprint.dhash):
+            pipe.zadd(bucket, {member: now + self.ttl})
+            pipe.zremrangebyscore(bucket, "-inf", now)
+            pipe.expire(bucket, self.ttl)
+        pipe.set(self._signature_key(image_hash), encode_signature(fingerprint.signature), ex=self.ttl)
+        pipe.execute()
+
+    def candidates(self, namespace, dhash):
+        # {image hash: (Hamming distance, -expiry)} of the newest live entries
+        # of each bucket that are within max_distance
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        for bucket in self._buckets(namespace, dhash):
+            pipe.zrevrangebyscore(bucket, "+inf", now, start=0, num=self.bucket_limit, withscores=True)
+        found = {}
+        for members in pipe.execute():
+            for member, expires in members:
+                distance = (struct.unpack(">Q", member[:8])[0] ^ dhash).bit_count()
+                if distance <= self.max_distance:
+                    found[member[8:].hex()] = (distance, -expires)
+        return found
+
+    def lookup(self, namespace, fingerprint):
+        # (content hash of the matching image or None, outcome): outcome is
+        # "hit", "rejected" when candidates failed the signature check, or "miss"
+        found = self.candidates(namespace, fingerprint.dhash)
+        if not found:
+            return None, "miss"
+        closest = sorted(found, key=found.get)[:self.max_candidates]
+        signatures = self.redis.mget([self._signature_key(image_hash) for image_hash in closest])
+        for image_hash, signature in zip(closest, signatures):
+            if signature and difference(fingerprint.signature, decode_signature(signature)) <= self.max_difference:
+                return image_hash, "hit"
+        return None, "rejected"
@@ -0,0 +1,133 @@
+"""Local pre-checks that reject unusable uploads before the model call.
+
+Each document is decoded once more at analysis size (512px, using JPEG draft
+mode so this costs a few milliseconds) and measured: pixel size, aspect ratio,
+grey-level spread (blank pages), contrast between the 5th and 95th percentile,
+sharpness as the variance of the Laplacian, and the number of ruled lines
+spanning most of the page width. Marksheets are portrait pages with table
+rules; an Aadhar card is a landscape card with few of them, so an upload that
+is clearly the other kind is rejected for that slot.
+
+Every threshold is a constructor argument, and a threshold of 0 switches its
+check off. The layout checks only reject when both the shape and the ruling
+disagree with the expected document, to keep false rejects of unusual but
+valid scans down.
+"""
+from collections import namedtuple
+from io import BytesIO
+
+from PIL import Image, ImageFilter, ImageStat
+
+ANALYSIS_EDGE = 512
+# Grey-level difference that counts as an edge, and the share of a row's
+# width that has to be edge for the row to count as a ruled line
+EDGE_THRESHOLD = 48
+RULE_COVERAGE = 0.6
+LAPLACIAN = ImageFilter.Kernel((3, 3), [0, 1, 0, 1, -4, 1, 0, 1, 0], scale=1, offset=128)
+CARD_ASPECT = (1.35, 1.85)
+
+Rejection = namedtuple("Rejection", ["check", "message"])
+ImageFeatures = namedtuple(
+    "ImageFeatures",
+    ["width", "height", "aspect", "stddev", "contrast", "sharpness", "edge_density", "ruled_lines"],
+)
+
+
+def percentile_from_histogram(histogram, fraction):
+    target = fraction * sum(histogram)
+    running = 0
+    for level, count in enumerate(histogram):
+        running += count
+        if running >= target:
+            return level
+    return len(histogram) - 1
+
+
+def count_runs(values, threshold):
+    runs, inside = 0, False
+    for value in values:
+        if value >= threshold and not inside:
+            runs += 1
+        inside = value >= threshold
+    return runs
+
+
+def measure(data):
+    image = Image.open(BytesIO(data))
+    width, height = image.size
+    image.draft("L", (ANALYSIS_EDGE, ANALYSIS_EDGE))
+    grey = image.convert("L")
+    grey.thumbnail((ANALYSIS_EDGE, ANALYSIS_EDGE))
+
+    histogram = grey.histogram()
+    contrast = percentile_from_histogram(histogram, 0.95) - percentile_from_histogram(histogram, 0.05)
+    # Filters leave artefacts along the border, so edge maps are cropped
+    inner = (2, 2, max(grey.width - 2, 3), max(grey.height - 2, 3))
+    sharpness = ImageStat.Stat(grey.filter(LAPLACIAN).crop(inner)).var[0]
+    edges = grey.filter(ImageFilter.FIND_EDGES).crop(inner).point(lambda v: 255 if v > EDGE_THRESHOLD else 0)
+    # Averaging every row down to one pixel gives each row's edge coverage
+    row_coverage = edges.resize((1, edges.height), Image.BOX).tobytes()
+
+    return ImageFeatures(
+        width=width,
+        height=height,
+        aspect=max(width, height) / max(min(width, height), 1),
+        stddev=ImageStat.Stat(grey).stddev[0],
+        contrast=contrast,
+        sharpness=sharpness,
+        edge_density=ImageStat.Stat(edges).mean[0] / 255,
+        ruled_lines=count_runs(row_coverage, RULE_COVERAGE * 255),
+    )
+
+
+class Prefilter:
+    def __init__(
+        self,
+        min_short_edge=150,
+        max_aspect=3.0,
+        blank_stddev=6.0,
+        min_contrast=30,
+        min_sharpness=100.0,
+        min_edge_density=0.03,
+        layout=True,
+    ):
+        self.min_short_edge = min_short_edge
+        self.max_aspect = max_aspect
+        self.blank_stddev = blank_stddev
+        self.min_contrast = min_contrast
+        self.min_sharpness = min_sharpness
+        self.min_edge_density = min_edge_density
+        self.layout = layout
+
+    def check_features(self, features, document_type):
+        # Returns a Rejection naming the failed check, or None
+        if self.min_short_edge and min(features.width, features.height) < self.min_short_edge:
+            return Rejection(
+                "resolution",
+                f"Image resolution too low ({features.width}x{features.height}): "
+                "please upload a clearer photo or scan",
+            )
+        if self.max_aspect and features.aspect > self.max_aspect:
+            return Rejection("aspect", "Image shape does not look like a document: please upload the whole page")
+        if self.blank_stddev and features.stddev < self.blank_stddev:
+            return Rejection("blank", "The image appears to be blank")
+        if self.min_contrast and features.contrast < self.min_contrast:
+            return Rejection("contrast", "Image contrast too low: please retake the photo in better light")
+        if self.min_sharpness and features.sharpness < self.min_sharpness:
+            return Rejection("blur", "Image too blurry: please retake the photo holding the camera steady")
+        if self.min_edge_density and features.edge_density < self.min_edge_density:
+            return Rejection("no_text", "No text found in the image: please upload a photo of the document")
+        if self.layout:
+            landscape_card = features.width > features.height and (
+                CARD_ASPECT[0] <= features.aspect <= CARD_ASPECT[1]
+            )
+            if document_type in ("tenthMarksheet", "twelfthMarksheet"):
+                if landscape_card and features.ruled_lines <= 4:
+                    return Rejection("layout", "This looks like an ID card, not a marksheet")
+            elif document_type == "identityDocument":
+                if features.height > features.width and features.ruled_lines >= 10:
+                    return Rejection("layout", "This looks like a marksheet, not an Aadhar card")
+        return None
+
+    def check(self, data, document_type):
+        return self.check_features(measure(data), document_type)
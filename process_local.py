@@ -0,0 +1,27 @@
+"""Objects created on first use in each process.
+
+Clients that own sockets, threads or an event loop must not be created at
+import time once gunicorn runs with --preload: the master imports the app
+before forking, and every worker would inherit the same half-used
+connections. A ProcessLocal runs its factory on first use and again in each
+forked child, so the module declaring the client can be imported, and its
+code shared copy-on-write, before the fork.
+"""
+import os
+import threading
+
+
+class ProcessLocal:
+    def __init__(self, factory):
+        self.factory = factory
+        self.value = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    self.value = self.factory()
+                    self.pid = os.getpid()
+        return self.value
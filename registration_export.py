@@ -0,0 +1,219 @@
+"""Streaming export of registrations and the data extracted for them.
+
+RegistrationExport reads registrations in id order with a server-side cursor,
+chunk_size rows at a time. It fetches the extraction results linked to each
+chunk with one more query, so memory stays flat however large the table is.
+Each exported row holds the registration's columns, then one column per
+extracted field. The field columns are prefixed with the document's schema
+name (aadhar_card_full_name, tenth_marksheet_percentage, ...). When an
+applicant uploaded a document more than once, the latest extraction wins.
+
+The encoders turn the chunks into CSV, JSON lines, an Arrow IPC stream or
+Parquet, yielding bytes after every chunk. Subjects are a list of name/score
+pairs, written as JSON text in CSV. pyarrow is only imported for the Arrow and
+Parquet formats.
+"""
+import csv
+import io
+import json
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from schemas import DOCUMENT_SCHEMAS
+
+REGISTRATION_COLUMNS = ["id", "createdAt", "fullName", "phoneNumber", "emailId"]
+# Extracted columns as (column, document type, field), in upload form order
+EXTRACTED_COLUMNS = [
+    (f"{schema_name}_{field}", document_type, field)
+    for document_type, (schema_name, _, fields) in DOCUMENT_SCHEMAS.items()
+    for field in (*fields, "invalid")
+]
+COLUMNS = REGISTRATION_COLUMNS + [column for column, _, _ in EXTRACTED_COLUMNS]
+
+# A leading character that makes spreadsheets read a cell as a formula
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def as_utc(moment):
+    # Timezone-aware UTC; naive values (SQLite's createdAt) are taken as UTC
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+
+def parse_time(value):
+    # ISO 8601 date or date-time, as aware UTC so Postgres does not read it in
+    # the session's TimeZone; a value without an offset is taken as UTC
+    return as_utc(datetime.fromisoformat(value))
+
+
+def settled_before(lag):
+    # Time before which every registration has committed, for checkpointed
+    # exports: ids are given out at insert, so a registration still being
+    # inserted may get a lower id than one already committed
+    return datetime.now(timezone.utc) - timedelta(seconds=lag)
+
+
+class RegistrationExport:
+    def __init__(self, db, registration, document, result, chunk_size=2000):
+        self.db = db
+        self.registration = registration
+        self.document = document
+        self.result = result
+        self.chunk_size = chunk_size
+        # Highest registration id exported so far, for the next incremental export
+        self.last_id = None
+
+    def _extracted(self, first_id, last_id):
+        # Latest answer per registration and document type for an id range
+        document, result = self.document, self.result
+        query = (
+            select(document.registration_id, document.document_type, result.result)
+            .join(result, result.id == document.extraction_result_id)
+            .where(document.registration_id.between(first_id, last_id))
+            .order_by(document.id)
+        )
+        answers = {}
+        for registration_id, document_type, answer in self.db.session.execute(query):
+            answers.setdefault(registration_id, {})[document_type] = answer
+        return answers
+
+    def chunks(self, start=None, end=None, after_id=None, settled=None):
+        # Lists of row dicts, registrations created in [start, end) with an id
+        # above after_id. With settled, the export stops at the first
+        # registration created at or after it, so every id up to last_id has
+        # been seen and a checkpoint at last_id skips none.
+        registration = self.registration
+        query = select(*(getattr(registration, column) for column in REGISTRATION_COLUMNS))
+        if start is not None:
+            query = query.where(registration.createdAt >= start)
+        if end is not None:
+            query = query.where(registration.createdAt < end)
+        if after_id is not None:
+            query = query.where(registration.id > after_id)
+        query = query.order_by(registration.id).execution_options(yield_per=self.chunk_size)
+        for partition in self.db.session.execute(query).partitions():
+            if settled is not None:
+                recent = [n for n, row in enumerate(partition) if as_utc(row.createdAt) >= settled]
+                partition = partition[:recent[0]] if recent else partition
+                if not partition:
+                    return
+            answers = self._extracted(partition[0].id, partition[-1].id)
+            chunk = []
+            for row in partition:
+                values = dict(zip(REGISTRATION_COLUMNS, row))
+                extracted = answers.get(row.id, {})
+                for column, document_type, field in EXTRACTED_COLUMNS:
+                    values[column] = (extracted.get(document_type) or {}).get(field)
+                chunk.append(values)
+            yield chunk
+            self.last_id = partition[-1].id
+            if settled is not None and recent:
+                return
+
+
+def csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, list):
+        return json.dumps(value, ensure_ascii=False)
+    value = str(value)
+    # Applicant-supplied text must not run as a formula when staff open the file
+    return "'" + value if value.startswith(FORMULA_PREFIXES) else value
+
+
+def encode_csv(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    yield buffer.getvalue().encode()
+    for chunk in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([csv_value(row[column]) for column in COLUMNS] for row in chunk)
+        yield buffer.getvalue().encode()
+
+
+def encode_jsonl(chunks):
+    for chunk in chunks:
+        lines = []
+        for row in chunk:
+            row = dict(row, createdAt=row["createdAt"].isoformat() if row["createdAt"] else None)
+            lines.append(json.dumps(row, ensure_ascii=False, separators=(",", ":")))
+        if lines:
+            yield ("\n".join(lines) + "\n").encode()
+
+
+class ChunkSink(io.RawIOBase):
+    # Write-only file for pyarrow writers that hands over what was written
+    # since the last drain()
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def arrow_schema():
+    import pyarrow as pa
+
+    types = {
+        "id": pa.int64(),
+        "createdAt": pa.timestamp("us", tz="UTC"),
+    }
+    subjects = pa.list_(pa.struct([("name", pa.string()), ("score", pa.string())]))
+    for column, _, field in EXTRACTED_COLUMNS:
+        types[column] = subjects if field == "subjects" else pa.string()
+    return pa.schema([(column, types.get(column, pa.string())) for column in COLUMNS])
+
+
+def encode_arrow(chunks):
+    import pyarrow as pa
+
+    schema, sink = arrow_schema(), ChunkSink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for chunk in chunks:
+            writer.write_batch(pa.RecordBatch.from_pylist(chunk, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def encode_parquet(chunks):
+    # One row group per chunk; the footer follows the last one
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema, sink = arrow_schema(), ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for chunk in chunks:
+            if chunk:
+                writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+                yield sink.drain()
+    yield sink.drain()
+
+
+# Export format: (MIME type, file extension, encoder)
+FORMATS = {
+    "csv": ("text/csv", "csv", encode_csv),
+    "jsonl": ("application/x-ndjson", "jsonl", encode_jsonl),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows", encode_arrow),
+    "parquet": ("application/vnd.apache.parquet", "parquet", encode_parquet),
+}
@@ -0,0 +1,117 @@
+"""JSON schemas for the model's answers and the records they are parsed into.
+
+Each document type has a fixed set of snake_case fields, enforced on the model
+response with a strict json_schema response format, so the answer always has
+the same keys, subjects always come as a list of name/score pairs, and an
+image of the wrong kind is reported in "invalid" instead of as free text.
+parse_record() maps an answer straight onto an IdentityRecord or
+MarksheetRecord, and record_rows() turns a record into the field and subject
+rows of the generated PDF.
+"""
+from collections import namedtuple
+
+NOT_AVAILABLE = "Not Available"
+
+Subject = namedtuple("Subject", ["name", "score"])
+IdentityRecord = namedtuple(
+    "IdentityRecord",
+    ["full_name", "fathers_name", "date_of_birth", "address", "aadhar_number", "gender"],
+)
+# stream is None for 10th standard marksheets
+MarksheetRecord = namedtuple(
+    "MarksheetRecord",
+    ["stream", "seat_number", "year_of_passing", "subjects", "total_marks", "percentage"],
+)
+
+# Row labels in the PDF, in record field order
+LABELS = {
+    "full_name": "Full Name",
+    "fathers_name": "Fathers Name",
+    "date_of_birth": "Date of Birth",
+    "address": "Address",
+    "aadhar_number": "Aadhar Number",
+    "gender": "Gender",
+    "stream": "Stream",
+    "seat_number": "Seat Number",
+    "year_of_passing": "Year of Passing",
+    "total_marks": "Total Marks Obtained",
+    "percentage": "Percentage",
+}
+
+# Schema name, record type and the record fields the model is asked for, per upload field
+DOCUMENT_SCHEMAS = {
+    "identityDocument": ("aadhar_card", IdentityRecord, IdentityRecord._fields),
+    "tenthMarksheet": ("tenth_marksheet", MarksheetRecord, MarksheetRecord._fields[1:]),
+    "twelfthMarksheet": ("twelfth_marksheet", MarksheetRecord, MarksheetRecord._fields),
+}
+
+SUBJECTS_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {"name": {"type": "string"}, "score": {"type": "string"}},
+        "required": ["name", "score"],
+        "additionalProperties": False,
+    },
+}
+
+
+def document_schema(document_type):
+    _, _, fields = DOCUMENT_SCHEMAS[document_type]
+    properties = {
+        field: SUBJECTS_SCHEMA if field == "subjects" else {"type": "string"} for field in fields
+    }
+    # null for a valid document, otherwise why it is not one
+    properties["invalid"] = {"type": ["string", "null"]}
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+def json_schema_format(name, schema):
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}
+
+
+def response_format(document_type):
+    return json_schema_format(DOCUMENT_SCHEMAS[document_type][0], document_schema(document_type))
+
+
+def combined_response_format(document_types):
+    # One object with each document's answer under its upload field
+    return json_schema_format("documents", {
+        "type": "object",
+        "properties": {document_type: document_schema(document_type) for document_type in document_types},
+        "required": list(document_types),
+        "additionalProperties": False,
+    })
+
+
+def parse_record(document_type, answer):
+    # Raises ValueError for an answer that is not an object or reports an invalid image
+    if not isinstance(answer, dict):
+        raise ValueError("Malformed model response")
+    if answer.get("invalid"):
+        raise ValueError(f"Invalid Image: {answer['invalid']}")
+    _, record_type, fields = DOCUMENT_SCHEMAS[document_type]
+    values = dict.fromkeys(record_type._fields)
+    for field in fields:
+        values[field] = answer.get(field) or NOT_AVAILABLE
+    if "subjects" in values:
+        subjects = answer.get("subjects") or []
+        values["subjects"] = [Subject(subject["name"], subject["score"]) for subject in subjects]
+    return record_type(**values)
+
+
+def record_rows(record):
+    # (main rows, subject rows or None) as generate_pdf expects them
+    main_data = [
+        {"Field": LABELS[field], "Value": value}
+        for field, value in zip(record._fields, record)
+        if field != "subjects" and value is not None
+    ]
+    subjects = getattr(record, "subjects", None)
+    subject_data = [{"Subject": name, "Score": score} for name, score in subjects] if subjects else None
+    return main_data, subject_data
@@ -0,0 +1,167 @@
+"""Single-flight extraction across every worker process.
+
+When several workers miss the cache for the same key at once (a
+double-submitted form, a retry after a slow page, a counselor re-uploading
+the same files), only one of them should call the model. The first caller of
+SingleFlight.run() takes a lease on the key in Redis (SET NX with a short
+expiry) and computes the value; the others wait for the lease to go away and
+then load the value the leader stored, normally from the cache.
+
+Leases are short and renewed by a background thread while their holder is
+still working, so a worker that dies mid-call frees the key within one lease
+period and a waiter takes over. A waiter also takes over when the leader
+finished without storing anything (its call failed), and computes on its own
+after max_wait seconds or when Redis is unavailable, so coalescing never
+fails an extraction by itself.
+
+Renewing and releasing check that the lease still holds this caller's token
+with WATCH/MULTI, so neither touches a lease another worker has since taken.
+"""
+import asyncio
+import os
+import threading
+import time
+import uuid
+
+import redis
+
+import telemetry
+
+
+class SingleFlight:
+    def __init__(self, redis_client, lease=10.0, max_wait=90.0, poll_interval=0.1, prefix="singleflight"):
+        self.redis = redis_client
+        self.lease = lease
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.prefix = prefix
+        # Leases held by this process, lease key -> token, renewed until released
+        self.held = {}
+        self.renewer_pid = None
+        self.lock = threading.Lock()
+
+    def _acquire(self, lease_key):
+        # The lease's token if this caller now holds it, None if another does
+        token = uuid.uuid4().hex
+        if not self.redis.set(lease_key, token, nx=True, px=int(self.lease * 1000)):
+            return None
+        with self.lock:
+            if self.renewer_pid != os.getpid():
+                # First lease in this process, or in a forked child, whose
+                # copy of held belongs to the parent
+                self.held = {}
+                self.renewer_pid = os.getpid()
+                threading.Thread(target=self._renew_forever, name="single-flight-renewer", daemon=True).start()
+            self.held[lease_key] = token
+        return token
+
+    def _if_owner(self, lease_key, token, action):
+        # Runs action(pipe) in a transaction if lease_key still holds token
+        with self.redis.pipeline() as pipe:
+            try:
+                pipe.watch(lease_key)
+                value = pipe.get(lease_key)
+                if (value.decode() if isinstance(value, bytes) else value) != token:
+                    return False
+                pipe.multi()
+                action(pipe)
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                return False
+
+    def _release(self, lease_key, token):
+        with self.lock:
+            self.held.pop(lease_key, None)
+        try:
+            self._if_owner(lease_key, token, lambda pipe: pipe.delete(lease_key))
+        except redis.RedisError:
+            pass  # It expires on its own
+
+    def _renew_forever(self):
+        while True:
+            time.sleep(self.lease / 3)
+            with self.lock:
+                held = list(self.held.items())
+            for lease_key, token in held:
+                try:
+                    self._if_owner(lease_key, token, lambda pipe: pipe.pexpire(lease_key, int(self.lease * 1000)))
+                except redis.RedisError:
+                    pass
+
+    def _lease_gone(self, lease_key):
+        try:
+            return not self.redis.exists(lease_key)
+        except redis.RedisError:
+            # Cannot tell; the caller loads and tries to lead, which bypasses Redis
+            return True
+
+    def run(self, key, load, compute):
+        # compute() runs in one caller at a time across every process; the
+        # others return load() once it has finished, or compute in turn when
+        # load() finds nothing
+        lease_key = f"{self.prefix}:{key}"
+        deadline = time.monotonic() + self.max_wait
+        waited = False
+        while True:
+            try:
+                token = self._acquire(lease_key)
+            except redis.RedisError:
+                telemetry.record_single_flight("bypass")
+                return compute()
+            if token is not None:
+                try:
+                    # Taking over after a wait: another leader may have stored
+                    # the value between our load() and the lease
+                    value = load() if waited else None
+                    if value is not None:
+                        telemetry.record_single_flight("follower")
+                        return value
+                    telemetry.record_single_flight("leader")
+                    return compute()
+                finally:
+                    self._release(lease_key, token)
+            waited = True
+            with telemetry.stage("single_flight_wait"):
+                while not self._lease_gone(lease_key) and time.monotonic() < deadline:
+                    time.sleep(self.poll_interval)
+            value = load()
+            if value is not None:
+                telemetry.record_single_flight("follower")
+                return value
+            if time.monotonic() >= deadline:
+                telemetry.record_single_flight("timeout")
+                return compute()
+
+    async def run_async(self, key, load, compute):
+        # run() for coroutine functions on an event loop; Redis is called on threads
+        lease_key = f"{self.prefix}:{key}"
+        deadline = time.monotonic() + self.max_wait
+        waited = False
+        while True:
+            try:
+                token = await asyncio.to_thread(self._acquire, lease_key)
+            except redis.RedisError:
+                telemetry.record_single_flight("bypass")
+                return await compute()
+            if token is not None:
+                try:
+                    value = await load() if waited else None
+                    if value is not None:
+                        telemetry.record_single_flight("follower")
+                        return value
+                    telemetry.record_single_flight("leader")
+                    return await compute()
+                finally:
+                    await asyncio.to_thread(self._release, lease_key, token)
+            waited = True
+            with telemetry.stage("single_flight_wait"):
+                while not await asyncio.to_thread(self._lease_gone, lease_key) and time.monotonic() < deadline:
+                    await asyncio.sleep(self.poll_interval)
+            value = await load()
+            if value is not None:
+                telemetry.record_single_flight("follower")
+                return value
+            if time.monotonic() >= deadline:
+                telemetry.record_single_flight("timeout")
+                return await compute()
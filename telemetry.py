@@ -0,0 +1,239 @@
+"""Per-stage timings, model token usage and cost, and request traces.
+
+stage("model_call") times a block into the digiform_stage_seconds histogram
+and, inside a traced request or job, adds it to that trace's per-stage
+totals. Each trace is logged as one JSON line when it ends, with its id (also
+returned in the X-Trace-Id header), duration, status and stage breakdown;
+traces that recorded no stages are logged at DEBUG so status polling does not
+flood the log. Nothing from the documents themselves is logged.
+
+Admission gauges and shed counts (see admission.py) and the job queue depth
+are exported alongside, for autoscaling web and worker processes.
+
+Metrics are served in the Prometheus text format by render_metrics(). When
+several processes serve the app (gunicorn workers), point
+PROMETHEUS_MULTIPROC_DIR at an empty directory shared by them so /metrics
+aggregates every worker instead of whichever one answered the scrape, and
+load gunicorn.conf.py so an exited worker's live gauges are dropped. Docker
+Compose does both. worker.py runs no web app, so it serves the same metrics
+on a port of its own with serve_metrics().
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from flask import g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+logger = logging.getLogger("digiform.trace")
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+STAGE_SECONDS = Histogram(
+    "digiform_stage_seconds", "Time spent in each processing stage", ["stage"], buckets=STAGE_BUCKETS
+)
+REQUEST_SECONDS = Histogram(
+    "digiform_request_seconds", "Request duration by endpoint", ["endpoint", "method", "status"],
+    buckets=STAGE_BUCKETS,
+)
+MODEL_TOKENS = Counter(
+    "digiform_model_tokens", "Tokens reported by the model API", ["document_type", "model", "kind"]
+)
+MODEL_COST = Counter(
+    "digiform_model_cost_usd", "Model API cost in US dollars, from cascade.PRICES", ["document_type", "model"]
+)
+# Documents answered by each model of the cascade (see cascade.py), from the
+# cache or a call, and whether the answer was kept or escalated
+CASCADE = Counter(
+    "digiform_cascade", "Documents answered per cascade model", ["document_type", "model", "source", "outcome"]
+)
+CASCADE_ISSUES = Counter(
+    "digiform_cascade_issues", "Quality issues that escalated an answer", ["document_type", "model", "issue"]
+)
+
+PREFILTER_REJECTIONS = Counter(
+    "digiform_prefilter_rejections", "Uploads rejected before the model call", ["document_type", "check"]
+)
+# Live sums across gunicorn workers in multiprocess mode, for autoscaling
+ADMISSION_IN_FLIGHT = Gauge(
+    "digiform_admission_in_flight", "Admitted expensive requests running", multiprocess_mode="livesum"
+)
+ADMISSION_WAITING = Gauge(
+    "digiform_admission_waiting", "Expensive requests waiting for admission", multiprocess_mode="livesum"
+)
+ADMISSION_SHED = Counter(
+    "digiform_admission_shed", "Requests refused with 503 because the app is overloaded", ["reason"]
+)
+JOB_QUEUE_DEPTH = Gauge(
+    "digiform_job_queue_depth", "Upload jobs waiting for a worker", multiprocess_mode="mostrecent"
+)
+# How cache misses were settled by single_flight.py: leader calls the model,
+# follower reuses its result, bypass and timeout call without coordination
+SINGLE_FLIGHT = Counter(
+    "digiform_single_flight", "Cache misses by single-flight outcome", ["outcome"]
+)
+
+# Exact cache misses looked up in perceptual_index.py: hit reuses a near
+# duplicate's answer, rejected had candidates that failed the signature check,
+# expired matched an image whose answer has left the cache
+PERCEPTUAL_LOOKUPS = Counter(
+    "digiform_perceptual_lookups", "Exact cache misses by perceptual index outcome", ["document_type", "outcome"]
+)
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class Trace:
+    def __init__(self, kind, **fields):
+        self.id = uuid.uuid4().hex[:16]
+        self.kind = kind
+        self.fields = fields
+        self.stages = {}
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+
+    def add(self, stage, seconds):
+        # Stages can run concurrently on extraction threads, so totals and counts are kept
+        with self.lock:
+            total, count = self.stages.get(stage, (0.0, 0))
+            self.stages[stage] = (total + seconds, count + 1)
+
+    def finish(self, **fields):
+        duration = time.perf_counter() - self.start
+        with self.lock:
+            stages = {
+                stage: {"ms": round(total * 1000, 1), "count": count}
+                for stage, (total, count) in self.stages.items()
+            }
+        record = {
+            "trace_id": self.id,
+            "kind": self.kind,
+            **self.fields,
+            **fields,
+            "duration_ms": round(duration * 1000, 1),
+            "stages": stages,
+        }
+        logger.log(logging.INFO if stages else logging.DEBUG, json.dumps(record))
+        return duration
+
+
+def observe(stage, seconds):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+@contextmanager
+def traced(kind, **fields):
+    # Traces the block; stages run inside it, including on threads started
+    # with contextvars.copy_context(), are attributed to it
+    trace = Trace(kind, **fields)
+    token = current_trace.set(trace)
+    status = "ok"
+    try:
+        yield trace
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        current_trace.reset(token)
+        trace.finish(status=status)
+
+
+def record_usage(document_type, model, usage, cost=None):
+    if usage is None:
+        return
+    MODEL_TOKENS.labels(document_type, model, "prompt").inc(usage.prompt_tokens or 0)
+    MODEL_TOKENS.labels(document_type, model, "completion").inc(usage.completion_tokens or 0)
+    if cost is not None:
+        MODEL_COST.labels(document_type, model).inc(cost)
+
+
+def record_cascade(document_type, model, source, issues):
+    CASCADE.labels(document_type, model, source, "escalated" if issues else "accepted").inc()
+    for issue in issues:
+        CASCADE_ISSUES.labels(document_type, model, issue).inc()
+
+
+def record_rejection(document_type, check):
+    PREFILTER_REJECTIONS.labels(document_type, check).inc()
+
+
+def record_shed(reason):
+    ADMISSION_SHED.labels(reason).inc()
+
+
+def record_single_flight(outcome):
+    SINGLE_FLIGHT.labels(outcome).inc()
+
+
+def record_perceptual(document_type, outcome):
+    PERCEPTUAL_LOOKUPS.labels(document_type, outcome).inc()
+
+
+def metrics_registry():
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def render_metrics():
+    # Returns (body, content type) for the /metrics endpoint
+    return generate_latest(metrics_registry()), CONTENT_TYPE_LATEST
+
+
+def serve_metrics(port):
+    # Serves /metrics on its own thread, for processes without the web app
+    start_http_server(port, registry=metrics_registry())
+
+
+def init_app(app):
+    # Traces every request and records its duration per endpoint
+    @app.before_request
+    def start_request_trace():
+        g.trace = Trace("request", method=request.method, path=request.path)
+        g.trace_token = current_trace.set(g.trace)
+
+    @app.after_request
+    def add_trace_header(response):
+        if "trace" in g:
+            response.headers["X-Trace-Id"] = g.trace.id
+            g.trace_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def finish_request_trace(error):
+        trace = g.pop("trace", None)
+        if trace is None:
+            return
+        current_trace.reset(g.pop("trace_token"))
+        status = 500 if error is not None else g.pop("trace_status", 500)
+        duration = trace.finish(status=status)
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_SECONDS.labels(endpoint, request.method, status).observe(duration)
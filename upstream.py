@@ -0,0 +1,314 @@
+"""Rate-limited, fault-tolerant access to the model API.
+
+Every web and job worker draws from one requests-per-minute and
+tokens-per-minute budget kept in Redis, so scaling out does not multiply the
+load on the upstream account. Usage is counted in short fixed windows (a
+sixth of a minute by default) to keep bursts at window edges small; tokens are
+charged from an estimate before the call and corrected from response.usage
+afterwards.
+
+Calls that fail with 429, 5xx, a timeout or a dropped connection are retried
+with full-jitter exponential backoff, honouring Retry-After when the server
+sends one. A circuit breaker stops calling upstream for a while after repeated
+failures, so an outage fails requests fast instead of tying up every worker
+for the full timeout and retry schedule.
+
+The openai package takes most of a second to import, so it is only imported
+when a call is made; by then the client passed in has loaded it anyway.
+"""
+import asyncio
+import logging
+import math
+import random
+import threading
+import time
+
+import redis
+
+from process_local import ProcessLocal
+
+logger = logging.getLogger(__name__)
+
+# Rough completion size reserved for an extraction before usage is known
+COMPLETION_TOKEN_ESTIMATE = 400
+
+# Tokens billed per high-detail image as (base, per 512px tile), by model name
+# prefix, longest first. gpt-4o-mini bills images at about 33 times gpt-4o's
+# rate, so charging it gpt-4o's cost would let the budget overshoot TPM.
+IMAGE_TOKEN_COSTS = [
+    ("gpt-4o-mini", (2833, 5667)),
+    ("gpt-4o", (85, 170)),
+]
+DEFAULT_IMAGE_TOKEN_COST = (85, 170)
+
+
+class BudgetExhausted(Exception):
+    pass
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+def image_token_cost(model):
+    # Up to four 512px tiles after downscaling to 768px
+    for prefix, (base, tile) in IMAGE_TOKEN_COSTS:
+        if model.startswith(prefix):
+            return base + tile * 4
+    base, tile = DEFAULT_IMAGE_TOKEN_COST
+    return base + tile * 4
+
+
+def estimate_tokens(request):
+    # Text at ~4 characters per token, images at the model's high-detail tile cost
+    tokens = COMPLETION_TOKEN_ESTIMATE
+    image_tokens = image_token_cost(request.get("model", ""))
+    for message in request["messages"]:
+        content = message["content"]
+        parts = content if isinstance(content, list) else [{"type": "text", "text": content}]
+        for part in parts:
+            if part["type"] == "text":
+                tokens += len(part["text"]) // 4 + 1
+            elif part["type"] == "image_url":
+                tokens += image_tokens
+    return tokens
+
+
+def retryable_errors():
+    import openai
+
+    return (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+    )
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0):
+    # Full jitter: spreads retries from many workers across the whole interval
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def retry_after(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class RedisRateBudget:
+    def __init__(self, redis_client, rpm, tpm, window=10, prefix="upstream:budget"):
+        self.redis = redis_client
+        self.window = window
+        self.prefix = prefix
+        # Per-window share of the per-minute limits; 0 disables that limit
+        self.max_requests = max(1, math.ceil(rpm * window / 60)) if rpm else 0
+        self.max_tokens = max(1, math.ceil(tpm * window / 60)) if tpm else 0
+
+    def _charge(self, key, requests, tokens):
+        pipe = self.redis.pipeline()
+        pipe.hincrby(key, "requests", requests)
+        pipe.hincrby(key, "tokens", tokens)
+        pipe.expire(key, self.window * 2)
+        used_requests, used_tokens, _ = pipe.execute()
+        return used_requests, used_tokens
+
+    def acquire(self, tokens, max_wait=60.0):
+        # Returns the window key charged, for reconcile(); waits for the next
+        # window while this one is spent
+        deadline = time.monotonic() + max_wait
+        while True:
+            now = time.time()
+            key = f"{self.prefix}:{int(now // self.window)}"
+            used_requests, used_tokens = self._charge(key, 1, tokens)
+            over_requests = self.max_requests and used_requests > self.max_requests
+            # A single call larger than the whole window is let through on an empty window
+            over_tokens = self.max_tokens and used_tokens > max(self.max_tokens, tokens)
+            if not (over_requests or over_tokens):
+                return key
+            self._charge(key, -1, -tokens)
+            wait = self.window - now % self.window + random.uniform(0, self.window / 10)
+            if time.monotonic() + wait > deadline:
+                raise BudgetExhausted("Extraction service is busy, please try again shortly")
+            time.sleep(wait)
+
+    def reconcile(self, key, estimated, actual):
+        if key and actual is not None and actual != estimated:
+            try:
+                self._charge(key, 0, actual - estimated)
+            except redis.RedisError:
+                pass
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self.lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return "open"
+            return "half-open"
+
+    def _refuse(self):
+        # Raises CircuitOpen while calls are refused; called with the lock held
+        if time.monotonic() - self.opened_at < self.reset_timeout or self.trial_running:
+            raise CircuitOpen("Extraction service is temporarily unavailable, please try again shortly")
+
+    def check(self):
+        # Fails fast while the breaker is open, without taking the trial
+        with self.lock:
+            if self.opened_at is not None:
+                self._refuse()
+
+    def before_call(self):
+        # After reset_timeout one trial call is let through; its outcome closes
+        # or re-opens the breaker. Returns True for the trial call, whose caller
+        # must release_trial() if it ends without recording an outcome.
+        with self.lock:
+            if self.opened_at is None:
+                return False
+            self._refuse()
+            self.trial_running = True
+            return True
+
+    def release_trial(self):
+        # Lets the next call try after a trial that ended without an outcome,
+        # e.g. an unexpected error or a cancelled task; a no-op once
+        # record_success() or record_failure() has run
+        with self.lock:
+            self.trial_running = False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self.trial_running:
+                    logger.warning("Circuit opened after %d consecutive upstream failures", self.failures)
+                self.opened_at = time.monotonic()
+                self.trial_running = False
+
+
+class UpstreamClient:
+    def __init__(self, client, budget=None, breaker=None, max_attempts=4, budget_wait=60.0):
+        # An OpenAI client, or a ProcessLocal building one in each process
+        self.client = client
+        self.budget = budget
+        self.breaker = breaker or CircuitBreaker()
+        self.max_attempts = max_attempts
+        self.budget_wait = budget_wait
+
+    @property
+    def client(self):
+        if isinstance(self._client, ProcessLocal):
+            return self._client.get()
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    def _reserve(self, estimated):
+        if self.budget is None:
+            return None
+        try:
+            return self.budget.acquire(estimated, self.budget_wait)
+        except redis.RedisError:
+            # Losing the shared budget should not take extraction down with it
+            logger.warning("Rate budget unavailable; calling upstream without it")
+            return None
+
+    def _retry_delay(self, error, attempt):
+        # Seconds to wait before retrying after a retryable error; re-raises it
+        # once the attempts are used up.
+        # A 429 means upstream is up but pushing back, which the budget and
+        # backoff deal with; only outages count towards the breaker. It says
+        # nothing about recovery either, so it leaves the breaker as it is
+        # (a trial call that got one is released for the next caller).
+        import openai
+
+        if not isinstance(error, openai.RateLimitError):
+            self.breaker.record_failure()
+        if attempt + 1 == self.max_attempts:
+            raise error
+        delay = min(retry_after(error) or backoff_delay(attempt), 60.0)
+        logger.info("Upstream %s, retrying in %.1fs", type(error).__name__, delay)
+        return delay
+
+    def create(self, **request):
+        import openai
+
+        estimated = estimate_tokens(request)
+        for attempt in range(self.max_attempts):
+            # The budget may refuse or wait; only then is the trial slot taken
+            self.breaker.check()
+            window = self._reserve(estimated)
+            trial = self.breaker.before_call()
+            try:
+                response = self.client.chat.completions.create(**request)
+            except retryable_errors() as e:
+                delay = self._retry_delay(e, attempt)
+            except openai.APIStatusError:
+                # Upstream answered; it is this request that was rejected
+                self.breaker.record_success()
+                raise
+            else:
+                self.breaker.record_success()
+                if self.budget is not None and response.usage is not None:
+                    self.budget.reconcile(window, estimated, response.usage.total_tokens)
+                return response
+            finally:
+                if trial:
+                    self.breaker.release_trial()
+            time.sleep(delay)
+
+
+class AsyncUpstreamClient(UpstreamClient):
+    """UpstreamClient for an openai.AsyncOpenAI client, awaited on an event loop.
+
+    The budget uses blocking Redis calls and may sleep until the next window,
+    so it is charged and reconciled on a thread instead of on the loop.
+    """
+
+    async def create(self, **request):
+        import openai
+
+        estimated = estimate_tokens(request)
+        for attempt in range(self.max_attempts):
+            self.breaker.check()
+            window = await asyncio.to_thread(self._reserve, estimated) if self.budget is not None else None
+            trial = self.breaker.before_call()
+            try:
+                response = await self.client.chat.completions.create(**request)
+            except retryable_errors() as e:
+                delay = self._retry_delay(e, attempt)
+            except openai.APIStatusError:
+                self.breaker.record_success()
+                raise
+            else:
+                self.breaker.record_success()
+                if self.budget is not None and response.usage is not None:
+                    await asyncio.to_thread(self.budget.reconcile, window, estimated, response.usage.total_tokens)
+                return response
+            finally:
+                if trial:
+                    self.breaker.release_trial()
+            await asyncio.sleep(delay)
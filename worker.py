@@ -0,0 +1,51 @@
+"""Background worker for queued /upload jobs (JOB_BACKEND=redis).
+
+    python worker.py --threads 4
+
+Run as many of these as needed, on any host that can reach Redis and the
+database; they share the queue and pick up jobs abandoned by a dead worker.
+Each serves its extraction, model-call and job metrics for Prometheus at
+http://<host>:WORKER_METRICS_PORT/metrics.
+"""
+import argparse
+import signal
+import threading
+
+import telemetry
+from app import app, job_queue, run_upload_job
+from jobs import RedisJobQueue, work
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process queued DigiForm upload jobs.")
+    parser.add_argument(
+        "--threads", type=int, default=app.config["JOB_WORKERS"],
+        help="jobs processed concurrently by this worker",
+    )
+    args = parser.parse_args()
+
+    if not isinstance(job_queue, RedisJobQueue):
+        parser.error("worker.py needs JOB_BACKEND=redis")
+    # The extraction pool is sized for this many concurrent jobs when first used
+    app.config["JOB_WORKERS"] = args.threads
+
+    if app.config["WORKER_METRICS_PORT"]:
+        telemetry.serve_metrics(app.config["WORKER_METRICS_PORT"])
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    threads = [
+        threading.Thread(target=work, args=(job_queue, run_upload_job, stop), name=f"job-worker-{n}")
+        for n in range(args.threads)
+    ]
+    for thread in threads:
+        thread.start()
+    print(f"Worker started with {args.threads} threads")
+    for thread in threads:
+        thread.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Write-behind buffering for high-volume inserts.
+
+Rows are acknowledged as soon as they are buffered and written in bulk by a
+background thread once batch_size rows are pending or flush_interval seconds
+have passed. Once max_pending rows are waiting, callers flush synchronously so
+database errors surface to the request instead of piling up in memory.
+
+A batch that fails with one of the `rejected` exceptions (the database
+refusing the data, e.g. a value too long for its column) is split in halves
+until the rows it refuses are found; those are logged and dropped, and the
+rest are written. Any other error, e.g. the database being unreachable, keeps
+the unwritten rows for the next attempt.
+
+Buffered rows only live in the process's memory. The buffer is flushed on
+interpreter exit, which covers a gunicorn worker's graceful shutdown, but a
+process that is killed (SIGKILL, the OOM killer, a crash) loses the rows it
+had not written yet: up to flush_interval seconds or max_pending rows of
+acknowledged writes.
+"""
+import atexit
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    def __init__(self, flush_rows, batch_size=100, flush_interval=1.0, max_pending=10000, rejected=()):
+        self.flush_rows = flush_rows
+        # Exceptions flush_rows raises for rows the database will never accept
+        self.rejected = tuple(rejected)
+        self.dropped = 0
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending = []
+        self.lock = threading.Lock()
+        # Serializes flushes so rows are written in the order they were added
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.pid = None
+        atexit.register(self.close)
+
+    def _ensure_thread(self):
+        # Started lazily and restarted after a fork, since threads do not survive it
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    self.pid = os.getpid()
+                    self.thread = threading.Thread(
+                        target=self._run, name="write-behind", daemon=True
+                    )
+                    self.thread.start()
+
+    def add(self, row):
+        self._ensure_thread()
+        with self.lock:
+            self.pending.append(row)
+            pending = len(self.pending)
+        if pending >= self.max_pending:
+            self.flush()
+        elif pending >= self.batch_size:
+            self.wakeup.set()
+
+    def snapshot(self):
+        # Rows accepted but not yet written, oldest first
+        with self.lock:
+            return list(self.pending)
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                rows, self.pending = self.pending, []
+            if not rows:
+                return 0
+            # Batches still to write, in order; a rejected batch is replaced by its halves
+            batches, written = [rows], 0
+            try:
+                while batches:
+                    batch = batches[0]
+                    try:
+                        self.flush_rows(batch)
+                        written += len(batch)
+                    except self.rejected as e:
+                        if len(batch) > 1:
+                            middle = len(batch) // 2
+                            batches[0:1] = [batch[:middle], batch[middle:]]
+                            continue
+                        self.dropped += 1
+                        logger.error("Dropped a row the database rejected: %r (%s)", batch[0], e)
+                    batches.pop(0)
+            except Exception:
+                with self.lock:
+                    self.pending[:0] = [row for batch in batches for row in batch]
+                raise
+            return written
+
+    def _run(self):
+        while not self.stopped.is_set():
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Write-behind flush failed; %d rows kept for retry", len(self.pending))
+
+    def close(self):
+        self.stopped.set()
+        self.wakeup.set()
+        self.flush()